@@ -1,14 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Response, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 from sqlmodel import Session
-from app import crud, schemas, models, auth, assignment_logic, gemini_client, runner, constants
-from app.database import get_session
+from app import crud, schemas, models, auth, assignment_logic, gemini_client, runner, constants, package_cache, artifact_store, conditional, search_index, near_duplicates, similarity, regrade, scoring, telemetry, reference, single_flight, rate_limit, payload_store, groups, archive, profiling, llm_usage, question_bank, workload_trace
+from app.database import get_session, engine
+from app.telemetry import span
 import asyncio
-from PIL import Image
+import hashlib
+import json
+import math
 import io
+import time
+
+logger = telemetry.get_logger("api")
 
 api_router = APIRouter()
 
+PACKAGE_FIELDS = ("id", "title", "prompt", "difficulty", "testcases")
+ASSIGNMENT_FIELDS = ("id", "name", "created_at", "results_released")
+
+def _parse_fields(fields: Optional[str], allowed: tuple) -> Optional[List[str]]:
+    """Parses a `fields=a,b,c` query parameter; None means the full default representation."""
+    if not fields: return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}.")
+    return selected
+
+def _pick(obj, selected: List[str]) -> dict:
+    picked = {}
+    for field in selected:
+        value = getattr(obj, field)
+        if field == "testcases":
+            value = [tc.model_dump(exclude={"package_id"}) for tc in value]
+        picked[field] = value
+    return picked
+
 # --- Teacher Endpoints ---
 @api_router.post("/teacher/login", response_model=schemas.Token, tags=["Teacher"])
 def login_for_access_token(form_data: schemas.TeacherLogin, db: Session = Depends(get_session)):
@@ -18,49 +48,77 @@ def login_for_access_token(form_data: schemas.TeacherLogin, db: Session = Depend
     access_token = auth.create_access_token(data={"sub": teacher.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@api_router.post("/teacher/generate_questions", response_model=List[models.Package], tags=["Teacher"])
-async def generate_questions_simple(request: schemas.GenerateQuestionsRequest, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
-    print(f"INFO: Generating {request.n_questions} questions from topic: {request.topic}")
-    packages_data = await gemini_client.generate_questions(topic=request.topic, difficulty=request.difficulty, n_questions=request.n_questions, source_material=None)
+async def _store_generated(packages_data: List[dict], db: Session, endpoint: str) -> List[models.Package]:
+    """Checks each package against its reference solution, then stores the ones that pass."""
+    with span(endpoint, "validate"):
+        calibrations = await asyncio.gather(*[reference.calibrate_package(pkg_data) for pkg_data in packages_data])
     created_packages = []
-    for pkg_data in packages_data:
-        new_pkg = crud.create_package_with_testcases(db=db, package_data=pkg_data)
-        if new_pkg:
-            created_packages.append(new_pkg)
+    with span(endpoint, "store"):
+        for pkg_data, (time_limits, error) in zip(packages_data, calibrations):
+            if error:
+                logger.warning("Package rejected", extra={"endpoint": endpoint, "title": pkg_data.get("title"), "reason": error})
+                continue
+            new_pkg = crud.create_package_with_testcases(db=db, package_data=pkg_data, time_limits=time_limits)
+            if new_pkg:
+                created_packages.append(new_pkg)
+        # Each package's commit expired the ones stored before it; reload them for the response
+        for package in created_packages:
+            db.refresh(package)
     return created_packages
 
+@api_router.post("/teacher/packages", response_model=schemas.PackageSummary, status_code=status.HTTP_201_CREATED, tags=["Teacher"])
+async def create_package(package: schemas.PackageCreate, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """
+    Stores a teacher-written package. Unlike generated ones it may have testcase groups
+    (weighted subtasks of up to MAX_GROUP_TESTCASES cases each, generated or listed).
+    """
+    endpoint = "create_package"
+    pkg_data = package.model_dump(exclude_none=True)
+    with span(endpoint, "groups"):
+        error = await reference.prepare_groups(pkg_data)
+    if error:
+        raise HTTPException(status_code=400, detail=f"Package rejected: {error}.")
+    created = await _store_generated([pkg_data], db, endpoint)
+    if not created:
+        raise HTTPException(status_code=400, detail="Package rejected; check testcase counts, points (which must sum to 100) and the reference solution.")
+    return created[0]
+
+@api_router.post("/teacher/generate_questions", response_model=List[models.Package], tags=["Teacher"])
+async def generate_questions_simple(request: schemas.GenerateQuestionsRequest, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    endpoint = "generate_questions"
+    logger.info("Generating questions", extra={"endpoint": endpoint, "n_questions": request.n_questions, "topic": request.topic})
+    with span(endpoint, "llm"):
+        packages_data = await gemini_client.generate_questions(topic=request.topic, difficulty=request.difficulty, n_questions=request.n_questions, source_material=None, teacher_id=current_teacher.id)
+    return await _store_generated(packages_data, db, endpoint)
+
 @api_router.post("/teacher/generate_from_file", response_model=List[models.Package], tags=["Teacher"])
 async def generate_from_file(file: UploadFile = File(...), n_questions: int = Form(5), difficulty: str = Form("medium"), db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
-    print(f"INFO: Generating {n_questions} questions from file: {file.filename}")
-    content = await file.read(); mime_type = file.content_type
+    endpoint = "generate_from_file"
+    logger.info("Generating questions", extra={"endpoint": endpoint, "n_questions": n_questions, "filename": file.filename})
+    with span(endpoint, "read_upload"):
+        content = await file.read(); mime_type = file.content_type
     if mime_type == "application/pdf":
         source_material = {"mime_type": mime_type, "data": content}
     elif mime_type.startswith("image/"):
         try:
+            from PIL import Image # Imported on first upload; keeps it out of worker boot
             source_material = Image.open(io.BytesIO(content))
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Could not open image file: {e}")
     else:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
     topic = f"content from file: {file.filename}"
-    packages_data = await gemini_client.generate_questions(topic=topic, difficulty=difficulty, n_questions=n_questions, source_material=source_material)
-    created_packages = []
-    for pkg_data in packages_data:
-        new_pkg = crud.create_package_with_testcases(db=db, package_data=pkg_data)
-        if new_pkg:
-            created_packages.append(new_pkg)
-    return created_packages
+    with span(endpoint, "llm"):
+        packages_data = await gemini_client.generate_questions(topic=topic, difficulty=difficulty, n_questions=n_questions, source_material=source_material, teacher_id=current_teacher.id)
+    return await _store_generated(packages_data, db, endpoint)
 
 @api_router.post("/teacher/generate_from_text", response_model=List[models.Package], tags=["Teacher"])
 async def generate_from_text(request: schemas.GenerateFromTextRequest, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
-    print(f"INFO: Generating {request.n_questions} questions from text snippet...")
-    packages_data = await gemini_client.generate_questions(topic=request.text, difficulty=request.difficulty, n_questions=request.n_questions, source_material=None)
-    created_packages = []
-    for pkg_data in packages_data:
-        new_pkg = crud.create_package_with_testcases(db=db, package_data=pkg_data)
-        if new_pkg:
-            created_packages.append(new_pkg)
-    return created_packages
+    endpoint = "generate_from_text"
+    logger.info("Generating questions", extra={"endpoint": endpoint, "n_questions": request.n_questions, "text_chars": len(request.text)})
+    with span(endpoint, "llm"):
+        packages_data = await gemini_client.generate_questions(topic=request.text, difficulty=request.difficulty, n_questions=request.n_questions, source_material=None, teacher_id=current_teacher.id)
+    return await _store_generated(packages_data, db, endpoint)
 
 @api_router.post("/teacher/create_assignment", response_model=models.Assignment, tags=["Teacher"])
 def create_assignment(assignment_data: schemas.AssignmentCreate, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
@@ -71,13 +129,87 @@ def create_assignment(assignment_data: schemas.AssignmentCreate, db: Session = D
     if not students:
         raise HTTPException(status_code=400, detail="No students found to assign.")
     try:
-        student_assignments = assignment_logic.assign_packages_to_students(students=students, packages=packages)
+        clusters = near_duplicates.clusters_for(db, [p.id for p in packages])
+        seat_layout = (assignment_data.seat_rows, assignment_data.seat_cols) if assignment_data.seat_rows and assignment_data.seat_cols else None
+        student_assignments = assignment_logic.assign_packages_to_students(
+            students=students, packages=packages, clusters=clusters, d=assignment_data.adjacency_distance,
+            seat_layout=seat_layout, neighbourhood=assignment_data.neighbourhood, seed=assignment_data.seed
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    d = constants.D_ADJACENCY if assignment_data.adjacency_distance is None else assignment_data.adjacency_distance
+    return crud.create_assignment_with_mappings(db=db, name=assignment_data.assignment_name, student_assignments_data=student_assignments,
+                                                adjacency_distance=d, seat_layout=seat_layout, neighbourhood=assignment_data.neighbourhood)
+
+@api_router.post("/teacher/assignments/{assignment_id}/update", response_model=schemas.AssignmentUpdateResult, tags=["Teacher"])
+def update_assignment(assignment_id: int, update: schemas.AssignmentUpdate, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """
+    Places students who joined after the assignment was created and moves students off
+    withdrawn packages, keeping every other row as it is. Students who already submitted
+    never move. Placement follows the distance, seat layout and neighbourhood the assignment
+    was created with; students are seated row-major by roll, as they were then.
+    """
+    if not db.get(models.Assignment, assignment_id):
+        raise HTTPException(status_code=404, detail="Assignment not found.")
+    if archive.is_archived(db, assignment_id):
+        raise HTTPException(status_code=409, detail="Assignment is archived.")
+    if update.add_package_ids and len(crud.get_packages_by_ids(db, update.add_package_ids)) != len(set(update.add_package_ids)):
+        raise HTTPException(status_code=404, detail="One or more package IDs not found.")
+    rules = crud.get_assignment_rules(db, assignment_id)
+    if rules is not None:
+        d = rules.adjacency_distance if update.adjacency_distance is None else update.adjacency_distance
+        seat_layout = (rules.seat_rows, rules.seat_cols) if rules.seat_rows and rules.seat_cols else None
+        neighbourhood = rules.neighbourhood
+    else: # Created before the rules were stored: roll order
+        d = constants.D_ADJACENCY if update.adjacency_distance is None else update.adjacency_distance
+        seat_layout, neighbourhood = None, 4
+    usage = crud.get_assignment_package_usage(db, assignment_id)
+    removed = set(update.remove_package_ids)
+    package_ids = sorted((set(usage) | set(update.add_package_ids)) - removed)
+    if not package_ids:
+        raise HTTPException(status_code=400, detail="The assignment would have no packages left.")
+    clusters = near_duplicates.clusters_for(db, package_ids)
+
+    new_students = crud.get_unassigned_students(db, assignment_id, rules.placed_through if rules is not None else None)
+    on_removed = crud.get_student_assignments_on_packages(db, assignment_id, list(removed)) if removed else []
+    movable = [(sa, roll) for sa, roll, submitted in on_removed if not submitted]
+    pinned_rolls = [roll for sa, roll, submitted in on_removed if submitted]
+
+    # Neighbourhoods of just the students being placed; everyone else stays fixed.
+    to_place = sorted([(s.roll, s.id) for s in new_students] + [(roll, sa.student_id) for sa, roll in movable])
+    current, neighbours = {}, {}
+    for roll, student_id in to_place:
+        seat = crud.count_students_before(db, roll) if seat_layout else 0
+        if seat_layout and seat >= seat_layout[0] * seat_layout[1]:
+            raise HTTPException(status_code=400, detail=f"Seat layout {seat_layout[0]}x{seat_layout[1]} has no seat for roll {roll}.")
+        before, after = crud.get_roll_neighbours(db, assignment_id, roll, assignment_logic.roll_window(d, seat_layout))
+        near = [(seat - k, row) for k, row in enumerate(before, 1)] + [(seat + k, row) for k, row in enumerate(after, 1)]
+        near = [row for other, row in near if assignment_logic.seat_distance(seat, other, seat_layout, neighbourhood) <= d]
+        neighbours[student_id] = [n_id for n_id, _ in near]
+        for n_id, package_id in near:
+            current.setdefault(n_id, package_id)
+    for _, student_id in to_place:
+        current[student_id] = None
+    usage = {package_id: usage.get(package_id, 0) for package_id in package_ids}
+    try:
+        placements = assignment_logic.place_incrementally([sid for _, sid in to_place], neighbours, current, package_ids, usage, clusters)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return crud.create_assignment_with_mappings(db=db, name=assignment_data.assignment_name, student_assignments_data=student_assignments)
+
+    new_rows = [{"student_id": s.id, "package_id": placements[s.id]} for s in new_students]
+    moves = {sa.id: placements[sa.student_id] for sa, _ in movable}
+    for sa, _, submitted in on_removed:
+        if submitted: # Pinned students stay counted on their package
+            usage[sa.package_id] = usage.get(sa.package_id, 0) + 1
+    crud.apply_assignment_changes(db, assignment_id, new_rows, moves, usage, placed_through=max((s.id for s in new_students), default=None))
+    return schemas.AssignmentUpdateResult(
+        placed_rolls=[s.roll for s in new_students], moved_rolls=[roll for _, roll in movable], pinned_rolls=pinned_rolls
+    )
 
 @api_router.get("/teacher/results/{assignment_id}", response_model=List[schemas.SubmissionResult], tags=["Teacher"])
-def get_assignment_results(assignment_id: int, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+def get_assignment_results(assignment_id: int, request: Request, response: Response, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    not_modified = conditional.check(request, response, db, [f"assignment:{assignment_id}"])
+    if not_modified: return not_modified
     submissions = crud.get_submissions_for_assignment(db, assignment_id)
     results = []
     for sub in submissions:
@@ -85,6 +217,30 @@ def get_assignment_results(assignment_id: int, db: Session = Depends(get_session
         results.append(result_with_roll)
     return results
 
+@api_router.get("/teacher/submission/{submission_id}", response_model=schemas.SubmissionResult, tags=["Teacher"])
+def get_submission_detail(submission_id: int, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Single submission with full stdout/stderr loaded back from the artifact store."""
+    sub = crud.get_submission(db, submission_id)
+    if not sub:
+        raise HTTPException(status_code=404, detail="Submission not found.")
+    data = sub.model_dump()
+    data["test_results"] = artifact_store.hydrate_test_results(db, sub.test_results)
+    return schemas.SubmissionResult(**data, roll=sub.student_assignment.student.roll)
+
+@api_router.get("/teacher/submission/{submission_id}/profile", response_model=schemas.SubmissionProfile, tags=["Teacher"])
+def get_submission_profile(submission_id: int, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Hot-spot profile of a submission on its heaviest hidden testcase (PROFILE_SUBMISSIONS)."""
+    sub = crud.get_submission(db, submission_id)
+    profile = sub and profiling.get_profile(db, sub)
+    if not profile:
+        raise HTTPException(status_code=404, detail="No profile for this submission.")
+    return profile
+
+@api_router.get("/teacher/similarity/{assignment_id}", response_model=List[schemas.SimilarPair], tags=["Teacher"])
+def get_similarity_report(assignment_id: int, limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Most similar submission pairs for an assignment, highest score first."""
+    return similarity.report(db, assignment_id, limit)
+
 @api_router.post("/teacher/assignments/{assignment_id}/release", status_code=status.HTTP_204_NO_CONTENT, tags=["Teacher"])
 def release_assignment_results(
     assignment_id: int,
@@ -96,6 +252,119 @@ def release_assignment_results(
         raise HTTPException(status_code=404, detail="Assignment not found")
     return None
 
+@api_router.post("/teacher/assignments/{assignment_id}/archive", response_model=schemas.ArchiveStatus, tags=["Teacher"])
+def archive_assignment(assignment_id: int, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """
+    Moves a released assignment's student rows and submissions out of the database into a
+    compressed archive file. Results stay readable through the usual endpoints.
+    """
+    try:
+        record = archive.archive_assignment(db, assignment_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not record:
+        raise HTTPException(status_code=404, detail="Assignment not found.")
+    return record
+
+@api_router.patch("/teacher/testcases/{testcase_id}", response_model=schemas.TestCase, tags=["Teacher"])
+def edit_testcase(testcase_id: int, changes: schemas.TestCaseUpdate, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    testcase = crud.update_testcase(db, testcase_id, changes.model_dump(exclude_none=True))
+    if not testcase:
+        raise HTTPException(status_code=404, detail="Test case not found.")
+    return testcase
+
+@api_router.post("/teacher/packages/{package_id}/testcases", response_model=schemas.TestCase, tags=["Teacher"])
+def add_testcase(package_id: int, tc_data: schemas.TestCaseCreate, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    testcase = crud.add_testcase(db, package_id, tc_data.model_dump())
+    if not testcase:
+        raise HTTPException(status_code=404, detail="Package not found.")
+    return testcase
+
+@api_router.post("/teacher/packages/{package_id}/testcases/upload", response_model=schemas.TestCase, tags=["Teacher"])
+def upload_testcase(
+    package_id: int,
+    points: int = Form(..., ge=0),
+    testcase_type: str = Form("hidden", alias="type", pattern="^(sample|hidden)$"),
+    input_text: str = Form("", alias="input"),
+    expected_text: str = Form("", alias="expected"),
+    input_file: Optional[UploadFile] = File(None),
+    expected_file: Optional[UploadFile] = File(None),
+    generator: Optional[str] = Form(None),
+    db: Session = Depends(get_session),
+    current_teacher: models.Teacher = Depends(auth.get_current_teacher)
+):
+    """
+    Adds a testcase too large for the JSON endpoint. The input is an uploaded file or the
+    output of `generator`, a deterministic Python script run in the sandbox; the expected
+    output may be a file too. Files are streamed into payload_store and the row keeps a preview.
+    """
+    if input_file and generator:
+        raise HTTPException(status_code=400, detail="Give either an input file or a generator, not both.")
+    if not (input_file or expected_file or generator):
+        raise HTTPException(status_code=400, detail="No file or generator given; use POST /teacher/packages/{package_id}/testcases.")
+    tc_data = {"type": testcase_type, "points": points, "input": input_text, "expected": expected_text}
+    payload_data = {}
+    for field, upload in (("input", input_file), ("expected", expected_file)):
+        if upload is None: continue
+        digest, size = payload_store.put_stream(upload.file)
+        if digest is None:
+            raise HTTPException(status_code=413, detail=f"The {field} file is larger than {constants.PAYLOAD_MAX_BYTES} bytes.")
+        payload_data[f"{field}_digest"], payload_data[f"{field}_size"] = digest, size
+        tc_data[field] = payload_store.preview(payload_store.path(digest), constants.PAYLOAD_PREVIEW_CHARS)
+    if generator:
+        # Running it now reports a broken generator to the teacher and caches its output
+        generated_path, error = runner.generate_input(generator)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        payload_data["generator"] = generator
+        tc_data["input"] = payload_store.preview(generated_path, constants.PAYLOAD_PREVIEW_CHARS)
+    testcase = crud.add_testcase_with_payload(db, package_id, tc_data, payload_data)
+    if not testcase:
+        raise HTTPException(status_code=404, detail="Package not found.")
+    return schemas.TestCase(**testcase.model_dump(exclude={"package_id"}), input_digest=payload_data.get("input_digest"),
+                            generator=payload_data.get("generator"), expected_digest=payload_data.get("expected_digest"))
+
+@api_router.post("/teacher/assignments/{assignment_id}/regrade", response_model=schemas.RegradeJobStatus, status_code=status.HTTP_202_ACCEPTED, tags=["Teacher"])
+async def start_regrade(assignment_id: int, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Rescores every submission against the current testcases in the background."""
+    if not db.get(models.Assignment, assignment_id):
+        raise HTTPException(status_code=404, detail="Assignment not found.")
+    if archive.is_archived(db, assignment_id):
+        raise HTTPException(status_code=409, detail="Assignment is archived.")
+    job = regrade.create_job(db, assignment_id)
+    regrade.start(job.id)
+    return job
+
+@api_router.get("/teacher/regrade/{job_id}", response_model=schemas.RegradeJobStatus, tags=["Teacher"])
+def get_regrade_status(job_id: int, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    job = db.get(models.RegradeJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Regrade job not found.")
+    return job
+
+@api_router.post("/teacher/assignments/{assignment_id}/scoring/simulate", tags=["Teacher"])
+def simulate_scoring(assignment_id: int, grid: schemas.ScoringGrid, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Score distributions and per-student deltas for every combination of the given weights."""
+    if not db.get(models.Assignment, assignment_id):
+        raise HTTPException(status_code=404, detail="Assignment not found.")
+    try:
+        return scoring.simulate(scoring.load_columns(db, assignment_id), grid)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/teacher/assignments/{assignment_id}/scoring", response_model=schemas.ScoringWeights, tags=["Teacher"])
+def get_scoring_weights(assignment_id: int, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    return scoring.weights_for(db, assignment_id)
+
+@api_router.put("/teacher/assignments/{assignment_id}/scoring", tags=["Teacher"])
+def commit_scoring_weights(assignment_id: int, weights: schemas.ScoringWeights, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Saves the weights for this assignment and rescores its submissions with them."""
+    if not db.get(models.Assignment, assignment_id):
+        raise HTTPException(status_code=404, detail="Assignment not found.")
+    if archive.is_archived(db, assignment_id):
+        raise HTTPException(status_code=409, detail="Assignment is archived.")
+    return {"updated": scoring.commit(db, assignment_id, weights)}
+
 @api_router.get("/teacher/codes", response_model=schemas.TeacherCodeResponse, tags=["Teacher"])
 def get_teacher_codes(db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
     if constants.APP_MODE == 'development':
@@ -104,19 +373,67 @@ def get_teacher_codes(db: Session = Depends(get_session), current_teacher: model
                 codes_list = [line.strip() for line in f.readlines()]
                 return schemas.TeacherCodeResponse(codes=codes_list, mode="plaintext")
         except FileNotFoundError:
-             print("WARN: seed_codes.txt not found. Falling back to DB.")
+             logger.warning("seed_codes.txt not found. Falling back to DB.")
     
     codes = crud.get_all_student_codes(db)
     formatted_codes = [f"Roll: {c.student.roll} | User: {c.student.username} | Used: {c.is_used}" for c in codes if c.student]
     return schemas.TeacherCodeResponse(codes=formatted_codes, mode="production")
 
 @api_router.get("/teacher/packages", response_model=List[models.Package], tags=["Teacher"])
-def list_packages(db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
-    return crud.get_all_packages(db)
+def list_packages(request: Request, response: Response, fields: Optional[str] = None, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    selected = _parse_fields(fields, PACKAGE_FIELDS)
+    not_modified = conditional.check(request, response, db, ["packages"], scope=",".join(selected or []))
+    if not_modified: return not_modified
+    if selected is None:
+        return crud.get_all_packages(db, with_testcases=False) # Relationships aren't part of the default model output
+    packages = crud.get_all_packages(db, with_testcases="testcases" in selected)
+    return ORJSONResponse([_pick(p, selected) for p in packages], headers=dict(response.headers))
+
+@api_router.get("/teacher/packages/search", response_model=schemas.PackagePage, tags=["Teacher"])
+def search_packages(q: Optional[str] = None, difficulty: Optional[str] = None, limit: int = Query(20, ge=1, le=100), after: Optional[int] = None, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Full-text search over title, prompt and difficulty, newest first, keyset-paginated by `after`."""
+    packages, next_cursor = search_index.search(db, q=q, difficulty=difficulty, limit=limit, after_id=after)
+    return schemas.PackagePage(items=packages, next_cursor=next_cursor)
+
+@api_router.get("/teacher/packages/export", tags=["Teacher"])
+def export_packages(payloads: bool = True, current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Every package with its testcases, groups and reference solution, streamed as gzipped NDJSON."""
+    filename = f"question-bank-{datetime.utcnow():%Y%m%d}.ndjson.gz"
+    return StreamingResponse(question_bank.export_bank(include_payloads=payloads), media_type="application/gzip",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@api_router.post("/teacher/packages/import", response_model=schemas.QuestionBankImport, tags=["Teacher"])
+def import_packages(file: UploadFile = File(...), db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Stores the packages of an export that this deployment doesn't have yet; importing a file twice is a no-op."""
+    try:
+        counts = question_bank.import_bank(db, file.file)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid question bank file: {exc}")
+    return schemas.QuestionBankImport(**counts)
+
+@api_router.get("/teacher/packages/duplicates", response_model=List[schemas.NearDuplicate], tags=["Teacher"])
+def list_near_duplicates(db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    return near_duplicates.flagged(db)
 
 @api_router.get("/teacher/assignments", response_model=List[models.Assignment], tags=["Teacher"])
-def list_assignments(db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
-    return crud.get_all_assignments(db)
+def list_assignments(request: Request, response: Response, fields: Optional[str] = None, db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    selected = _parse_fields(fields, ASSIGNMENT_FIELDS)
+    not_modified = conditional.check(request, response, db, ["assignments"], scope=",".join(selected or []))
+    if not_modified: return not_modified
+    assignments = crud.get_all_assignments(db)
+    if selected is None:
+        return assignments
+    return ORJSONResponse([_pick(a, selected) for a in assignments], headers=dict(response.headers))
+
+@api_router.get("/teacher/llm_usage", response_model=schemas.LlmUsageSummary, tags=["Teacher"])
+def get_llm_usage(assignment_id: Optional[int] = None, teacher_id: Optional[int] = None, since: Optional[datetime] = None,
+                  db: Session = Depends(get_session), current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    """Gemini calls and tokens, by model, purpose and outcome, and per assignment and teacher against their budgets."""
+    return llm_usage.summary(db, assignment_id=assignment_id, teacher_id=teacher_id, since=since)
+
+@api_router.get("/teacher/package_cache", tags=["Teacher"])
+def get_package_cache_stats(current_teacher: models.Teacher = Depends(auth.get_current_teacher)):
+    return package_cache.stats()
 
 # --- Student & Public Endpoints ---
 @api_router.post("/student/login", response_model=schemas.Token, tags=["Student"])
@@ -131,7 +448,7 @@ def login_student(form_data: schemas.StudentLogin, db: Session = Depends(get_ses
 # The dependency is changed from auth.oauth2_scheme (the teacher's)
 # to auth.student_oauth2_scheme (the new one we just added).
 @api_router.get("/student/assignments", response_model=List[schemas.StudentAssignmentDetails], tags=["Student"])
-def get_student_dashboard(db: Session = Depends(get_session), token: str = Depends(auth.student_oauth2_scheme)):
+def get_student_dashboard(request: Request, response: Response, db: Session = Depends(get_session), token: str = Depends(auth.student_oauth2_scheme)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
     try:
         payload = auth.jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
@@ -144,110 +461,279 @@ def get_student_dashboard(db: Session = Depends(get_session), token: str = Depen
     student = crud.get_student_by_roll(db, roll=student_roll)
     if student is None: raise credentials_exception
     
+    not_modified = conditional.check(request, response, db, ["assignments", f"student:{student.id}"])
+    if not_modified: return not_modified
     assignments = crud.get_assignments_for_student(db, student_id=student.id)
     return assignments
 # --- END FIX ---
 
 @api_router.get("/student/assignment/{assignment_id}/{roll}", response_model=schemas.StudentAssignmentPublic, tags=["Student"])
 def get_student_assignment(assignment_id: int, roll: int, db: Session = Depends(get_session)):
-    student_assignment = crud.get_student_assignment(db, assignment_id=assignment_id, student_roll=roll)
-    if not student_assignment:
-        raise HTTPException(status_code=404, detail="Assignment not found for this student.")
+    student_assignment = crud.get_student_assignment(db, assignment_id=assignment_id, student_roll=roll, load_package=False)
+    if student_assignment:
+        package_id, assignment, has_submitted = student_assignment.package_id, student_assignment.assignment, student_assignment.submission is not None
+    else:
+        student = crud.get_student_by_roll(db, roll)
+        archived = student and archive.entry(db, assignment_id, student.id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Assignment not found for this student.")
+        package_id, assignment, has_submitted = archived.package_id, db.get(models.Assignment, assignment_id), archived.submission_id is not None
+    package = package_cache.get_package(db, package_id)
+    if not package:
+        raise HTTPException(status_code=404, detail="Package not found.")
     
-    sample_testcases = [tc for tc in student_assignment.package.testcases if tc.type == 'sample']
+    sample_testcases = [tc for tc in package.testcases if tc.type == 'sample']
     
     return schemas.StudentAssignmentPublic(
-        assignment_name=student_assignment.assignment.name,
-        package_prompt=student_assignment.package.prompt,
-        package_title=student_assignment.package.title,
+        assignment_name=assignment.name,
+        package_prompt=package.prompt,
+        package_title=package.title,
         sample_testcases=sample_testcases,
-        has_submitted=(student_assignment.submission is not None),
-        results_released=student_assignment.assignment.results_released
+        has_submitted=has_submitted,
+        results_released=assignment.results_released
     )
 
-@api_router.post("/run", response_model=schemas.RunCodeResponse, tags=["Student"])
-async def run_code(run_data: schemas.RunCodeRequest, db: Session = Depends(get_session)):
-    student_assignment = crud.get_student_assignment(db, assignment_id=run_data.assignment_id, student_roll=run_data.roll)
+@api_router.get("/student/assignment/{assignment_id}/{roll}/profile", response_model=schemas.SubmissionProfile, tags=["Student"])
+def get_student_profile(assignment_id: int, roll: int, db: Session = Depends(get_session)):
+    """The profile of the student's submission, once results are released."""
+    student_assignment = crud.get_student_assignment(db, assignment_id=assignment_id, student_roll=roll, load_package=False)
     if not student_assignment:
         raise HTTPException(status_code=404, detail="Assignment not found.")
-    
-    if student_assignment.assignment.results_released:
-         raise HTTPException(status_code=403, detail="Cannot run code after results are released.")
-    
-    sample_testcases = [tc for tc in student_assignment.package.testcases if tc.type == 'sample']
+    if not student_assignment.assignment.results_released:
+        raise HTTPException(status_code=403, detail="Results have not been released yet.")
+    profile = student_assignment.submission and profiling.get_profile(db, student_assignment.submission)
+    if not profile:
+        raise HTTPException(status_code=404, detail="No profile for this submission.")
+    return profile
+
+async def _check_rate(endpoint: str, roll: int, per_minute: float, burst: int) -> None:
+    wait = await asyncio.to_thread(rate_limit.retry_after, f"{endpoint}:{roll}", per_minute, burst)
+    if wait:
+        telemetry.REQUESTS_RATE_LIMITED.inc(endpoint)
+        raise HTTPException(status_code=429, detail=f"Too many requests. Try again in {math.ceil(wait)} s.", headers={"Retry-After": str(math.ceil(wait))})
+
+def _load_package(db: Session, assignment_id: int, roll: int, endpoint: str, released_detail: str):
+    """Looks up the student's assignment and its package, raising the HTTP error the request should get."""
+    with span(endpoint, "lookup"):
+        student_assignment = crud.get_student_assignment(db, assignment_id=assignment_id, student_roll=roll, load_package=False)
+        if not student_assignment:
+            raise HTTPException(status_code=404, detail="Assignment not found.")
+        
+        if student_assignment.assignment.results_released:
+            raise HTTPException(status_code=403, detail=released_detail)
+        
+        package = package_cache.get_package(db, student_assignment.package_id)
+    if not package:
+        raise HTTPException(status_code=404, detail="Package not found.")
+    return student_assignment, package
+
+async def _run_testcases(code: str, testcases: list, endpoint: str):
+    """
+    Starts every testcase on the sandbox pool at once and yields (index, testcase, run_result,
+    passed) in the order they finish. Runs still pending when the consumer stops are cancelled.
+    """
+    async def run_one(index: int, testcase):
+        with span(endpoint, "sandbox"):
+            run_result = await runner.run_testcase(code, testcase)
+        return index, testcase, run_result, runner.judge(run_result, testcase.expected)
+
+    tasks = [asyncio.ensure_future(run_one(i, tc)) for i, tc in enumerate(testcases)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks: task.cancel()
+
+async def _last(events):
+    """Drains an event stream and returns the payload of its final event."""
+    payload = None
+    async for _, payload in events:
+        pass
+    return payload
+
+def _sse(event: str, payload) -> str:
+    data = payload.model_dump_json() if isinstance(payload, BaseModel) else json.dumps(payload)
+    return f"event: {event}\ndata: {data}\n\n"
+
+def _event_stream(events, endpoint: str) -> StreamingResponse:
+    """
+    Sends (event, payload) pairs as server-sent events. Errors after the response has started
+    can no longer change its status, so they arrive as a final `error` event instead.
+    """
+    async def body():
+        try:
+            async for event, payload in events:
+                yield _sse(event, payload)
+        except HTTPException as exc:
+            yield _sse("error", {"status": exc.status_code, "detail": exc.detail})
+        except Exception:
+            logger.exception("Event stream failed", extra={"endpoint": endpoint})
+            yield _sse("error", {"status": 500, "detail": "Internal server error."})
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _run_key(run_data: schemas.RunCodeRequest) -> str:
+    return f"run:{run_data.roll}:{run_data.assignment_id}:{hashlib.sha256(run_data.code.encode('utf-8')).hexdigest()[:32]}"
+
+@api_router.post("/run", response_model=schemas.RunCodeResponse, tags=["Student"])
+async def run_code(run_data: schemas.RunCodeRequest, db: Session = Depends(get_session)):
+    """
+    Runs the code on the sample testcases. Rate limited per roll; identical runs (same roll,
+    assignment and code) that are already in flight, streamed or not, share that run's result,
+    and only the run that actually executes is charged to the limit.
+    """
+    return await single_flight.run(_run_key(run_data), lambda: _execute_run(run_data, db), schemas.RunCodeResponse, ttl=constants.RUN_FLIGHT_TTL_SECONDS, label="run")
+
+@api_router.post("/run/stream", tags=["Student"])
+async def run_code_stream(run_data: schemas.RunCodeRequest, db: Session = Depends(get_session)):
+    """
+    /run as server-sent events: a `testcase` event (a RunCodeResult with its index) as each
+    sample finishes, then a `result` event with the full RunCodeResponse. Coalesced and
+    charged like /run; a caller joining a run in flight gets its events from the start.
+    Being over the rate limit arrives as an `error` event with status 429.
+    """
+    _, package = _load_package(db, run_data.assignment_id, run_data.roll, "run_stream", "Cannot run code after results are released.")
+
+    async def events():
+        await _check_rate("run", run_data.roll, constants.RUN_RATE_PER_MINUTE, constants.RUN_BURST)
+        async for item in _run_events(run_data.code, package, "run_stream"):
+            yield item
+    return _event_stream(single_flight.stream(_run_key(run_data), events, schemas.RunCodeResponse, ttl=constants.RUN_FLIGHT_TTL_SECONDS,
+                                              label="run", replay=_replay_run), "run_stream")
+
+def _replay_run(response: schemas.RunCodeResponse):
+    """The events of a run that executed elsewhere, rebuilt from its response."""
+    return [("testcase", result) for result in response.results] + [("result", response)]
+
+async def _execute_run(run_data: schemas.RunCodeRequest, db: Session) -> schemas.RunCodeResponse:
+    # Called only by the single-flight leader, so a coalesced double-click costs one token
+    await _check_rate("run", run_data.roll, constants.RUN_RATE_PER_MINUTE, constants.RUN_BURST)
+    _, package = _load_package(db, run_data.assignment_id, run_data.roll, "run", "Cannot run code after results are released.")
+    return await _last(_run_events(run_data.code, package, "run"))
+
+async def _run_events(code: str, package, endpoint: str):
+    sample_testcases = [tc for tc in package.testcases if tc.type == 'sample']
     if not sample_testcases:
-        return schemas.RunCodeResponse(overall_output="No sample test cases to run.", results=[])
+        yield "result", schemas.RunCodeResponse(overall_output="No sample test cases to run.", results=[])
+        return
     
-    all_stdout, results = [], []
-    for testcase in sample_testcases:
-        run_result = runner.run_python_code(run_data.code, testcase.input)
-        passed = not run_result.timed_out and not run_result.stderr and run_result.stdout.strip() == testcase.expected.strip()
-        if run_result.stdout: all_stdout.append(run_result.stdout)
-        if run_result.stderr: all_stdout.append(run_result.stderr)
-        results.append(schemas.RunCodeResult(stdout=run_result.stdout, stderr=run_result.stderr, runtime=run_result.runtime, timed_out=run_result.timed_out, passed=passed, testcase_type=testcase.type))
-    return schemas.RunCodeResponse(overall_output="\\n".join(all_stdout), results=results)
+    results, outcomes, started = [None] * len(sample_testcases), [], time.perf_counter()
+    async for index, testcase, run_result, passed in _run_testcases(code, sample_testcases, endpoint):
+        results[index] = schemas.RunCodeResult(index=index, stdout=run_result.stdout, stderr=run_result.stderr, runtime=run_result.runtime, timed_out=run_result.timed_out, passed=passed, testcase_type=testcase.type, time_limit=testcase.time_limit)
+        outcomes.append((testcase, run_result, passed))
+        yield "testcase", results[index]
+    workload_trace.record(endpoint, code, outcomes, seconds=time.perf_counter() - started)
+    all_stdout = [text for result in results for text in (result.stdout, result.stderr) if text]
+    yield "result", schemas.RunCodeResponse(overall_output="\\n".join(all_stdout), results=results)
+
+async def _timed(awaitable, endpoint: str, stage: str):
+    """Awaits `awaitable` inside a span, so concurrently gathered stages are timed separately."""
+    with span(endpoint, stage):
+        return await awaitable
 
 @api_router.post("/submit", response_model=schemas.SubmissionResult, tags=["Student"])
 async def submit_solution(submission_data: schemas.SubmissionCreate, db: Session = Depends(get_session)):
-    student_assignment = crud.get_student_assignment(db, assignment_id=submission_data.assignment_id, student_roll=submission_data.roll)
-    if not student_assignment:
-        raise HTTPException(status_code=404, detail="Assignment not found.")
-    
-    if student_assignment.assignment.results_released:
-        raise HTTPException(status_code=403, detail="Cannot submit after results have been released.")
+    student_assignment, package = _load_package(db, submission_data.assignment_id, submission_data.roll, "submit", "Cannot submit after results have been released.")
+    return await _last(_submission_events(submission_data, student_assignment.id, package, db, "submit"))
+
+@api_router.post("/submit/stream", tags=["Student"])
+async def submit_solution_stream(submission_data: schemas.SubmissionCreate, db: Session = Depends(get_session)):
+    """
+    /submit as server-sent events: `testcase` per finished testcase (with its index), `group`
+    per finished testcase group, `score` once all have run, `quality` and `classification` as the Gemini calls return, and finally
+    `result` with the persisted SubmissionResult.
+    """
+    student_assignment, package = _load_package(db, submission_data.assignment_id, submission_data.roll, "submit_stream", "Cannot submit after results have been released.")
+    student_assignment_id = student_assignment.id
+
+    async def events():
+        # The request's session is closed once the response starts, so the stream keeps its own
+        with Session(engine) as stream_db:
+            async for item in _submission_events(submission_data, student_assignment_id, package, stream_db, "submit_stream"):
+                yield item
+    return _event_stream(events(), "submit_stream")
+
+async def _submission_events(submission_data: schemas.SubmissionCreate, student_assignment_id: int, package, db: Session, endpoint: str):
+    # Quality review only needs the code, so it runs alongside the testcases
+    quality_task = asyncio.ensure_future(_timed(gemini_client.code_quality(submission_data.code, submission_data.assignment_id), endpoint, "llm_quality"))
+    pending = {quality_task: "quality"}
+
+    async def run_group(index: int, group):
+        with span(endpoint, "sandbox_group"):
+            return index, group, await runner.run_group(submission_data.code, group)
+    # Each group is one sandbox run, started together with the single testcases
+    started = time.perf_counter()
+    group_tasks = [asyncio.ensure_future(run_group(i, group)) for i, group in enumerate(package.groups)]
+    try:
+        outcomes = [None] * len(package.testcases)
+        async for index, testcase, run_result, passed in _run_testcases(submission_data.code, package.testcases, endpoint):
+            outcomes[index] = (testcase, run_result, passed)
+            yield "testcase", {"index": index, **_test_result(testcase, run_result, passed)}
+        group_outcomes = [None] * len(package.groups)
+        for finished in asyncio.as_completed(group_tasks):
+            index, group, results = await finished
+            group_outcomes[index] = (group, results, groups.entry(group, results))
+            yield "group", {"index": index, **group_outcomes[index][2]}
+        workload_trace.record(endpoint, submission_data.code, outcomes, [(group, results) for group, results, _ in group_outcomes], seconds=time.perf_counter() - started)
+        test_results = [_test_result(*outcome) for outcome in outcomes] + [entry for _, _, entry in group_outcomes]
         
-    package = student_assignment.package
-    total_points, passed_points = sum(tc.points for tc in package.testcases), 0
-    test_results, first_failed_result = [], None
-    for testcase in package.testcases:
-        run_result = runner.run_python_code(submission_data.code, testcase.input)
-        passed = not run_result.timed_out and not run_result.stderr and run_result.stdout.strip() == testcase.expected.strip()
-        test_results.append({"testcase_id": testcase.id, "passed": passed, "stdout": run_result.stdout, "stderr": run_result.stderr, "runtime": run_result.runtime, "timed_out": run_result.timed_out, "type": testcase.type})
-        if passed: passed_points += testcase.points
-        elif first_failed_result is None: first_failed_result = (run_result, testcase)
-    
-    raw_test_score = (passed_points / total_points) * 100 if total_points > 0 else 0
-    
-    quality_task = gemini_client.code_quality(submission_data.code)
-    error_task = None
-    if first_failed_result:
-        run_res, tc = first_failed_result
-        error_task = gemini_client.classify_error(run_res, submission_data.code, tc)
-    
-    if error_task:
-        quality_result, classification = await asyncio.gather(quality_task, error_task)
-    else:
-        quality_result = await quality_task
-        classification = None
+        total_points = sum(tc.points for tc in package.testcases) + sum(group.points for group in package.groups)
+        passed_points = sum(tc.points for tc, _, passed in outcomes if passed) + sum(entry["earned"] for _, _, entry in group_outcomes)
+        raw_test_score = (passed_points / total_points) * 100 if total_points > 0 else 0
+        yield "score", {"raw_test_score": raw_test_score, "passed_points": passed_points, "total_points": total_points}
+        
+        first_failed_result = next(((run_result, tc) for tc, run_result, passed in outcomes if not passed), None) or \
+            next(filter(None, (groups.first_failure(group, results) for group, results, _ in group_outcomes)), None)
+        if first_failed_result:
+            run_res, tc = first_failed_result
+            pending[asyncio.ensure_future(_timed(gemini_client.classify_error(run_res, submission_data.code, tc, submission_data.assignment_id), endpoint, "llm_classify"))] = "classification"
+        
+        llm = {"quality": None, "classification": None}
+        waiting = set(pending)
+        while waiting:
+            done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                llm[pending[task]] = task.result()
+                yield pending[task], task.result()
+    finally:
+        for task in [*pending, *group_tasks]: task.cancel()
+    quality_result, classification = llm["quality"], llm["classification"]
 
+    weights = scoring.weights_for(db, submission_data.assignment_id)
     quality_score = quality_result['score']
     error_penalty, error_counts = 0, {}
 
     if classification:
         err_type = classification['error_type']
-        if err_type in constants.ERROR_SEVERITY:
+        if err_type in weights.severity:
             num_failed = len([r for r in test_results if not r['passed']])
-            error_penalty = constants.ERROR_SEVERITY[err_type]
+            error_penalty = weights.severity[err_type]
             error_counts[err_type] = num_failed
     
-    final_score = max(0, min(100, (constants.ALPHA * raw_test_score + constants.BETA * quality_score - constants.GAMMA * error_penalty)))
-
-    submission = crud.create_submission(
-        db=db,
-        student_assignment_id=student_assignment.id,
-        submission_data=submission_data,
-        results_data={
-            "raw_test_score": raw_test_score, "quality_score": quality_score, "error_penalty": error_penalty,
-            "final_score": final_score, "test_results": test_results, "quality_comments": quality_result['comments'],
-            "error_counts": error_counts
-        }
-    )
+    final_score = scoring.final_score(raw_test_score, quality_score, error_penalty, weights)
+    with span(endpoint, "commit"):
+        stored_test_results = artifact_store.offload_test_results(db, test_results)
+
+        submission = crud.create_submission(
+            db=db,
+            student_assignment_id=student_assignment_id,
+            submission_data=submission_data,
+            results_data={
+                "raw_test_score": raw_test_score, "quality_score": quality_score, "error_penalty": error_penalty,
+                "final_score": final_score, "test_results": stored_test_results, "quality_comments": quality_result['comments'],
+                "error_counts": error_counts
+            }
+        )
+    profiling.schedule(submission.id, submission_data.code, package)
     
-    response_data = schemas.SubmissionResult(
-        **submission.model_dump(),
-        roll=student_assignment.student.roll
+    # The student sees their full output right away; only the stored row is compacted.
+    yield "result", schemas.SubmissionResult(
+        **{**submission.model_dump(), "test_results": test_results},
+        roll=submission_data.roll
     )
-    return response_data
+
+def _test_result(testcase, run_result, passed: bool) -> dict:
+    return {"testcase_id": testcase.id, "passed": passed, "stdout": run_result.stdout, "stderr": run_result.stderr, "runtime": run_result.runtime, "timed_out": run_result.timed_out, "type": testcase.type, "time_limit": testcase.time_limit,
+            "input_digest": regrade.input_digest_of(testcase), "expected_digest": regrade.expected_digest_of(testcase)}
 
 @api_router.post("/student/change_dob", tags=["Student"])
 def change_student_dob(request: schemas.DobChangeRequest, db: Session = Depends(get_session)):
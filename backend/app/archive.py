@@ -0,0 +1,170 @@
+import os
+import gzip
+import json
+import hashlib
+import uuid
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+from app import models, telemetry
+from app.constants import ARCHIVE_DIR, ARCHIVE_CACHE_SIZE
+
+# Cold storage for released assignments. archive_assignment() writes an assignment's
+# StudentAssignment and Submission rows to ARCHIVE_DIR/assignment-<id>-<attempt>.jsonl.gz,
+# one student per line, then deletes them (and their similarity fingerprints) from the hot
+# tables. Concurrent attempts are serialized on the assignment row, and each writes its own
+# file, so a losing attempt only ever removes the file it wrote itself. A small ArchiveEntry row per student keeps dashboards and lookups by submission
+# id off the file. The file is read only when an archived submission is asked for, and the
+# last ARCHIVE_CACHE_SIZE files read stay parsed in memory.
+
+logger = telemetry.get_logger("archive")
+
+_SUBMISSION_FIELDS = ("id", "code", "raw_test_score", "quality_score", "error_penalty", "final_score", "test_results", "quality_comments", "error_counts")
+
+_lock = threading.Lock()
+_cache: "OrderedDict[int, tuple]" = OrderedDict()
+
+
+def _path(assignment_id: int) -> str:
+    return os.path.join(ARCHIVE_DIR, f"assignment-{assignment_id}-{uuid.uuid4().hex[:12]}.jsonl.gz")
+
+def _row(sa: models.StudentAssignment) -> Dict[str, Any]:
+    sub = sa.submission
+    return {
+        "student_assignment_id": sa.id, "student_id": sa.student_id, "roll": sa.student.roll, "package_id": sa.package_id,
+        "submission": None if sub is None else {
+            **{field: getattr(sub, field) for field in _SUBMISSION_FIELDS}, "submitted_at": sub.submitted_at.isoformat()
+        },
+    }
+
+def _write(path: str, rows: List[Dict[str, Any]]) -> str:
+    """Writes the file atomically and returns the sha256 of its compressed bytes."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=ARCHIVE_DIR, prefix=".incoming-")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as out:
+            for row in rows:
+                out.write(json.dumps(row, separators=(",", ":")).encode("utf-8") + b"\n")
+        h = hashlib.sha256()
+        with open(tmp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return h.hexdigest()
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def archive_assignment(db: Session, assignment_id: int) -> Optional[models.ArchivedAssignment]:
+    """
+    Moves a released assignment's rows to its archive file. Returns None when the
+    assignment does not exist; raises ValueError when it cannot be archived.
+    """
+    from app import crud
+    # Held until commit, so a second request (a double-click) waits here and then finds the archive
+    assignment = db.exec(select(models.Assignment).where(models.Assignment.id == assignment_id).with_for_update()).first()
+    if not assignment:
+        return None
+    if not assignment.results_released:
+        raise ValueError("Only assignments whose results are released can be archived.")
+    if db.get(models.ArchivedAssignment, assignment_id):
+        raise ValueError("Assignment is already archived.")
+    if db.exec(select(models.RegradeJob).where(models.RegradeJob.assignment_id == assignment_id, models.RegradeJob.status == "running")).first():
+        raise ValueError("A regrade of this assignment is still running.")
+    student_assignments = db.exec(select(models.StudentAssignment).where(models.StudentAssignment.assignment_id == assignment_id).options(
+        selectinload(models.StudentAssignment.student), selectinload(models.StudentAssignment.submission)
+    ).order_by(models.StudentAssignment.id)).all()
+    rows = [_row(sa) for sa in student_assignments]
+    # Claimed before the file is written: where the row lock is a no-op (SQLite), a concurrent
+    # attempt stops at this primary key instead
+    record = models.ArchivedAssignment(
+        assignment_id=assignment_id, path=_path(assignment_id), sha256="", students=len(rows),
+        submissions=sum(1 for row in rows if row["submission"]), archived_at=datetime.utcnow()
+    )
+    db.add(record)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise ValueError("Assignment is already archived.")
+    try:
+        record.sha256 = _write(record.path, rows)
+        for row in rows:
+            sub = row["submission"]
+            db.add(models.ArchiveEntry(
+                student_assignment_id=row["student_assignment_id"], assignment_id=assignment_id, student_id=row["student_id"],
+                package_id=row["package_id"], submission_id=sub and sub["id"], final_score=sub and sub["final_score"]
+            ))
+        sa_ids = [sa.id for sa in student_assignments]
+        db.execute(delete(models.CodeFingerprint).where(models.CodeFingerprint.assignment_id == assignment_id))
+        db.execute(delete(models.AssignmentPackageUsage).where(models.AssignmentPackageUsage.assignment_id == assignment_id))
+        if sa_ids:
+            submission_ids = select(models.Submission.id).where(models.Submission.student_assignment_id.in_(sa_ids))
+            db.execute(delete(models.SubmissionProfile).where(models.SubmissionProfile.submission_id.in_(submission_ids))) # Not archived
+            db.execute(delete(models.Submission).where(models.Submission.student_assignment_id.in_(sa_ids)))
+            db.execute(delete(models.StudentAssignment).where(models.StudentAssignment.id.in_(sa_ids)))
+        crud.bump_versions(db, "assignments", f"assignment:{assignment_id}", *sorted({f"student:{row['student_id']}" for row in rows}))
+        db.commit()
+    except Exception:
+        path = record.path
+        db.rollback()
+        if os.path.exists(path):
+            os.unlink(path) # This attempt's own file; nothing was deleted, so it is not needed
+        raise
+    db.refresh(record)
+    logger.info("Assignment archived", extra={"assignment_id": assignment_id, "students": record.students, "submissions": record.submissions})
+    return record
+
+def is_archived(db: Session, assignment_id: int) -> bool:
+    return db.get(models.ArchivedAssignment, assignment_id) is not None
+
+def _load(record: models.ArchivedAssignment) -> List[Dict[str, Any]]:
+    with _lock:
+        entry = _cache.get(record.assignment_id)
+        if entry is not None and entry[0] == record.sha256:
+            _cache.move_to_end(record.assignment_id)
+            return entry[1]
+    with gzip.open(record.path, "rt", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    with _lock:
+        _cache[record.assignment_id] = (record.sha256, rows)
+        while len(_cache) > ARCHIVE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rows
+
+def _submission(assignment_id: int, row: Dict[str, Any]) -> models.Submission:
+    """A detached Submission (with student_assignment.student) rebuilt from an archived row."""
+    data = dict(row["submission"])
+    submission = models.Submission(**{**data, "submitted_at": datetime.fromisoformat(data["submitted_at"]), "student_assignment_id": row["student_assignment_id"]})
+    submission.student_assignment = models.StudentAssignment(
+        id=row["student_assignment_id"], student_id=row["student_id"], package_id=row["package_id"], assignment_id=assignment_id,
+        student=models.Student(id=row["student_id"], roll=row["roll"])
+    )
+    return submission
+
+def submissions(db: Session, assignment_id: int) -> List[models.Submission]:
+    record = db.get(models.ArchivedAssignment, assignment_id)
+    if record is None:
+        return []
+    return [_submission(assignment_id, row) for row in _load(record) if row["submission"]]
+
+def submission(db: Session, submission_id: int) -> Optional[models.Submission]:
+    entry = db.exec(select(models.ArchiveEntry).where(models.ArchiveEntry.submission_id == submission_id)).first()
+    if entry is None:
+        return None
+    record = db.get(models.ArchivedAssignment, entry.assignment_id)
+    row = next((r for r in _load(record) if r["submission"] and r["submission"]["id"] == submission_id), None)
+    return _submission(entry.assignment_id, row) if row else None
+
+def entries_for_student(db: Session, student_id: int) -> List[models.ArchiveEntry]:
+    return db.exec(select(models.ArchiveEntry).where(models.ArchiveEntry.student_id == student_id)).all()
+
+def entry(db: Session, assignment_id: int, student_id: int) -> Optional[models.ArchiveEntry]:
+    return db.exec(select(models.ArchiveEntry).where(models.ArchiveEntry.assignment_id == assignment_id, models.ArchiveEntry.student_id == student_id)).first()
@@ -0,0 +1,94 @@
+import os
+import zlib
+import hashlib
+import tempfile
+from typing import Any, Dict, List, Optional
+from sqlmodel import Session
+from app import models
+from app.constants import ARTIFACT_DIR, ARTIFACT_PREVIEW_CHARS
+
+# Content-addressed, zlib-compressed storage for execution output (stdout/stderr).
+# Submission.test_results only keeps a digest and a short preview per stream; the full
+# text lives here, keyed by its sha256, so identical outputs from different students are
+# stored once. Blobs go to the `artifact` table unless ARTIFACT_DIR names a directory.
+
+_STREAMS = ("stdout", "stderr")
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _fs_path(digest: str) -> str:
+    return os.path.join(ARTIFACT_DIR, digest[:2], digest[2:] + ".z")
+
+def _insert_ignore_duplicate(db: Session, digest: str, size: int, blob: bytes) -> None:
+    dialect = db.get_bind().dialect.name
+    values = {"digest": digest, "size": size, "data": blob}
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        if db.get(models.Artifact, digest) is None:
+            db.add(models.Artifact(**values))
+        return
+    db.execute(insert(models.Artifact).values(**values).on_conflict_do_nothing(index_elements=["digest"]))
+
+def put(db: Session, text: str) -> Optional[str]:
+    """Stores text and returns its digest. Empty text is not stored and yields None."""
+    if not text:
+        return None
+    raw = text.encode("utf-8")
+    digest = _digest(raw)
+    blob = zlib.compress(raw, 6)
+    if ARTIFACT_DIR:
+        path = _fs_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path) # Atomic, so concurrent writers of the same digest are harmless
+    else:
+        _insert_ignore_duplicate(db, digest, len(raw), blob)
+    return digest
+
+def get(db: Session, digest: str) -> Optional[str]:
+    if ARTIFACT_DIR:
+        try:
+            with open(_fs_path(digest), "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+    else:
+        artifact = db.get(models.Artifact, digest)
+        if artifact is None:
+            return None
+        blob = artifact.data
+    return zlib.decompress(blob).decode("utf-8")
+
+def offload_test_results(db: Session, test_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Replaces full stdout/stderr in each result with `<stream>_digest` and `<stream>_preview`."""
+    compact = []
+    for result in test_results:
+        entry = {k: v for k, v in result.items() if k not in _STREAMS}
+        for stream in _STREAMS:
+            text = result.get(stream) or ""
+            entry[f"{stream}_preview"] = text[:ARTIFACT_PREVIEW_CHARS]
+            entry[f"{stream}_digest"] = put(db, text) if len(text) > ARTIFACT_PREVIEW_CHARS else None
+        compact.append(entry)
+    return compact
+
+def hydrate_test_results(db: Session, test_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Inverse of offload_test_results; rows written before offloading pass through unchanged."""
+    full = []
+    for result in test_results or []:
+        entry = dict(result)
+        for stream in _STREAMS:
+            if stream in entry:
+                continue
+            digest = entry.get(f"{stream}_digest")
+            text = get(db, digest) if digest else None
+            entry[stream] = text if text is not None else entry.get(f"{stream}_preview", "")
+        full.append(entry)
+    return full
@@ -1,57 +1,158 @@
-from typing import List
+import random
+from collections import deque
+from typing import List, Dict, Optional, Tuple
 from app.models import Student, Package
+from app import telemetry
+
+logger = telemetry.get_logger("assignment")
+
+def _neighbour_offsets(d: int, seat_layout: Optional[Tuple[int, int]], neighbourhood: int, cols: int) -> List[Tuple[int, int]]:
+    """
+    Offsets (as (dr, dc)) of already-placed positions that must not share a package with
+    the current one. Positions are filled in roll order, i.e. row-major for seat layouts.
+    """
+    if seat_layout is None:
+        return [(0, -k) for k in range(1, d + 1)]
+    offsets = []
+    for dr in range(-d, 1):
+        for dc in range(-d, d + 1):
+            if (dr, dc) == (0, 0) or (dr == 0 and dc > 0):
+                continue
+            # 4-neighbourhood measures distance in steps (Manhattan), 8-neighbourhood in kings' moves
+            distance = abs(dr) + abs(dc) if neighbourhood == 4 else max(abs(dr), abs(dc))
+            if distance <= d and abs(dc) < cols:
+                offsets.append((dr, dc))
+    return offsets
+
+def seat_distance(i: int, j: int, seat_layout: Optional[Tuple[int, int]], neighbourhood: int) -> int:
+    """Distance between positions i and j in roll order, measured as assign_packages_to_students does."""
+    if seat_layout is None:
+        return abs(i - j)
+    (ri, ci), (rj, cj) = divmod(i, seat_layout[1]), divmod(j, seat_layout[1])
+    return abs(ri - rj) + abs(ci - cj) if neighbourhood == 4 else max(abs(ri - rj), abs(ci - cj))
+
+def roll_window(d: int, seat_layout: Optional[Tuple[int, int]]) -> int:
+    """How far apart in roll order two students within distance d can be."""
+    return d * seat_layout[1] + d if seat_layout else d
 
 def assign_packages_to_students(
     students: List[Student],
-    packages: List[Package]
+    packages: List[Package],
+    clusters: Optional[Dict[int, int]] = None,
+    d: Optional[int] = None,
+    seat_layout: Optional[Tuple[int, int]] = None,
+    neighbourhood: int = 4,
+    s_max: Optional[int] = None,
+    seed: Optional[int] = None
 ) -> List[dict]:
     """
-    Assigns packages to students using round-robin and fixes adjacent duplicates.
-    Assumes students are sorted by roll number.
+    Assigns packages to students so that no two students within distance `d` get the
+    same question. Assumes students are sorted by roll number.
+
+    Without `seat_layout`, distance is measured in roll order. With `seat_layout=(rows, cols)`
+    students are seated row-major by roll and distance is taken on the grid, using the 4- or
+    8-neighbourhood. `clusters` maps package id -> near-duplicate cluster id; packages in the
+    same cluster count as the same question. `seed` shuffles the package order reproducibly.
+
+    Positions are filled one at a time from a least-recently-used queue of clusters, taking
+    the first cluster not used by an already-placed neighbour. Only neighbours can block, so
+    each step looks at O(d^2) entries and the whole run is O(n * d^2). Least-recently-used
+    order also keeps usage close to even across clusters (exactly even in roll order).
     """
     n = len(students)
-    m = len(packages)
+    d = constants.D_ADJACENCY if d is None else d
+    s_max = constants.S_MAX if s_max is None else s_max
+    clusters = clusters or {}
+    group = lambda package_id: clusters.get(package_id, package_id)
 
-    if m == 0:
+    if not packages:
         raise ValueError("Cannot assign from an empty list of packages.")
     if n == 0:
         return []
+    if neighbourhood not in (4, 8):
+        raise ValueError("neighbourhood must be 4 or 8.")
+
+    rng = random.Random(seed) if seed is not None else None
+    members: Dict[int, List[int]] = {}
+    for package in packages:
+        members.setdefault(group(package.id), []).append(package.id)
+    order = list(members)
+    if rng:
+        rng.shuffle(order)
+        for ids in members.values(): rng.shuffle(ids)
+    m = len(order)
+
+    rows, cols = seat_layout if seat_layout else (1, n)
+    if rows * cols < n:
+        raise ValueError(f"Seat layout {rows}x{cols} has fewer seats than the {n} students.")
+    offsets = _neighbour_offsets(d, seat_layout, neighbourhood, cols)
+    # In roll order each position has at most d earlier neighbours, so d + 1 clusters always suffice.
+    if seat_layout is None and m < min(d, n - 1) + 1:
+        raise ValueError(
+            f"At least {min(d, n - 1) + 1} unique packages are required for adjacency distance {d} (got {m}; near-duplicates count as one). "
+            f"Try generating more unique packages ({constants.compute_m_star(n, d=d)} recommended)."
+        )
+
+    lru = deque(order)
+    next_member = {c: 0 for c in order}
+    placed: Dict[Tuple[int, int], int] = {}
+    assignments = []
+    for i in range(n):
+        r, c = divmod(i, cols)
+        blocked = {placed[(r + dr, c + dc)] for dr, dc in offsets if (r + dr, c + dc) in placed}
+        for k, cluster in enumerate(lru):
+            if cluster not in blocked:
+                break
+        else:
+            raise ValueError(
+                f"Could not keep {m} unique packages apart at distance {d} for {n} students. "
+                f"Try generating more unique packages ({constants.compute_m_star(n, d=d)} recommended)."
+            )
+        del lru[k]
+        lru.append(cluster)
+        placed[(r, c)] = cluster
+        ids = members[cluster]
+        assignments.append((students[i].id, ids[next_member[cluster] % len(ids)]))
+        next_member[cluster] += 1
 
-    # Basic constraint: Need at least 2 packages if more than 1 student
-    if n > 1 and m < 2:
-        raise ValueError("At least 2 unique packages are required for more than 1 student.")
-
-    # Step 1: Initial round-robin assignment
-    assignments = [(students[i].id, packages[i % m].id) for i in range(n)]
-
-    # Step 2: Fix adjacent duplicates with local swaps
-    for i in range(n - 1):
-        if assignments[i][1] == assignments[i+1][1]:
-            # Found adjacent duplicate at index i+1
-            found_swap = False
-            # Try to swap with the next non-identical neighbor
-            for j in range(i + 2, n):
-                if assignments[j][1] != assignments[i+1][1]:
-                    # Ensure the swap doesn't create a new adjacent duplicate at j-1
-                    if j > 0 and assignments[j-1][1] == assignments[i+1][1]:
-                        continue
-                    # Ensure the swap doesn't create a new adjacent duplicate at i (rare case)
-                    if i > 0 and assignments[i-1][1] == assignments[j][1]:
-                         continue
-
-                    assignments[i+1], assignments[j] = assignments[j], assignments[i+1]
-                    found_swap = True
-                    break # Swap done, move to next index i
-
-            if not found_swap:
-                # If no forward swap possible, this simple algorithm fails.
-                # A more robust solution might need backtracking.
-                raise ValueError(
-                    f"Could not resolve adjacent duplicate packages with {m} packages for {n} students. "
-                    f"Try generating more unique packages ({constants.compute_m_star(n)} recommended)."
-                )
+    usage: Dict[int, int] = {}
+    for _, package_id in assignments:
+        usage[package_id] = usage.get(package_id, 0) + 1
+    if max(usage.values()) > s_max:
+        logger.warning(f"A package is used by {max(usage.values())} students (S_MAX={s_max}). "
+                       f"{constants.compute_m_star(n, d=d)} unique packages are recommended for {n} students.")
 
     return [{"student_id": s_id, "package_id": p_id} for s_id, p_id in assignments]
 
+def place_incrementally(
+    to_place: List[int],
+    neighbours: Dict[int, List[int]],
+    current: Dict[int, Optional[int]],
+    package_ids: List[int],
+    usage: Dict[int, int],
+    clusters: Optional[Dict[int, int]] = None
+) -> Dict[int, int]:
+    """
+    Picks packages for the students in `to_place` (student ids, in roll order) without
+    touching anyone else. `neighbours[s]` lists the students within the adjacency distance
+    of s, `current` holds everyone's present package (None for students being placed) and
+    `usage` the per-package counts, which are updated in place. Each student gets the least
+    used package whose cluster no neighbour already has, so the work is proportional to the
+    number of students placed, not the size of the cohort.
+    """
+    clusters = clusters or {}
+    group = lambda package_id: clusters.get(package_id, package_id)
+    placements = {}
+    for student_id in to_place:
+        blocked = {group(current[n]) for n in neighbours.get(student_id, []) if current.get(n) is not None}
+        allowed = [p for p in package_ids if group(p) not in blocked]
+        if not allowed:
+            raise ValueError(f"No package can be placed for student {student_id} without breaking the adjacency rule. Add more unique packages.")
+        choice = min(allowed, key=lambda p: (usage.get(p, 0), p))
+        placements[student_id] = choice
+        current[student_id] = choice
+        usage[choice] = usage.get(choice, 0) + 1
+    return placements
+
 # Import constants at the end to avoid potential circular import issues
-from app import constants
\ No newline at end of file
+from app import constants
@@ -23,6 +23,129 @@ GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1/models/"
 MODEL_FLASH = "gemini-2.5-flash"
 MODEL_PRO = "gemini-2.5-pro"
 
+# --- Caching ---
+PACKAGE_CACHE_SIZE = int(os.getenv("PACKAGE_CACHE_SIZE", "256"))
+PACKAGE_CACHE_TTL_SECONDS = 3600
+
+# --- Execution Artifacts ---
+# Directory for compressed stdout/stderr blobs; when unset they are stored in the DB.
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR")
+ARTIFACT_PREVIEW_CHARS = 200
+
+# --- Near-Duplicate Detection ---
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16 # 4 rows per band
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# "flag" stores near-duplicates in the same cluster; "reject" refuses to create them
+NEAR_DUPLICATE_POLICY = os.getenv("NEAR_DUPLICATE_POLICY", "flag")
+
+# --- Code Similarity ---
+SIMILARITY_KGRAM = 5 # Tokens per hashed k-gram
+SIMILARITY_WINDOW = 4 # Winnowing window; any match of K+W-1 tokens is guaranteed to be found
+SIMILARITY_MAX_DOC_FREQ = 0.5 # Ignore fingerprints shared by more than this fraction of submissions
+SIMILARITY_MIN_SCORE = 0.5
+
+# --- Regrading ---
+REGRADE_CONCURRENCY = int(os.getenv("REGRADE_CONCURRENCY", "4")) # Parallel sandbox runs
+REGRADE_BATCH_SIZE = 50
+REGRADE_LEASE_SECONDS = 120 # A running job untouched for this long is resumed by another worker
+
+# --- Time Limits ---
+# Packages with a reference solution get per-testcase limits of
+# clamp(TIME_LIMIT_FACTOR x reference CPU time, TIME_LIMIT_FLOOR_SECONDS, TIME_LIMIT_MAX_SECONDS);
+# others use runner.CPU_LIMIT_SECONDS. Limits are calibrated and enforced on the same clock:
+# the child's CPU time (user + system, from wait4). A program that sleeps or blocks uses none,
+# so it is stopped after TIME_LIMIT_WALL_FACTOR x its limit + 1 s of wall time instead.
+TIME_LIMIT_FACTOR = float(os.getenv("TIME_LIMIT_FACTOR", "3"))
+TIME_LIMIT_FLOOR_SECONDS = 0.5 # Covers interpreter startup and scheduling noise
+TIME_LIMIT_MAX_SECONDS = 10.0
+TIME_LIMIT_WALL_FACTOR = 2
+REFERENCE_RUNS = 3 # Runs per testcase; the median CPU time is used
+
+# --- Run Limits ---
+RUN_RATE_PER_MINUTE = float(os.getenv("RUN_RATE_PER_MINUTE", "12")) # Sustained /run rate per roll
+RUN_BURST = int(os.getenv("RUN_BURST", "4"))
+RUN_FLIGHT_TTL_SECONDS = 60 # Upper bound on one /run; a crashed worker's coalescing lock expires after this
+
+# --- Startup ---
+# With several workers, set this to false and run `python -m app.init_db` once before starting them
+SEED_ON_STARTUP = os.getenv("SEED_ON_STARTUP", "true").lower() == "true"
+
+# --- Observability ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json") # "json" (one object per line) or "text"
+# Histogram buckets (seconds) for request and stage latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", str(os.cpu_count() or 4))) # Concurrent sandboxed runs per worker
+
+# --- Testcase Payloads ---
+# Directory for file-backed testcase inputs/expected outputs and cached generator output.
+# Must be shared by every worker (a volume), like ARTIFACT_DIR.
+PAYLOAD_DIR = os.getenv("PAYLOAD_DIR", "payloads")
+PAYLOAD_MAX_BYTES = 256 * 1024 * 1024 # Largest upload, generated input or captured output
+PAYLOAD_PREVIEW_CHARS = 2000 # Kept in TestCase.input/expected for display
+OUTPUT_PREVIEW_BYTES = 64 * 1024 # stdout returned for runs compared against an expected file
+GENERATOR_TIME_LIMIT_SECONDS = 10.0
+
+# --- Testcase Groups ---
+# Weighted subtasks whose cases run in one sandboxed process; see app.groups
+GROUP_SCORING_MODES = ("all", "partial") # All-or-nothing, or points in proportion to cases passed
+MAX_GROUP_TESTCASES = 1000
+GROUP_CASE_TIME_LIMIT_SECONDS = 1.0 # CPU seconds per case, when the group was not calibrated against a reference solution
+# Wall time one group may hold a sandbox slot, whatever its number of cases; cases not started by then fail
+GROUP_TIME_BUDGET_SECONDS = float(os.getenv("GROUP_TIME_BUDGET_SECONDS", "10"))
+GROUP_CASE_OUTPUT_BYTES = 8 * 1024 * 1024 # stdout (and stderr) per group case
+
+# --- Archival ---
+# Where archived assignments' student rows go (gzipped JSONL); shared by all workers
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_CACHE_SIZE = 8 # Archive files kept parsed in memory per worker
+
+# --- Prompt Compaction ---
+# Token budget per grading prompt (instructions, code and run output), by model; see app.prompt_compaction
+PROMPT_TOKEN_BUDGETS = {
+    MODEL_FLASH: int(os.getenv("PROMPT_TOKEN_BUDGET_FLASH", "1500")),
+    MODEL_PRO: int(os.getenv("PROMPT_TOKEN_BUDGET_PRO", "3000")),
+}
+PROMPT_CHARS_PER_TOKEN = 4 # Estimate for code and English text
+PROMPT_LITERAL_CHARS = 80 # String literals longer than this are elided
+PROMPT_LINE_CHARS = 200
+PROMPT_TRACEBACK_LINES = 6 # Last stderr lines kept: innermost frames and the exception
+
+# --- Profiling ---
+# Profile each submission on its package's heaviest hidden testcase after grading; see app.profiling
+PROFILE_SUBMISSIONS = os.getenv("PROFILE_SUBMISSIONS", "false").lower() == "true"
+PROFILE_TIME_FACTOR = 3 # The testcase's time limit is stretched by this; profilers slow the program down
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.001 # CPU time between line samples
+PROFILE_TOP_N = 10 # Entries kept per table of the report
+PROFILE_MAX_BYTES = 16 * 1024 # Largest stored report (JSON)
+
+# --- LLM Usage Budgets ---
+# Token caps (prompt + response) per assignment over its lifetime and per teacher per UTC day;
+# 0 disables a cap. Past a cap Pro calls use Flash and Flash calls the canned fallback; past
+# LLM_HARD_BUDGET_FACTOR times the cap every call falls back. See app.llm_usage.
+LLM_ASSIGNMENT_TOKEN_BUDGET = int(os.getenv("LLM_ASSIGNMENT_TOKEN_BUDGET", "0"))
+LLM_TEACHER_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_TEACHER_DAILY_TOKEN_BUDGET", "0"))
+LLM_HARD_BUDGET_FACTOR = 1.5
+LLM_USAGE_FLUSH_SECONDS = 5.0 # Recorded calls are written in batches at least this often
+LLM_USAGE_BATCH_SIZE = 200 # or as soon as this many are waiting
+LLM_USAGE_MAX_BUFFER = 10_000 # Calls kept in memory while the database is unreachable
+LLM_BUDGET_CACHE_SECONDS = 30 # How long a worker reuses stored totals when checking budgets
+
+# --- Question Bank Transfer ---
+QUESTION_BANK_PAGE_SIZE = 200 # Packages loaded per query while exporting
+QUESTION_BANK_BATCH_SIZE = 500 # Packages inserted per transaction while importing
+QUESTION_BANK_CHUNK_BYTES = 1 << 20 # Payload file bytes per exported line (before base64)
+
+# --- Workload Traces ---
+# Directory for anonymized /run and /submit traces (app.workload_trace), replayed with
+# benchmarks.replay; recording is off when unset.
+WORKLOAD_TRACE_DIR = os.getenv("WORKLOAD_TRACE_DIR")
+WORKLOAD_TRACE_SAMPLE = float(os.getenv("WORKLOAD_TRACE_SAMPLE", "1.0")) # Share of requests recorded
+WORKLOAD_TRACE_FILE_REQUESTS = 10000 # Requests per trace file before a new one is started
+WORKLOAD_TRACE_FLUSH_SECONDS = 5
+WORKLOAD_TRACE_MAX_BUFFER = 2000 # Requests held while writing is slow; the oldest are dropped
+
 # --- Assignment Generation Formulas ---
 D_ADJACENCY = 1
 S_MAX = 8
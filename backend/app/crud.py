@@ -1,8 +1,12 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from sqlmodel import Session, select
 from app import models, schemas
 from datetime import date, datetime
 from sqlalchemy.orm import selectinload
+from sqlalchemy import func, and_
+from app import telemetry
+
+logger = telemetry.get_logger("crud")
 
 # --- (Teacher, Student, TeacherCode functions are unchanged) ---
 def get_teacher_by_username(db: Session, username: str) -> Optional[models.Teacher]:
@@ -42,63 +46,302 @@ def validate_and_use_student_code(db: Session, roll: int, plaintext_code: str) -
         return True
     return False
 
+# --- Version stamps (ETags) ---
+def bump_versions(db: Session, *keys: str) -> None:
+    """Increments the given version counters. Call before the write's own commit so both land together."""
+    dialect = db.get_bind().dialect.name
+    for key in keys:
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            statement = insert(models.VersionStamp).values(key=key, value=1)
+            db.execute(statement.on_conflict_do_update(index_elements=["key"], set_={"value": models.VersionStamp.value + 1}))
+        else:
+            stamp = db.get(models.VersionStamp, key) or models.VersionStamp(key=key, value=0)
+            stamp.value += 1
+            db.add(stamp)
+def get_versions(db: Session, keys: List[str]) -> Dict[str, int]:
+    stamps = db.exec(select(models.VersionStamp).where(models.VersionStamp.key.in_(keys))).all()
+    found = {stamp.key: stamp.value for stamp in stamps}
+    return {key: found.get(key, 0) for key in keys}
+
 # --- (Package & TestCase functions are unchanged) ---
-def create_package_with_testcases(db: Session, package_data: dict) -> Optional[models.Package]:
+def is_valid_package(package_data: Any) -> bool:
+    """
+    Structural checks for a package about to be stored; logs why it is rejected.
+    A package may carry `groups` ({"name", "points", "scoring", "testcases"}, see
+    reference.prepare_groups). It then needs no fixed number of ungrouped testcases; the
+    points of the testcases and the groups together must sum to 100.
+    """
+    from app.constants import GROUP_SCORING_MODES, MAX_GROUP_TESTCASES
     if not isinstance(package_data, dict):
-        print("Validation ERROR: Package data is not a dictionary.")
-        return None
+        logger.warning("Package rejected: Package data is not a dictionary.")
+        return False
     testcases_data = package_data.get('testcases', [])
     required_keys = ['title', 'prompt', 'difficulty', 'testcases']
     if not all(key in package_data for key in required_keys):
-        print(f"Validation ERROR: Package missing required keys. Data: {package_data.get('title')}")
-        return None
-    if not isinstance(testcases_data, list) or len(testcases_data) != 5:
-        print(f"Validation ERROR: Package '{package_data.get('title')}' does not have 5 test cases.")
-        return None
+        logger.warning(f"Package rejected: Package missing required keys. Data: {package_data.get('title')}")
+        return False
+    groups_data = package_data.get('groups') or []
+    if not isinstance(testcases_data, list) or (len(testcases_data) != 5 and not groups_data):
+        logger.warning(f"Package rejected: Package '{package_data.get('title')}' does not have 5 test cases.")
+        return False
     total_points = 0
+    for group_data in groups_data if isinstance(groups_data, list) else [None]:
+        cases = group_data.get('testcases') if isinstance(group_data, dict) else None
+        if (not isinstance(cases, list) or not 0 < len(cases) <= MAX_GROUP_TESTCASES or group_data.get('scoring', 'all') not in GROUP_SCORING_MODES
+                or not group_data.get('name') or not all(isinstance(c, dict) and 'input' in c and 'expected' in c for c in cases)):
+            logger.warning(f"Package rejected: Package '{package_data.get('title')}' has a malformed test case group.")
+            return False
+        try:
+            total_points += int(group_data.get('points'))
+        except (ValueError, TypeError):
+            logger.warning(f"Package rejected: Package '{package_data.get('title')}' has invalid group points.")
+            return False
     for tc_data in testcases_data:
         if not isinstance(tc_data, dict) or not all(k in tc_data for k in ['type', 'input', 'expected', 'points']):
-            print(f"Validation ERROR: Package '{package_data.get('title')}' has a malformed test case.")
-            return None
+            logger.warning(f"Package rejected: Package '{package_data.get('title')}' has a malformed test case.")
+            return False
         try:
             total_points += int(tc_data['points'])
         except (ValueError, TypeError):
-            print(f"Validation ERROR: Package '{package_data.get('title')}' has invalid test case points.")
-            return None
+            logger.warning(f"Package rejected: Package '{package_data.get('title')}' has invalid test case points.")
+            return False
     if total_points != 100:
-        print(f"Validation ERROR: Package '{package_data.get('title')}' test case points do not sum to 100 (Got: {total_points}).")
+        logger.warning(f"Package rejected: Package '{package_data.get('title')}' test case points do not sum to 100 (Got: {total_points}).")
+        return False
+    return True
+def create_package_with_testcases(db: Session, package_data: dict, time_limits: Optional[List[dict]] = None) -> Optional[models.Package]:
+    """
+    Validates and stores a package. `time_limits` ({"time_limit", "reference_runtime"} per
+    testcase, from reference.calibrate) are stored with the testcases, and a `solution`
+    key in the data is kept as the package's reference solution.
+    """
+    if not is_valid_package(package_data):
+        return None
+    testcases_data = package_data.get('testcases', [])
+    from app import near_duplicates
+    from app.constants import NEAR_DUPLICATE_POLICY
+    signature = near_duplicates.signature(package_data['title'], package_data['prompt'], testcases_data)
+    duplicates = near_duplicates.find_near_duplicates(db, signature)
+    if duplicates and NEAR_DUPLICATE_POLICY == "reject":
+        logger.warning(f"Package rejected: Package '{package_data.get('title')}' is a near-duplicate of package {duplicates[0][0].package_id} (similarity {duplicates[0][1]:.2f}).")
         return None
     testcases_data = package_data.pop('testcases', [])
+    groups_data = package_data.pop('groups', None) or []
+    solution = package_data.pop('solution', None)
     package_data.pop('id', None)
     db_package = models.Package(**package_data)
     db.add(db_package); db.commit(); db.refresh(db_package)
+    db_testcases = []
     for tc_data in testcases_data:
         tc_data.pop('id', None)
         db_testcase = models.TestCase(**tc_data, package_id=db_package.id)
         db.add(db_testcase)
+        db_testcases.append(db_testcase)
+    if solution:
+        db.add(models.ReferenceSolution(package_id=db_package.id, code=str(solution)))
+    if time_limits:
+        db.flush() # Testcase ids for the limit rows
+        for db_testcase, limit in zip(db_testcases, time_limits):
+            db.add(models.TestCaseLimit(testcase_id=db_testcase.id, **limit))
+    for group_data in groups_data:
+        _add_group(db, db_package.id, group_data)
+    from app import search_index
+    search_index.index_package(db, db_package)
+    near_duplicates.index_package(db, db_package.id, signature, duplicates)
+    if duplicates:
+        logger.warning(f"Package '{db_package.title}' flagged as a near-duplicate of package {duplicates[0][0].package_id}.")
+    bump_versions(db, "packages")
     db.commit(); db.refresh(db_package)
-    print(f"Validation SUCCESS: Package '{db_package.title}' created.")
+    logger.info(f"Package '{db_package.title}' created.")
     return db_package
+def _add_group(db: Session, package_id: int, group_data: dict) -> models.TestCaseGroup:
+    """Stores a validated group and its cases. Does not commit."""
+    group = models.TestCaseGroup(package_id=package_id, name=str(group_data['name']), points=int(group_data['points']), scoring=group_data.get('scoring', 'all'))
+    db.add(group)
+    cases = [models.TestCase(type="hidden", input=str(c['input']), expected=str(c['expected']), points=0, package_id=package_id) for c in group_data['testcases']]
+    db.add_all(cases)
+    db.flush() # Ids for the member and limit rows
+    for position, (case, case_data) in enumerate(zip(cases, group_data['testcases'])):
+        db.add(models.TestCaseGroupMember(testcase_id=case.id, group_id=group.id, position=position))
+        if case_data.get('time_limit') is not None:
+            db.add(models.TestCaseLimit(testcase_id=case.id, time_limit=case_data['time_limit'], reference_runtime=case_data.get('reference_runtime', 0.0)))
+    return group
+
+def _forget_content_hash(db: Session, package_id: int) -> None:
+    """The package's content changed; question_bank hashes it again when it next needs to."""
+    stored = db.get(models.PackageContentHash, package_id)
+    if stored: db.delete(stored)
+def update_testcase(db: Session, testcase_id: int, changes: dict) -> Optional[models.TestCase]:
+    testcase = db.get(models.TestCase, testcase_id)
+    if not testcase: return None
+    if 'input' in changes and changes['input'] != testcase.input:
+        # The calibrated limit was measured on the old input; fall back to the default
+        limit = db.get(models.TestCaseLimit, testcase_id)
+        if limit: db.delete(limit)
+    payload = db.get(models.TestCasePayload, testcase_id)
+    if payload:
+        # Inline text replaces the file-backed or generated side it edits
+        if 'input' in changes: payload.input_digest, payload.input_size, payload.generator = None, 0, None
+        if 'expected' in changes: payload.expected_digest, payload.expected_size = None, 0
+        if payload.input_digest or payload.generator or payload.expected_digest: db.add(payload)
+        else: db.delete(payload)
+    for key, value in changes.items():
+        setattr(testcase, key, value)
+    db.add(testcase)
+    _forget_content_hash(db, testcase.package_id)
+    bump_versions(db, "packages", f"package:{testcase.package_id}")
+    db.commit(); db.refresh(testcase)
+    from app import package_cache
+    package_cache.invalidate(testcase.package_id)
+    return testcase
+def add_testcase(db: Session, package_id: int, tc_data: dict) -> Optional[models.TestCase]:
+    if not db.get(models.Package, package_id): return None
+    testcase = models.TestCase(**tc_data, package_id=package_id)
+    db.add(testcase)
+    _forget_content_hash(db, package_id)
+    bump_versions(db, "packages", f"package:{package_id}")
+    db.commit(); db.refresh(testcase)
+    from app import package_cache
+    package_cache.invalidate(package_id)
+    return testcase
+def add_testcase_with_payload(db: Session, package_id: int, tc_data: dict, payload_data: dict) -> Optional[models.TestCase]:
+    """add_testcase for a testcase whose input and/or expected output live in payload_store (or a generator)."""
+    if not db.get(models.Package, package_id): return None
+    testcase = models.TestCase(**tc_data, package_id=package_id)
+    db.add(testcase)
+    db.flush()
+    db.add(models.TestCasePayload(testcase_id=testcase.id, **payload_data))
+    _forget_content_hash(db, package_id)
+    bump_versions(db, "packages", f"package:{package_id}")
+    db.commit(); db.refresh(testcase)
+    from app import package_cache
+    package_cache.invalidate(package_id)
+    return testcase
 def get_packages_by_ids(db: Session, package_ids: List[int]) -> List[models.Package]:
     statement = select(models.Package).where(models.Package.id.in_(package_ids)).options(selectinload(models.Package.testcases))
     return db.exec(statement).all()
-def get_all_packages(db: Session) -> List[models.Package]:
-    statement = select(models.Package).options(selectinload(models.Package.testcases))
+def get_all_packages(db: Session, with_testcases: bool = True) -> List[models.Package]:
+    statement = select(models.Package)
+    if with_testcases:
+        statement = statement.options(selectinload(models.Package.testcases))
     return db.exec(statement).all()
 
 # --- Assignment & Submission --- #
-def create_assignment_with_mappings(db: Session, name: str, student_assignments_data: List[dict]) -> models.Assignment:
+def create_assignment_with_mappings(db: Session, name: str, student_assignments_data: List[dict], adjacency_distance: int,
+                                    seat_layout: Optional[Tuple[int, int]] = None, neighbourhood: int = 4) -> models.Assignment:
     # --- THIS IS UPDATED ---
     db_assignment = models.Assignment(name=name, results_released=False)
     db.add(db_assignment); db.commit(); db.refresh(db_assignment)
+    usage: Dict[int, int] = {}
     for sa_data in student_assignments_data:
         db.add(models.StudentAssignment(**sa_data, assignment_id=db_assignment.id))
+        usage[sa_data['package_id']] = usage.get(sa_data['package_id'], 0) + 1
+    seat_rows, seat_cols = seat_layout or (None, None)
+    db.add(models.AssignmentRules(
+        assignment_id=db_assignment.id, adjacency_distance=adjacency_distance, seat_rows=seat_rows, seat_cols=seat_cols,
+        neighbourhood=neighbourhood, placed_through=max((sa_data['student_id'] for sa_data in student_assignments_data), default=0)
+    ))
+    for package_id, students in usage.items():
+        db.add(models.AssignmentPackageUsage(assignment_id=db_assignment.id, package_id=package_id, students=students))
+    bump_versions(db, "assignments")
     db.commit(); db.refresh(db_assignment)
+    # Students will start opening these packages right away, so load them once up front.
+    from app import package_cache
+    package_cache.warm(db, {sa_data['package_id'] for sa_data in student_assignments_data})
     return db_assignment
 
 def get_all_assignments(db: Session) -> List[models.Assignment]:
     return db.exec(select(models.Assignment)).all()
 
+# --- Incremental re-assignment ---
+def get_assignment_rules(db: Session, assignment_id: int) -> Optional[models.AssignmentRules]:
+    """None for assignments created before their rules were stored."""
+    return db.get(models.AssignmentRules, assignment_id)
+
+def get_assignment_package_usage(db: Session, assignment_id: int) -> Dict[int, int]:
+    """Number of students on each package of an assignment."""
+    rows = db.exec(select(models.AssignmentPackageUsage).where(models.AssignmentPackageUsage.assignment_id == assignment_id)).all()
+    if rows:
+        return {row.package_id: row.students for row in rows}
+    # Not counted yet (created before the counts were kept): count once, apply_assignment_changes stores the result
+    statement = select(models.StudentAssignment.package_id, func.count()).where(
+        models.StudentAssignment.assignment_id == assignment_id
+    ).group_by(models.StudentAssignment.package_id)
+    return {package_id: count for package_id, count in db.exec(statement).all()}
+
+def get_unassigned_students(db: Session, assignment_id: int, placed_through: Optional[int] = None) -> List[models.Student]:
+    """
+    Students without a row in the assignment, in roll order. With `placed_through` (see
+    AssignmentRules) only the students added since are read.
+    """
+    if placed_through is not None:
+        return db.exec(select(models.Student).where(models.Student.id > placed_through).order_by(models.Student.roll)).all()
+    assigned = select(models.StudentAssignment.student_id).where(models.StudentAssignment.assignment_id == assignment_id)
+    return db.exec(select(models.Student).where(models.Student.id.not_in(assigned)).order_by(models.Student.roll)).all()
+
+def get_student_assignments_on_packages(db: Session, assignment_id: int, package_ids: List[int]) -> List[Tuple[models.StudentAssignment, int, bool]]:
+    """(row, roll, has_submitted) for every student of the assignment on one of `package_ids`, in roll order."""
+    statement = select(models.StudentAssignment, models.Student.roll, models.Submission.id).join(
+        models.Student, models.StudentAssignment.student_id == models.Student.id
+    ).outerjoin(
+        models.Submission, models.StudentAssignment.id == models.Submission.student_assignment_id
+    ).where(
+        models.StudentAssignment.assignment_id == assignment_id,
+        models.StudentAssignment.package_id.in_(package_ids)
+    ).order_by(models.Student.roll)
+    return [(sa, roll, submission_id is not None) for sa, roll, submission_id in db.exec(statement).all()]
+
+def count_students_before(db: Session, roll: int) -> int:
+    """Position of `roll` in roll order, i.e. its seat index when seated row-major."""
+    return db.exec(select(func.count()).select_from(models.Student).where(models.Student.roll < roll)).one()
+
+def get_roll_neighbours(db: Session, assignment_id: int, roll: int, k: int) -> Tuple[List[Tuple[int, Optional[int]]], List[Tuple[int, Optional[int]]]]:
+    """(student_id, package_id or None) for the k students before `roll` (nearest first) and the k after it."""
+    base = select(models.Student.id, models.StudentAssignment.package_id).outerjoin(
+        models.StudentAssignment,
+        and_(models.StudentAssignment.student_id == models.Student.id, models.StudentAssignment.assignment_id == assignment_id)
+    )
+    before = db.exec(base.where(models.Student.roll < roll).order_by(models.Student.roll.desc()).limit(k)).all()
+    after = db.exec(base.where(models.Student.roll > roll).order_by(models.Student.roll).limit(k)).all()
+    return list(before), list(after)
+
+def apply_assignment_changes(db: Session, assignment_id: int, new_rows: List[dict], moves: Dict[int, int], usage: Dict[int, int],
+                             placed_through: Optional[int] = None) -> None:
+    """
+    Adds `new_rows` and points existing rows (by id) at new packages, in one transaction.
+    `usage` is the resulting number of students per package; `placed_through` advances the
+    assignment's AssignmentRules.
+    """
+    student_ids = set()
+    for sa_data in new_rows:
+        db.add(models.StudentAssignment(**sa_data, assignment_id=assignment_id))
+        student_ids.add(sa_data['student_id'])
+    for sa_id, package_id in moves.items():
+        sa = db.get(models.StudentAssignment, sa_id)
+        sa.package_id = package_id
+        db.add(sa)
+        student_ids.add(sa.student_id)
+    counted = {row.package_id: row for row in db.exec(select(models.AssignmentPackageUsage).where(models.AssignmentPackageUsage.assignment_id == assignment_id)).all()}
+    for package_id, row in counted.items():
+        if package_id not in usage:
+            db.delete(row)
+    for package_id, students in usage.items():
+        row = counted.get(package_id) or models.AssignmentPackageUsage(assignment_id=assignment_id, package_id=package_id)
+        row.students = students
+        db.add(row)
+    rules = db.get(models.AssignmentRules, assignment_id)
+    if rules is not None and placed_through is not None and placed_through > rules.placed_through:
+        rules.placed_through = placed_through
+        db.add(rules)
+    bump_versions(db, "assignments", f"assignment:{assignment_id}", *[f"student:{sid}" for sid in student_ids])
+    db.commit()
+    from app import package_cache
+    package_cache.warm(db, {sa_data['package_id'] for sa_data in new_rows} | set(moves.values()))
+
 # --- NEW FUNCTION ---
 def release_results_for_assignment(db: Session, assignment_id: int) -> Optional[models.Assignment]:
     """Finds an assignment and sets its results_released flag to True."""
@@ -107,22 +350,26 @@ def release_results_for_assignment(db: Session, assignment_id: int) -> Optional[
         return None
     assignment.results_released = True
     db.add(assignment)
+    bump_versions(db, "assignments", f"assignment:{assignment_id}")
     db.commit()
     db.refresh(assignment)
     return assignment
 
 # --- UPDATED FUNCTION ---
-def get_student_assignment(db: Session, assignment_id: int, student_roll: int) -> Optional[models.StudentAssignment]:
+def get_student_assignment(db: Session, assignment_id: int, student_roll: int, load_package: bool = True) -> Optional[models.StudentAssignment]:
+    """Pass load_package=False when the package is read through app.package_cache instead."""
     student = get_student_by_roll(db, student_roll)
     if not student: return None
+    options = [
+        selectinload(models.StudentAssignment.assignment), # Load assignment to check release status
+        selectinload(models.StudentAssignment.submission)
+    ]
+    if load_package:
+        options.append(selectinload(models.StudentAssignment.package).selectinload(models.Package.testcases))
     statement = select(models.StudentAssignment).where(
         models.StudentAssignment.assignment_id == assignment_id,
         models.StudentAssignment.student_id == student.id
-    ).options(
-        selectinload(models.StudentAssignment.package).selectinload(models.Package.testcases),
-        selectinload(models.StudentAssignment.assignment), # Load assignment to check release status
-        selectinload(models.StudentAssignment.submission)
-    )
+    ).options(*options)
     return db.exec(statement).first()
 
 # --- UPDATED FUNCTION ---
@@ -155,6 +402,17 @@ def get_assignments_for_student(db: Session, student_id: int) -> List[Dict[str,
             "results_released": results_released,
             "final_score": sub.final_score if sub and results_released else None
         })
+    from app import archive, package_cache
+    for entry in archive.entries_for_student(db, student_id):
+        package = package_cache.get_package(db, entry.package_id)
+        processed.append({
+            "assignment_id": entry.assignment_id,
+            "assignment_name": db.get(models.Assignment, entry.assignment_id).name,
+            "package_title": package.title if package else "",
+            "has_submitted": entry.submission_id is not None,
+            "results_released": True, # Only released assignments are archived
+            "final_score": entry.final_score
+        })
     return processed
 
 # --- UPDATED FUNCTION ---
@@ -164,7 +422,7 @@ def create_submission(db: Session, student_assignment_id: int, submission_data:
     
     if existing_submission:
         # Update existing submission
-        print(f"INFO: Updating existing submission for student_assignment_id {student_assignment_id}")
+        logger.info("Updating submission", extra={"student_assignment_id": student_assignment_id})
         existing_submission.code = submission_data.code
         existing_submission.submitted_at = datetime.utcnow()
         for key, value in results_data.items():
@@ -172,20 +430,42 @@ def create_submission(db: Session, student_assignment_id: int, submission_data:
         db_submission = existing_submission
     else:
         # Create new submission
-        print(f"INFO: Creating new submission for student_assignment_id {student_assignment_id}")
+        logger.info("Creating submission", extra={"student_assignment_id": student_assignment_id})
         db_submission = models.Submission(student_assignment_id=student_assignment_id, code=submission_data.code, **results_data)
     
     db.add(db_submission)
+    db.flush() # Assigns the id the fingerprints reference
+    student_assignment = db.get(models.StudentAssignment, student_assignment_id)
+    from app import similarity
+    similarity.index_submission(db, db_submission, student_assignment.assignment_id)
+    bump_versions(db, f"assignment:{student_assignment.assignment_id}", f"student:{student_assignment.student_id}")
     db.commit()
     db.refresh(db_submission)
     return db_submission
 
-def get_submissions_for_assignment(db: Session, assignment_id: int) -> List[models.Submission]:
-    statement = select(models.Submission).join(
+def get_submission(db: Session, submission_id: int) -> Optional[models.Submission]:
+    """Falls back to the archive; archived submissions come back detached."""
+    statement = select(models.Submission).where(models.Submission.id == submission_id).options(
+        selectinload(models.Submission.student_assignment).selectinload(models.StudentAssignment.student)
+    )
+    submission = db.exec(statement).first()
+    if submission is None:
+        from app import archive
+        submission = archive.submission(db, submission_id)
+    return submission
+
+def submissions_for_assignment_statement(assignment_id: int):
+    return select(models.Submission).join(
         models.StudentAssignment
     ).join(
         models.Student
     ).where(
         models.StudentAssignment.assignment_id == assignment_id
     ).options(selectinload(models.Submission.student_assignment).selectinload(models.StudentAssignment.student))
-    return db.exec(statement).all()
\ No newline at end of file
+
+def get_submissions_for_assignment(db: Session, assignment_id: int) -> List[models.Submission]:
+    """Reads archived assignments from their archive file; those submissions come back detached."""
+    from app import archive
+    if archive.is_archived(db, assignment_id):
+        return archive.submissions(db, assignment_id)
+    return db.exec(submissions_for_assignment_statement(assignment_id)).all()
\ No newline at end of file
@@ -1,4 +1,6 @@
 from sqlmodel import create_engine, SQLModel, Session
+from contextlib import contextmanager
+import hashlib
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -7,10 +9,61 @@ if not DATABASE_URL:
 
 engine = create_engine(DATABASE_URL, echo=False)
 
-def create_db_and_tables():
+STARTUP_LOCK_KEY = 72_0001 # Arbitrary, app-wide pg_advisory_lock key for schema creation and seeding
+
+@contextmanager
+def startup_lock():
+    """
+    Serializes startup work across uvicorn workers: a session-level advisory lock on
+    Postgres, an flock next to the database file on SQLite. Workers that wait find the
+    schema current and the data seeded, and skip both.
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy import text
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY})
+        return
+    path = engine.url.database if engine.dialect.name == "sqlite" else None
+    try:
+        import fcntl
+    except ImportError: # Windows; single-worker dev only
+        fcntl = None
+    if not path or path == ":memory:" or fcntl is None:
+        yield
+        return
+    with open(f"{path}.startup.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _schema_key() -> str:
+    """Digest of every table and column the models define; changes whenever the schema does."""
     from app import models # Import here to avoid circular dependency
+    shape = sorted((table.name, sorted(column.name for column in table.columns)) for table in SQLModel.metadata.tables.values())
+    return "schema:" + hashlib.sha256(repr(shape).encode()).hexdigest()[:16]
+
+def create_db_and_tables():
+    """Creates tables and the search index, unless this exact schema was already set up."""
+    from app import models, search_index
+    key = _schema_key()
+    try:
+        with Session(engine) as db:
+            if db.get(models.VersionStamp, key) is not None:
+                return
+    except Exception:
+        pass # Fresh database: the versionstamp table does not exist yet
     SQLModel.metadata.create_all(engine)
+    search_index.ensure_index(engine)
+    with Session(engine) as db:
+        db.add(models.VersionStamp(key=key, value=1))
+        db.commit()
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
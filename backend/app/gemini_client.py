@@ -1,17 +1,14 @@
 import httpx
 import json
 import uuid
+import time
 import asyncio
-import logging
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 
-# Import the official Google SDK
-import google.generativeai as genai
-# THIS IS THE FIX: Import 'types' and access submodules through it.
-from google.generativeai import types 
-
 # Import our project constants
-from app.constants import GEMINI_API_KEY, MODEL_FLASH, MODEL_PRO
+from app.constants import GEMINI_API_KEY, MODEL_FLASH, MODEL_PRO, PROMPT_TOKEN_BUDGETS
+from app import telemetry, prompt_compaction, llm_usage
 
 # Import dummy classes for type hinting
 try:
@@ -26,63 +23,86 @@ except ImportError:
             self.input, self.expected, self.type = input, expected, type
 
 # --- Configuration ---
-logger = logging.getLogger("gemini_client")
-logging.basicConfig(level=logging.INFO)
+logger = telemetry.get_logger("gemini_client")
 
-# Configure the genai client
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+if not GEMINI_API_KEY:
     logger.warning("GEMINI_API_KEY not set. Gemini calls will use canned fallbacks.")
 
-# --- THIS IS THE FIX ---
-# Use the correct `types.SafetySettingDict` as suggested by the error
-SAFETY_SETTINGS = [
-    {"category": types.HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": "BLOCK_NONE"},
-    {"category": types.HarmCategory.HARM_CATEGORY_HATE_SPEECH, "threshold": "BLOCK_NONE"},
-    {"category": types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, "threshold": "BLOCK_NONE"},
-    {"category": types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, "threshold": "BLOCK_NONE"}
-]
-
-# Use the correct `types.GenerationConfig`
-JSON_GENERATION_CONFIG = types.GenerationConfig(
-    response_mime_type="application/json"
-)
+@lru_cache(maxsize=None)
+def _sdk():
+    """
+    Imports and configures the Google SDK on first use. It takes a large share of worker
+    boot time and is not needed at all without a key.
+    Returns (genai, safety_settings, json_generation_config).
+    """
+    import google.generativeai as genai
+    # Import 'types' and access submodules through it.
+    from google.generativeai import types
+    genai.configure(api_key=GEMINI_API_KEY)
+    safety_settings = [
+        {"category": types.HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": "BLOCK_NONE"},
+        {"category": types.HarmCategory.HARM_CATEGORY_HATE_SPEECH, "threshold": "BLOCK_NONE"},
+        {"category": types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, "threshold": "BLOCK_NONE"},
+        {"category": types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, "threshold": "BLOCK_NONE"}
+    ]
+    json_generation_config = types.GenerationConfig(response_mime_type="application/json")
+    return genai, safety_settings, json_generation_config
 # --- END FIX ---
 
 # ---- Internal Helper ----
-async def _call_gemini_api(prompt_parts: List[Any], model_name: str) -> Dict[str, Any]:
+async def _call_gemini_api(prompt_parts: List[Any], model_name: str, purpose: str = "other",
+                           assignment_id: Optional[int] = None, teacher_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Internal function to call a specific Gemini model with a list of prompt parts
-    (which can be text or images/PDFs).
+    (which can be text or images/PDFs). Every call is recorded in app.llm_usage under
+    `purpose` and the assignment or teacher it was made for.
     """
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY is not configured.")
 
+    start, outcome, response = time.perf_counter(), "error", None
     try:
-        print(f"INFO: Calling Gemini API. Model: {model_name}. Prompt parts count: {len(prompt_parts)}")
+        genai, safety_settings, json_generation_config = _sdk()
         model = genai.GenerativeModel(model_name)
         
         # Make the API call
         response = await model.generate_content_async(
             prompt_parts,
-            generation_config=JSON_GENERATION_CONFIG,
-            safety_settings=SAFETY_SETTINGS
+            generation_config=json_generation_config,
+            safety_settings=safety_settings
         )
-        
-        # Log the raw text response for debugging
-        print("\n--- RAW GEMINI API RESPONSE ---")
-        print(response.text)
-        print("-----------------------------\n")
+        outcome = "invalid_json"
 
         # Parse the JSON response text
-        return json.loads(response.text)
+        parsed = json.loads(response.text)
+        outcome = "ok"
+        return parsed
         
     except Exception as e:
-        logger.error(f"Error calling Gemini ({model_name}): {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error("Gemini call failed", extra={"model": model_name, "outcome": outcome, "error": str(e)})
+        # The raw response is only logged at DEBUG level; it can be very long and contain student code
+        if outcome == "invalid_json":
+            logger.debug("Unparseable Gemini response", extra={"model": model_name, "response": response.text})
         raise e # Re-raise the exception to be handled by the calling function
+    finally:
+        elapsed = time.perf_counter() - start
+        telemetry.LLM_CALLS.inc(model_name, outcome)
+        telemetry.LLM_SECONDS.observe(elapsed, model_name)
+        logger.info("Gemini call", extra={"model": model_name, "purpose": purpose, "parts": len(prompt_parts), "outcome": outcome, "seconds": round(elapsed, 3)})
+        prompt_tokens, response_tokens, estimated = _token_counts(prompt_parts, response)
+        llm_usage.record(model_name, purpose, outcome, prompt_tokens, response_tokens, estimated, elapsed, assignment_id, teacher_id)
+
+def _token_counts(prompt_parts: List[Any], response: Any):
+    """(prompt tokens, response tokens, estimated) from the response's usage metadata, else estimated from text."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None and getattr(usage, "prompt_token_count", None) is not None:
+        return int(usage.prompt_token_count), int(getattr(usage, "candidates_token_count", 0) or 0), False
+    try:
+        text = response.text if response is not None else ""
+    except Exception:
+        text = "" # Blocked or empty candidates
+    prompt = "".join(part for part in prompt_parts if isinstance(part, str))
+    return prompt_compaction.estimate_tokens(prompt), prompt_compaction.estimate_tokens(text), True
 
 # ---- Public Client Functions with Routing ----
 
@@ -90,7 +110,8 @@ async def generate_questions(
     topic: str, 
     difficulty: str, 
     n_questions: int, 
-    source_material: Optional[Any] = None # Can be PIL Image or PDF blob
+    source_material: Optional[Any] = None, # Can be PIL Image or PDF blob
+    teacher_id: Optional[int] = None # Whose LLM budget the call counts against
 ) -> List[Dict[str, Any]]:
     """
     Generates programming questions.
@@ -100,6 +121,8 @@ async def generate_questions(
     if not GEMINI_API_KEY:
         logger.warning("GEMINI_API_KEY not set. Returning canned questions.")
         return _get_canned_questions(n_questions)
+    if await llm_usage.route(MODEL_FLASH, "generate_questions", teacher_id=teacher_id) is None:
+        return _get_canned_questions(n_questions)
 
     prompt_parts = []
     
@@ -138,19 +161,20 @@ async def generate_questions(
     IMPORTANT JSON FORMATTING INSTRUCTIONS:
     1. You MUST respond with a single, perfectly-formed JSON object and nothing else.
     2. The root of the JSON object MUST be a key named "packages", which is a list of question objects.
-    3. Every single question object in the "packages" list MUST contain the following keys: "title", "prompt", "difficulty", and "testcases".
+    3. Every single question object in the "packages" list MUST contain the following keys: "title", "prompt", "difficulty", "testcases", and "solution".
     4. The "title" key is MANDATORY and must be a short, descriptive string.
     5. The "prompt" key must be a detailed string in MARKDOWN format, including examples and constraints.
     6. The "difficulty" key MUST be the string "{difficulty}".
     7. The "testcases" key MUST be a list of EXACTLY 5 test case objects.
     8. Each of the 5 test case objects MUST have the following 4 keys: "type" ("sample" or "hidden"), "input" (string), "expected" (string), and "points" (int).
     9. The "points" for all 5 test cases MUST sum to exactly 100.
+    10. The "solution" key MUST be a complete, efficient Python 3 reference program that reads the test case "input" from stdin and prints exactly the "expected" output for ALL 5 test cases. It is run against them before the question is accepted, and its running time sets the time limits.
     Return only valid JSON.
     """)
 
     try:
         # ROUTE TO FLASH MODEL (it's multi-modal and fast)
-        response_data = await _call_gemini_api(prompt_parts, model_name=MODEL_FLASH)
+        response_data = await _call_gemini_api(prompt_parts, model_name=MODEL_FLASH, purpose="generate_questions", teacher_id=teacher_id)
         if isinstance(response_data, dict) and "packages" in response_data and isinstance(response_data["packages"], list):
             return response_data["packages"]
         else:
@@ -160,18 +184,35 @@ async def generate_questions(
         logger.error(f"Error calling Gemini ({MODEL_FLASH}) for generate_questions: {e}")
         return []
 
-def _short(text: str, n: int = 2000) -> str:
-    """Helper to truncate text for logging."""
-    return (text[:n] + "...(truncated)") if len(text) > n else text
-    
-async def classify_error(run_result: RunResult, code: str, testcase: TestCase) -> Dict[str, str]:
-    """Classifies errors. ROUTING: Uses FLASH model."""
+def _compacted(call: str, model_name: str, prompt: str, raw_tokens: int) -> str:
+    """Records how much compaction saved on one call."""
+    tokens = prompt_compaction.estimate_tokens(prompt)
+    telemetry.LLM_TOKENS_SAVED.inc(model_name, amount=max(0, raw_tokens - tokens))
+    logger.info("Prompt compacted", extra={"call": call, "model": model_name, "tokens": tokens, "saved": max(0, raw_tokens - tokens)})
+    return prompt
+
+async def classify_error(run_result: RunResult, code: str, testcase: TestCase, assignment_id: Optional[int] = None) -> Dict[str, str]:
+    """Classifies errors. ROUTING: Uses FLASH model, or the canned answer past the assignment's LLM budget."""
     if not GEMINI_API_KEY: return _get_canned_error_classification(run_result)
-    summary = f"Input: {testcase.input}, Expected: {testcase.expected}, STDOUT: {_short(run_result.stdout)}, STDERR: {_short(run_result.stderr)}, Timed Out: {run_result.timed_out}"
-    prompt = f"""Classify the primary error from this Python code execution into ONE category: 'compile_error', 'runtime_error', 'timeout', 'wrong_output', 'logic_bug'. Respond ONLY with JSON: {{"error_type": "...", "explain": "Short explanation..."}}\n\nCode:\n```python\n{_short(code)}\n```\nExecution:\n{summary}"""
+    if await llm_usage.route(MODEL_FLASH, "classify_error", assignment_id=assignment_id) is None:
+        return _get_canned_error_classification(run_result)
+    instructions = """Classify the primary error from this Python code execution into ONE category: 'compile_error', 'runtime_error', 'timeout', 'wrong_output', 'logic_bug'. Respond ONLY with JSON: {"error_type": "...", "explain": "Short explanation..."}"""
+    given, expected = str(testcase.input), str(testcase.expected)
+    # The execution summary gets up to a third of what the instructions leave; the code gets the rest
+    room = PROMPT_TOKEN_BUDGETS[MODEL_FLASH] - prompt_compaction.estimate_tokens(instructions) - 50
+    share = room // 12
+    summary = (
+        f"Input: {prompt_compaction.clip(given, share)}\nExpected: {prompt_compaction.clip(expected, share)}\n"
+        f"STDOUT: {prompt_compaction.summarize_stdout(run_result.stdout, expected, share)}\n"
+        f"STDERR: {prompt_compaction.summarize_stderr(run_result.stderr, share)}\nTimed Out: {run_result.timed_out}"
+    )
+    compact = prompt_compaction.compact_code(code, room - prompt_compaction.estimate_tokens(summary))
+    prompt = f"""{instructions}\n\nCode:\n```python\n{compact}\n```\nExecution:\n{summary}"""
+    raw = prompt_compaction.estimate_tokens(instructions + code + given + expected + run_result.stdout + run_result.stderr)
+    prompt = _compacted("classify_error", MODEL_FLASH, prompt, raw)
     try:
         # ROUTE TO FLASH MODEL
-        response_data = await _call_gemimni_api([prompt], model_name=MODEL_FLASH)
+        response_data = await _call_gemini_api([prompt], model_name=MODEL_FLASH, purpose="classify_error", assignment_id=assignment_id)
         if isinstance(response_data, dict) and "error_type" in response_data:
             return {"error_type": str(response_data.get("error_type", "unknown")), "explain": str(response_data.get("explain", "AI classification failed."))}
         else:
@@ -179,13 +220,20 @@ async def classify_error(run_result: RunResult, code: str, testcase: TestCase) -
     except Exception:
         return _get_canned_error_classification(run_result)
 
-async def code_quality(code: str) -> Dict[str, Any]:
-    """Scores code quality. ROUTING: Uses PRO model."""
+async def code_quality(code: str, assignment_id: Optional[int] = None) -> Dict[str, Any]:
+    """Scores code quality. ROUTING: Uses PRO model; FLASH, then the canned answer, past the assignment's LLM budget."""
     if not GEMINI_API_KEY: return {"score": 75, "comments": ["Canned response."]}
-    prompt = f"""Rate the quality of this Python code (readability, efficiency, best practices) from 0 to 100. Provide 2-3 brief comments. Respond ONLY with JSON: {{"score": <int>, "comments": ["...", "..."]}}\n\nCode:\n```python\n{_short(code)}\n```"""
+    model_name = await llm_usage.route(MODEL_PRO, "code_quality", assignment_id=assignment_id)
+    if model_name is None: return {"score": 75, "comments": ["Canned response."]}
+    instructions = """Rate the quality of this Python code (readability, efficiency, best practices) from 0 to 100. Provide 2-3 brief comments. Respond ONLY with JSON: {"score": <int>, "comments": ["...", "..."]}"""
+    # Comments and docstrings count towards readability, so they are only dropped when the code does not fit otherwise
+    room = PROMPT_TOKEN_BUDGETS[model_name] - prompt_compaction.estimate_tokens(instructions) - 20
+    compact = prompt_compaction.compact_code(code, room, keep_comments=True)
+    prompt = f"""{instructions}\n\nCode:\n```python\n{compact}\n```"""
+    prompt = _compacted("code_quality", model_name, prompt, prompt_compaction.estimate_tokens(instructions + code))
     try:
-        # ROUTE TO PRO MODEL
-        response_data = await _call_gemini_api([prompt], model_name=MODEL_PRO)
+        # ROUTE TO PRO MODEL (or the budget's downgrade)
+        response_data = await _call_gemini_api([prompt], model_name=model_name, purpose="code_quality", assignment_id=assignment_id)
         if isinstance(response_data, dict) and "score" in response_data and "comments" in response_data:
             return {"score": int(response_data.get("score", 70)), "comments": list(response_data.get("comments", []))}
         else:
@@ -0,0 +1,48 @@
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+from app import runner
+
+# Testcase groups (weighted subtasks). A group's cases run in one sandboxed process
+# (runner.execute_group), and their verdicts fold into a single test result entry per group:
+# `verdicts` holds one "1"/"0" per case, the output shown is that of the first failing case,
+# and `earned` is the group's points if every case passed ("all"), or its share of them
+# ("partial").
+
+
+def digest(group) -> str:
+    """Changes whenever any case's input, expected output or time limit does; regrade keys on it."""
+    h = hashlib.sha256()
+    for tc in group.testcases:
+        for part in (tc.input, tc.expected, repr(tc.time_limit)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+    return h.hexdigest()[:16]
+
+def earned(group, passed_cases: int) -> float:
+    total = len(group.testcases)
+    if not total:
+        return 0.0
+    if group.scoring == "partial":
+        return group.points * passed_cases / total
+    return float(group.points) if passed_cases == total else 0.0
+
+def first_failure(group, results: List[runner.RunResult]) -> Optional[Tuple[runner.RunResult, Any]]:
+    for tc, result in zip(group.testcases, results):
+        if not runner.judge(result, tc.expected):
+            return result, tc
+    return None
+
+def entry(group, results: List[runner.RunResult]) -> Dict[str, Any]:
+    verdicts = "".join("1" if runner.judge(result, tc.expected) else "0" for tc, result in zip(group.testcases, results))
+    passed_cases = verdicts.count("1")
+    failure = first_failure(group, results)
+    shown = failure[0] if failure else None
+    return {
+        "group_id": group.id, "name": group.name, "scoring": group.scoring, "points": group.points,
+        "earned": earned(group, passed_cases), "passed": passed_cases == len(results), "cases": len(results),
+        "passed_cases": passed_cases, "verdicts": verdicts, "type": "hidden",
+        "first_failed_case": verdicts.find("0") if failure else None,
+        "stdout": shown.stdout if shown else "", "stderr": shown.stderr if shown else "",
+        "runtime": round(sum(result.runtime for result in results), 4), "timed_out": any(result.timed_out for result in results),
+        "group_digest": digest(group)
+    }
@@ -1,84 +1,85 @@
 import os
 import random
 import string
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from sqlmodel import Session, select
 from app.database import engine
 from app import models, auth, crud
 from app.constants import GEMINI_API_KEY
+from app import telemetry
+
+logger = telemetry.get_logger("init_db")
 
 async def initialize_database():
+    """
+    Seeds the teacher, students and their codes into an empty database, in one commit.
+    Run under database.startup_lock() so concurrent workers don't race.
+    """
     with Session(engine) as session:
         teacher_exists = session.exec(select(models.Teacher)).first() is not None
         if teacher_exists:
-            print("INFO:     Database already seeded.")
+            logger.info("Database already seeded.")
             return
         
-        print("INFO:     Database is empty, seeding initial data...")
+        logger.info("Database is empty, seeding initial data...")
         
         # 1. Create Teacher
         teacher_username = os.getenv("TEACHER_USERNAME", "teacher")
         teacher_password = os.getenv("TEACHER_PASSWORD", "teachpass")
-        teacher_in = models.Teacher(username=teacher_username, hashed_password=auth.get_password_hash(teacher_password))
-        session.add(teacher_in)
-        session.commit() # Commit teacher first
-        print(f"INFO:     Teacher '{teacher_username}' created.")
-        
-        # 2. Create Students and Codes
         student_dob = date(2005, 1, 1)
-        hashed_dob_str = student_dob.isoformat()
-        hashed_dob = auth.get_password_hash(hashed_dob_str)
+        codes = [f"code-{roll}-{''.join(random.choices(string.ascii_lowercase + string.digits, k=6))}" for roll in range(1, 73)]
+
+        # bcrypt releases the GIL, so the 74 hashes run in parallel instead of one after another
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+            hashed_password, hashed_dob, *hashed_codes = pool.map(auth.get_password_hash, [teacher_password, student_dob.isoformat(), *codes])
+
+        session.add(models.Teacher(username=teacher_username, hashed_password=hashed_password))
+        logger.info(f"Teacher '{teacher_username}' created.")
         
+        # 2. Create Students and Codes
+        students = [models.Student(roll=i, username=f"23AM{i:03d}", dob=student_dob, hashed_dob=hashed_dob) for i in range(1, 73)]
+        session.add_all(students)
+        session.flush() # Student ids for the codes, without a commit per row
         codes_plaintext_for_file = []
-        
-        for i in range(1, 73):
-            # Create student
-            student = models.Student(
-                roll=i,
-                username=f"23AM{i:03d}",
-                dob=student_dob,
-                hashed_dob=hashed_dob
-            )
-            session.add(student)
-            session.commit() # Commit each student to get their ID
-            session.refresh(student)
-            
-            # Create a unique code for this student
-            code_str = f"code-{student.roll}-{''.join(random.choices(string.ascii_lowercase + string.digits, k=6))}"
-            hashed_code = auth.get_password_hash(code_str)
-            
-            teacher_code = models.TeacherCode(
-                hashed_code=hashed_code,
-                student_id=student.id, # Link code to the student
-                is_used=False
-            )
-            session.add(teacher_code)
-            
+        for student, code_str, hashed_code in zip(students, codes, hashed_codes):
+            # Link a unique code to each student
+            session.add(models.TeacherCode(hashed_code=hashed_code, student_id=student.id, is_used=False))
             # Add code to list for seed_codes.txt
             codes_plaintext_for_file.append(f"Roll: {student.roll} | Username: {student.username} | Code: {code_str}")
 
-        print("INFO:     72 students and 72 unique codes created.")
+        logger.info("72 students and 72 unique codes created.")
             
         # 3. Save plaintext codes to file
         codes_file_path = "seed_codes.txt"
         try:
             with open(codes_file_path, "w") as f:
                 f.write("\n".join(codes_plaintext_for_file))
-            print(f"INFO:     Plaintext student codes saved to {codes_file_path}")
+            logger.info(f"Plaintext student codes saved to {codes_file_path}")
         except Exception as e:
-            print(f"WARN:     Could not write {codes_file_path}: {e}")
+            logger.warning(f"Could not write {codes_file_path}: {e}")
         
         # 4. Seed sample packages
         if not GEMINI_API_KEY:
-            print("INFO:     GEMINI_API_KEY not set. Seeding 2 sample packages.")
+            logger.info("GEMINI_API_KEY not set. Seeding 2 sample packages.")
             from app.gemini_client import _get_canned_questions
             for pkg_data in _get_canned_questions(2):
                 crud.create_package_with_testcases(session, pkg_data)
         
         try:
             session.commit() # Commit codes and packages
-            print("INFO:     Database seeding complete.")
+            logger.info("Database seeding complete.")
         except Exception as e:
             session.rollback()
-            print(f"ERROR:    Database seeding failed: {e}")
-            raise
\ No newline at end of file
+            logger.error(f"Database seeding failed: {e}")
+            raise
+
+if __name__ == "__main__":
+    # One-shot setup, for deployments that start workers with SEED_ON_STARTUP=false:
+    #   cd backend && python -m app.init_db
+    from app.database import create_db_and_tables, startup_lock
+    telemetry.configure_logging()
+    with startup_lock():
+        create_db_and_tables()
+        asyncio.run(initialize_database())
@@ -0,0 +1,196 @@
+import time
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlmodel import Session, select
+from app import models, telemetry
+from app.database import engine
+from app.constants import (
+    MODEL_FLASH, MODEL_PRO, LLM_ASSIGNMENT_TOKEN_BUDGET, LLM_TEACHER_DAILY_TOKEN_BUDGET, LLM_HARD_BUDGET_FACTOR,
+    LLM_USAGE_FLUSH_SECONDS, LLM_USAGE_BATCH_SIZE, LLM_USAGE_MAX_BUFFER, LLM_BUDGET_CACHE_SECONDS
+)
+
+# Accounting and budget caps for Gemini calls.
+# gemini_client records every call with record(), which only appends to an in-memory
+# buffer; a background task started with the app writes the buffer to LlmCall in batches.
+# route() picks the model for a call from the budgets of the assignment or teacher it is
+# made for: spending is the stored total (cached per worker for LLM_BUDGET_CACHE_SECONDS)
+# plus what this worker has recorded but not written yet. Other workers' calls show up
+# once they are flushed and the cache expires, so a cap can be overshot by that much.
+
+logger = telemetry.get_logger("llm_usage")
+
+_lock = threading.Lock()
+_buffer: List[Dict[str, Any]] = []
+_unflushed: Dict[str, int] = defaultdict(int) # Budget scope -> tokens recorded here, not yet stored
+_stored: Dict[str, Tuple[float, int]] = {} # Budget scope -> (fetched at, stored tokens)
+_wake = asyncio.Event()
+_flusher: Optional[asyncio.Task] = None
+
+
+def _scopes(assignment_id: Optional[int], teacher_id: Optional[int], when: datetime) -> List[Tuple[str, int]]:
+    """(scope key, budget) of each capped scope a call counts against."""
+    scopes = []
+    if assignment_id is not None and LLM_ASSIGNMENT_TOKEN_BUDGET > 0:
+        scopes.append((f"assignment:{assignment_id}", LLM_ASSIGNMENT_TOKEN_BUDGET))
+    if teacher_id is not None and LLM_TEACHER_DAILY_TOKEN_BUDGET > 0:
+        scopes.append((f"teacher:{teacher_id}:{when.date().isoformat()}", LLM_TEACHER_DAILY_TOKEN_BUDGET))
+    return scopes
+
+def _uncount(rows: List[Dict[str, Any]]) -> None:
+    """Takes rows that leave the buffer out of _unflushed. Call with _lock held."""
+    for row in rows:
+        for scope, _ in _scopes(row["assignment_id"], row["teacher_id"], row["created_at"]):
+            _unflushed[scope] -= row["prompt_tokens"] + row["response_tokens"]
+
+def record(model: str, purpose: str, outcome: str, prompt_tokens: int = 0, response_tokens: int = 0, estimated: bool = False,
+           seconds: float = 0.0, assignment_id: Optional[int] = None, teacher_id: Optional[int] = None) -> None:
+    """Queues one call for the next batch write. Never blocks on the database."""
+    now = datetime.utcnow()
+    row = {"created_at": now, "model": model, "purpose": purpose, "outcome": outcome, "prompt_tokens": prompt_tokens,
+           "response_tokens": response_tokens, "estimated": estimated, "seconds": round(seconds, 3),
+           "assignment_id": assignment_id, "teacher_id": teacher_id}
+    with _lock:
+        if len(_buffer) >= LLM_USAGE_MAX_BUFFER:
+            _uncount([_buffer.pop(0)]) # The database has been unreachable for a while; keep the newest
+        _buffer.append(row)
+        for scope, _ in _scopes(assignment_id, teacher_id, now):
+            _unflushed[scope] += prompt_tokens + response_tokens
+        full = len(_buffer) >= LLM_USAGE_BATCH_SIZE
+    if full:
+        _wake.set()
+
+def flush() -> int:
+    """Writes the buffered calls in one transaction; returns how many. Safe to call from any thread."""
+    with _lock:
+        rows = _buffer[:]
+        del _buffer[:]
+    if not rows:
+        return 0
+    try:
+        with Session(engine) as db:
+            db.add_all([models.LlmCall(**row) for row in rows])
+            db.commit()
+    except Exception:
+        logger.exception("Writing LLM usage failed", extra={"calls": len(rows)})
+        with _lock:
+            _buffer[:0] = rows # Retried with the next batch
+            dropped = max(0, len(_buffer) - LLM_USAGE_MAX_BUFFER)
+            _uncount(_buffer[:dropped])
+            del _buffer[:dropped]
+        return 0
+    with _lock:
+        _uncount(rows)
+        for row in rows:
+            for scope, _ in _scopes(row["assignment_id"], row["teacher_id"], row["created_at"]):
+                _stored.pop(scope, None) # Now part of the stored total
+    return len(rows)
+
+async def _flush_loop() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=LLM_USAGE_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        await asyncio.to_thread(flush)
+
+def start() -> None:
+    """Starts the background writer; called from the app's lifespan."""
+    global _flusher
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.create_task(_flush_loop())
+
+async def stop() -> None:
+    """Stops the writer and writes whatever is still buffered."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        _flusher = None
+    await asyncio.to_thread(flush)
+
+def _stored_tokens(scope: str) -> int:
+    kind, key, *day = scope.split(":")
+    tokens = func.coalesce(func.sum(models.LlmCall.prompt_tokens + models.LlmCall.response_tokens), 0)
+    statement = select(tokens)
+    if kind == "assignment":
+        statement = statement.where(models.LlmCall.assignment_id == int(key))
+    else:
+        start = datetime.fromisoformat(day[0])
+        statement = statement.where(models.LlmCall.teacher_id == int(key), models.LlmCall.created_at >= start, models.LlmCall.created_at < start + timedelta(days=1))
+    with Session(engine) as db:
+        return int(db.exec(statement).one())
+
+def _spent(scope: str) -> int:
+    with _lock:
+        cached = _stored.get(scope)
+    if cached is None or time.monotonic() - cached[0] > LLM_BUDGET_CACHE_SECONDS:
+        cached = (time.monotonic(), _stored_tokens(scope))
+        with _lock:
+            _stored[scope] = cached
+    with _lock:
+        return cached[1] + _unflushed[scope]
+
+async def route(model: str, purpose: str, assignment_id: Optional[int] = None, teacher_id: Optional[int] = None) -> Optional[str]:
+    """
+    The model a call should use under the budgets: `model` itself, MODEL_FLASH in place of
+    MODEL_PRO, or None for the canned fallback (recorded with outcome "budget").
+    """
+    scopes = _scopes(assignment_id, teacher_id, datetime.utcnow())
+    if not scopes:
+        return model
+    try:
+        spent = await asyncio.to_thread(lambda: [_spent(scope) / budget for scope, budget in scopes])
+    except Exception:
+        logger.exception("Reading LLM usage failed; not enforcing budgets")
+        return model
+    used = max(spent)
+    routed = model
+    if used >= LLM_HARD_BUDGET_FACTOR:
+        routed = None
+    elif used >= 1:
+        routed = MODEL_FLASH if model == MODEL_PRO else None
+    if routed != model:
+        telemetry.LLM_DOWNGRADES.inc(model, routed or "fallback")
+        logger.info("LLM budget exceeded", extra={"purpose": purpose, "model": model, "routed": routed, "used": round(used, 3), "assignment_id": assignment_id, "teacher_id": teacher_id})
+    if routed is None:
+        record(model, purpose, "budget", assignment_id=assignment_id, teacher_id=teacher_id)
+    return routed
+
+def summary(db: Session, assignment_id: Optional[int] = None, teacher_id: Optional[int] = None, since: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Stored totals, optionally filtered: overall, by (model, purpose, outcome), and by
+    assignment and teacher with the share of their current budget used.
+    """
+    flush() # Include this worker's latest calls
+    filters = []
+    if assignment_id is not None:
+        filters.append(models.LlmCall.assignment_id == assignment_id)
+    if teacher_id is not None:
+        filters.append(models.LlmCall.teacher_id == teacher_id)
+    if since is not None:
+        filters.append(models.LlmCall.created_at >= since)
+    tokens = func.sum(models.LlmCall.prompt_tokens + models.LlmCall.response_tokens)
+    columns = (models.LlmCall.model, models.LlmCall.purpose, models.LlmCall.outcome)
+    statement = select(*columns, func.count(), func.sum(models.LlmCall.prompt_tokens), func.sum(models.LlmCall.response_tokens),
+                       func.sum(models.LlmCall.seconds)).where(*filters).group_by(*columns).order_by(*columns)
+    groups = [
+        {"model": model, "purpose": purpose, "outcome": outcome, "calls": calls, "prompt_tokens": int(prompt or 0),
+         "response_tokens": int(response or 0), "seconds": round(float(seconds or 0), 3)}
+        for model, purpose, outcome, calls, prompt, response, seconds in db.exec(statement).all()
+    ]
+    totals = {key: sum(group[key] for group in groups) for key in ("calls", "prompt_tokens", "response_tokens")}
+    totals["seconds"] = round(sum(group["seconds"] for group in groups), 3)
+
+    def by(column, scope):
+        statement = select(column, func.count(), tokens).where(column.is_not(None), *filters).group_by(column).order_by(column)
+        rows = []
+        for key, calls, used in db.exec(statement).all():
+            budget = _scopes(key, None, datetime.utcnow()) if scope == "assignment" else _scopes(None, key, datetime.utcnow())
+            rows.append({f"{scope}_id": key, "calls": calls, "tokens": int(used or 0),
+                         "budget_used": round(_spent(budget[0][0]) / budget[0][1], 3) if budget else None})
+        return rows
+    return {**totals, "groups": groups, "assignments": by(models.LlmCall.assignment_id, "assignment"), "teachers": by(models.LlmCall.teacher_id, "teacher")}
@@ -1,29 +1,68 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
-from app.database import create_db_and_tables
+from app.database import create_db_and_tables, startup_lock
 from app.api import api_router
-from app import init_db
+from app import init_db, regrade, telemetry, llm_usage, workload_trace
+from app.constants import SEED_ON_STARTUP
+
+telemetry.configure_logging()
+logger = telemetry.get_logger("main")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Runs on startup
-    print("INFO:     Starting up...")
-    create_db_and_tables() # Create tables if they don't exist
-    await init_db.initialize_database() # Seed the database
-    print("INFO:     Application startup complete.")
+    logger.info("Starting up...")
+    with startup_lock(): # One worker at a time; the rest find the work done
+        create_db_and_tables() # Create tables unless the schema is already current
+        if SEED_ON_STARTUP:
+            await init_db.initialize_database() # Seed the database
+    regrade.resume_pending() # Pick up regrades interrupted by a restart
+    llm_usage.start() # Batched writer for Gemini call records
+    workload_trace.start() # Only when WORKLOAD_TRACE_DIR is set
+    logger.info("Application startup complete.")
     yield
     # Runs on shutdown
-    print("INFO:     Shutting down...")
+    logger.info("Shutting down...")
+    await llm_usage.stop()
+    await workload_trace.stop()
 
 app = FastAPI(
     title="AutoAssess-MVP",
     description="An AI-based auto-assessment tool.",
     version="0.1.0",
-    lifespan=lifespan # Use the lifespan context manager
+    lifespan=lifespan, # Use the lifespan context manager
+    default_response_class=ORJSONResponse
 )
 
+# Compress larger responses (package prompts are long Markdown). Brotli is used when
+# brotli-asgi is installed; it falls back to gzip for clients that don't accept br.
+# Both buffer output until the compressor flushes, which holds server-sent events back
+# until the stream ends, so event streams (/stream routes, or a request that accepts
+# text/event-stream) bypass compression; their events are small anyway.
+COMPRESSION_MIN_SIZE = 1024
+
+class CompressionExceptStreams:
+    def __init__(self, app, compressor, **options):
+        self.app = app
+        self.compressed = compressor(app, **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["path"].endswith("/stream") or any(
+                name == b"accept" and b"text/event-stream" in value for name, value in scope["headers"])):
+            await self.app(scope, receive, send)
+        else:
+            await self.compressed(scope, receive, send)
+
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(CompressionExceptStreams, compressor=BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(CompressionExceptStreams, compressor=GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 # Allow requests from our frontend
 app.add_middleware(
     CORSMiddleware,
@@ -33,10 +72,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so request latency includes compression
+app.add_middleware(telemetry.MetricsMiddleware)
+
 # Include all the API routes defined in api.py
 app.include_router(api_router, prefix="/api")
 
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Simple health check endpoint."""
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+def metrics():
+    """Prometheus scrape endpoint: request/stage latency, sandbox queue depth, Gemini calls."""
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,6 @@
 from typing import List, Optional, Dict, Any
 from sqlmodel import Field, SQLModel, Relationship, JSON, Column
+from sqlalchemy import LargeBinary, Index, BigInteger
 from datetime import date, datetime
 
 # --- User Models ---
@@ -70,6 +71,23 @@ class StudentAssignment(SQLModel, table=True):
     assignment: "Assignment" = Relationship(back_populates="student_assignments")
     submission: Optional["Submission"] = Relationship(back_populates="student_assignment")
 
+# How an assignment's packages were spread (see app.assignment_logic), kept so that later
+# placements follow the same rules. Side table: create_all cannot add columns to Assignment.
+class AssignmentRules(SQLModel, table=True):
+    assignment_id: int = Field(foreign_key="assignment.id", primary_key=True)
+    adjacency_distance: int
+    seat_rows: Optional[int] = None
+    seat_cols: Optional[int] = None
+    neighbourhood: int = 4
+    # Highest Student.id placed so far; students after it are the ones still to place
+    placed_through: int = 0
+
+# Number of students on each package of an assignment, kept up to date by the crud writes
+class AssignmentPackageUsage(SQLModel, table=True):
+    assignment_id: int = Field(foreign_key="assignment.id", primary_key=True)
+    package_id: int = Field(foreign_key="package.id", primary_key=True)
+    students: int = 0
+
 class Submission(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     # --- THIS IS UPDATED ---
@@ -87,6 +105,155 @@ class Submission(SQLModel, table=True):
     error_counts: Dict[str, Any] = Field(sa_column=Column(JSON))
     student_assignment: "StudentAssignment" = Relationship(back_populates="submission")
 
+# MinHash signature and near-duplicate cluster of a package (see app.near_duplicates)
+class PackageSignature(SQLModel, table=True):
+    package_id: int = Field(foreign_key="package.id", primary_key=True)
+    signature: List[int] = Field(sa_column=Column(JSON))
+    # Packages sharing a cluster_id are treated as the same question when assigning
+    cluster_id: int = Field(index=True)
+    duplicate_of: Optional[int] = Field(default=None, foreign_key="package.id")
+    similarity: Optional[float] = None
+
+# One row per (LSH band, bucket) a package's signature falls into
+class LshBucket(SQLModel, table=True):
+    __table_args__ = (Index("ix_lshbucket_band_bucket", "band", "bucket"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    band: int
+    bucket: str
+    package_id: int = Field(foreign_key="package.id")
+
+# Winnowed fingerprint of a submission's normalized tokens; an inverted index for app.similarity
+class CodeFingerprint(SQLModel, table=True):
+    __table_args__ = (Index("ix_codefingerprint_assignment_hash", "assignment_id", "hash"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    submission_id: int = Field(foreign_key="submission.id", index=True)
+    assignment_id: int = Field(foreign_key="assignment.id")
+    hash: int = Field(sa_column=Column(BigInteger, nullable=False))
+
+# Progress of a bulk regrade; last_submission_id is the resume point (see app.regrade)
+class RegradeJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    assignment_id: int = Field(foreign_key="assignment.id", index=True)
+    status: str = Field(default="running") # running | completed | failed
+    total: int = 0
+    done: int = 0
+    changed: int = 0
+    last_submission_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+# The running RegradeJob of an assignment (the primary key allows one) and the worker that
+# holds it until lease_until; deleted when the job finishes (see app.regrade)
+class RegradeClaim(SQLModel, table=True):
+    assignment_id: int = Field(foreign_key="assignment.id", primary_key=True)
+    job_id: int = Field(foreign_key="regradejob.id", unique=True)
+    owner: Optional[str] = None
+    lease_until: datetime = Field(default_factory=datetime.utcnow)
+
+# Reference solution a package's testcases were validated against
+class ReferenceSolution(SQLModel, table=True):
+    package_id: int = Field(foreign_key="package.id", primary_key=True)
+    code: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Time limit calibrated from the reference solution; testcases without a row use runner.CPU_LIMIT_SECONDS
+class TestCaseLimit(SQLModel, table=True):
+    testcase_id: int = Field(foreign_key="testcase.id", primary_key=True)
+    time_limit: float
+    reference_runtime: float
+
+# Testcase data kept outside the TestCase row, whose input/expected then hold a preview.
+# Stdin comes from a payload_store file or from a generator script run in the sandbox;
+# expected output from a payload_store file or, when expected_digest is None, TestCase.expected.
+class TestCasePayload(SQLModel, table=True):
+    testcase_id: int = Field(foreign_key="testcase.id", primary_key=True)
+    input_digest: Optional[str] = Field(default=None, max_length=64)
+    input_size: int = 0
+    generator: Optional[str] = None
+    expected_digest: Optional[str] = Field(default=None, max_length=64)
+    expected_size: int = 0
+
+# Weighted subtask of a package. Its testcases (TestCase rows with 0 points, linked through
+# TestCaseGroupMember) run in one sandboxed process and together earn `points`, either only
+# when all pass ("all") or in proportion to those that do ("partial").
+class TestCaseGroup(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    package_id: int = Field(foreign_key="package.id", index=True)
+    name: str
+    points: int
+    scoring: str = Field(default="all")
+
+class TestCaseGroupMember(SQLModel, table=True):
+    testcase_id: int = Field(foreign_key="testcase.id", primary_key=True)
+    group_id: int = Field(foreign_key="testcasegroup.id", index=True)
+    position: int
+
+# Released assignment whose StudentAssignment and Submission rows app.archive moved to a file
+class ArchivedAssignment(SQLModel, table=True):
+    assignment_id: int = Field(foreign_key="assignment.id", primary_key=True)
+    path: str
+    sha256: str = Field(max_length=64)
+    students: int
+    submissions: int
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+# One archived StudentAssignment; enough for the student dashboard without opening the file
+class ArchiveEntry(SQLModel, table=True):
+    student_assignment_id: int = Field(primary_key=True) # Its id before archival
+    assignment_id: int = Field(foreign_key="assignment.id", index=True)
+    student_id: int = Field(foreign_key="student.id", index=True)
+    package_id: int
+    submission_id: Optional[int] = Field(default=None, index=True)
+    final_score: Optional[float] = None
+
+# Hot-spot profile of a submission on its package's heaviest hidden testcase (see app.profiling)
+class SubmissionProfile(SQLModel, table=True):
+    submission_id: int = Field(foreign_key="submission.id", primary_key=True)
+    testcase_id: Optional[int] = None
+    code_sha256: str = Field(max_length=64) # The code that was profiled; a resubmission replaces the profile
+    report: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON)) # runner._PROFILE_HARNESS output
+    error: Optional[str] = None # Why there is no report
+    profiled_at: datetime = Field(default_factory=datetime.utcnow)
+
+# One Gemini call, as recorded by app.llm_usage
+class LlmCall(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    model: str
+    purpose: str # "generate_questions", "classify_error" or "code_quality"
+    outcome: str # "ok", "error", "invalid_json", or "budget" for a call the budget turned into the fallback
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    estimated: bool = False # Token counts estimated locally; the response carried no usage metadata
+    seconds: float = 0.0
+    assignment_id: Optional[int] = Field(default=None, index=True)
+    teacher_id: Optional[int] = Field(default=None, index=True)
+
+# Hash of a package's content as app.question_bank exports it; an import skips packages whose hash is known
+class PackageContentHash(SQLModel, table=True):
+    package_id: int = Field(foreign_key="package.id", primary_key=True)
+    content_hash: str = Field(max_length=64, index=True)
+
+# Score weights chosen for an assignment; falls back to constants.ALPHA/BETA/GAMMA/ERROR_SEVERITY
+class ScoringPolicy(SQLModel, table=True):
+    assignment_id: int = Field(foreign_key="assignment.id", primary_key=True)
+    alpha: float = 0.0
+    beta: float = 0.0
+    gamma: float = 0.0
+    severity: Dict[str, float] = Field(default_factory=dict, sa_column=Column(JSON))
+
+# Monotonic counters bumped by crud writes; they back the ETags on polled read endpoints
+class VersionStamp(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    value: int = Field(default=0)
+
+# Compressed stdout/stderr referenced by digest from Submission.test_results (see app.artifact_store)
+class Artifact(SQLModel, table=True):
+    digest: str = Field(primary_key=True, max_length=64)
+    size: int
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
 # Rebuild all models
 Package.model_rebuild()
 Student.model_rebuild()
@@ -0,0 +1,101 @@
+import re
+import random
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlmodel import Session, select
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
+from app import models
+from app.constants import MINHASH_PERMUTATIONS, LSH_BANDS, NEAR_DUPLICATE_THRESHOLD
+
+# Near-duplicate detection for question packages using MinHash + LSH.
+# A package's title, prompt and testcase I/O are shingled into word 3-grams, reduced to a
+# MinHash signature, and the signature is split into LSH bands. Two packages whose
+# signatures agree on any whole band become candidates; only those are compared, so a new
+# package is checked against a handful of rows rather than the whole bank.
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601) # Fixed seed: signatures must be comparable across restarts
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+_ROWS_PER_BAND = MINHASH_PERMUTATIONS // LSH_BANDS
+
+
+def _package_text(title: str, prompt: str, testcases: Iterable) -> str:
+    io = " ".join(f"{_get(tc, 'input')} {_get(tc, 'expected')}" for tc in testcases)
+    return f"{title} {prompt} {io}"
+
+def _get(obj, key):
+    return obj.get(key, "") if isinstance(obj, dict) else getattr(obj, key, "")
+
+def _shingles(text: str, k: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def signature(title: str, prompt: str, testcases: Iterable) -> List[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in _shingles(_package_text(title, prompt, testcases))]
+    if not hashes:
+        return [_PRIME] * MINHASH_PERMUTATIONS
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+def _bands(sig: List[int]) -> List[Tuple[int, str]]:
+    return [
+        (band, hashlib.blake2b(repr(sig[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]).encode(), digest_size=8).hexdigest())
+        for band in range(LSH_BANDS)
+    ]
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def find_near_duplicates(db: Session, sig: List[int], exclude_id: Optional[int] = None) -> List[Tuple[models.PackageSignature, float]]:
+    """Returns indexed packages whose similarity to `sig` meets the threshold, best first."""
+    bucket_match = or_(*[and_(models.LshBucket.band == band, models.LshBucket.bucket == bucket) for band, bucket in _bands(sig)])
+    candidates = set(db.exec(select(models.LshBucket.package_id).where(bucket_match)).all())
+    candidates.discard(exclude_id)
+    if not candidates:
+        return []
+    matches = []
+    for stored in db.exec(select(models.PackageSignature).where(models.PackageSignature.package_id.in_(candidates))).all():
+        score = similarity(sig, stored.signature)
+        if score >= NEAR_DUPLICATE_THRESHOLD:
+            matches.append((stored, score))
+    return sorted(matches, key=lambda m: m[1], reverse=True)
+
+def index_package(db: Session, package_id: int, sig: List[int], matches: List[Tuple[models.PackageSignature, float]]) -> models.PackageSignature:
+    """Stores a package's signature and buckets, joining the cluster of its closest match. Does not commit."""
+    best = matches[0][0] if matches else None
+    stored = models.PackageSignature(
+        package_id=package_id, signature=sig,
+        cluster_id=best.cluster_id if best else package_id,
+        duplicate_of=best.package_id if best else None,
+        similarity=matches[0][1] if matches else None
+    )
+    db.add(stored)
+    for band, bucket in _bands(sig):
+        db.add(models.LshBucket(band=band, bucket=bucket, package_id=package_id))
+    return stored
+
+def clusters_for(db: Session, package_ids: List[int]) -> Dict[int, int]:
+    """
+    Maps each package id to its near-duplicate cluster id. Packages created before the
+    index existed are signed and indexed here on first use.
+    """
+    stored = {s.package_id: s for s in db.exec(select(models.PackageSignature).where(models.PackageSignature.package_id.in_(package_ids))).all()}
+    missing = [pid for pid in package_ids if pid not in stored]
+    if missing:
+        packages = db.exec(select(models.Package).where(models.Package.id.in_(missing)).order_by(models.Package.id).options(selectinload(models.Package.testcases))).all()
+        for package in packages:
+            sig = signature(package.title, package.prompt, package.testcases)
+            stored[package.id] = index_package(db, package.id, sig, find_near_duplicates(db, sig, exclude_id=package.id))
+            db.flush() # Later packages in this batch must see this one's buckets
+    clusters = {pid: stored[pid].cluster_id for pid in package_ids if pid in stored}
+    if missing:
+        db.commit()
+    return clusters
+
+def flagged(db: Session) -> List[models.PackageSignature]:
+    """Packages that were stored as near-duplicates of an earlier one."""
+    return db.exec(select(models.PackageSignature).where(models.PackageSignature.duplicate_of.is_not(None)).order_by(models.PackageSignature.package_id)).all()
@@ -0,0 +1,137 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from sqlmodel import Session, select
+from sqlalchemy.orm import selectinload
+from app import models, schemas, shared_store
+from app.constants import PACKAGE_CACHE_SIZE, PACKAGE_CACHE_TTL_SECONDS
+
+# Read-through cache for Package + TestCase rows. Packages are rarely edited after
+# create_package_with_testcases, so a snapshot can be reused by every /run and /submit.
+# Each worker keeps a bounded LRU. A snapshot is tagged with its package's generation,
+# the "package:<id>" VersionStamp that crud bumps in the same commit as any edit to the
+# package, so every worker sees an edit on its next read (one primary-key lookup) with
+# or without a shared store, and an edit only evicts the package it touched.
+
+_lock = threading.Lock()
+_local: "OrderedDict[int, tuple]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "shared_hits": 0, "evictions": 0, "invalidations": 0}
+
+
+def _shared_key(package_id: int, generation: int) -> str:
+    # Keyed by generation so an edit orphans old copies; the TTL then reaps them.
+    return f"pkgcache:{generation}:package:{package_id}"
+
+def _uses_shared_layer() -> bool:
+    # The in-process stand-in would just duplicate the LRU, so only go through a real backend.
+    return not isinstance(shared_store.get_store(), shared_store.LocalStore)
+
+def _version_key(package_id: int) -> str:
+    return f"package:{package_id}"
+
+def _generations(db: Session, package_ids: Iterable[int]) -> Dict[int, int]:
+    package_ids = list(package_ids)
+    stamps = db.exec(select(models.VersionStamp).where(models.VersionStamp.key.in_([_version_key(pid) for pid in package_ids]))).all()
+    found = {stamp.key: stamp.value for stamp in stamps}
+    return {pid: found.get(_version_key(pid), 0) for pid in package_ids}
+
+def _snapshot(package: models.Package, limits: Dict[int, float], payloads: Dict[int, models.TestCasePayload],
+              groups: List[models.TestCaseGroup], members: Dict[int, tuple]) -> schemas.PackageSnapshot:
+    def testcase(tc: models.TestCase) -> schemas.TestCase:
+        payload = payloads.get(tc.id)
+        return schemas.TestCase(
+            id=tc.id, type=tc.type, input=tc.input, expected=tc.expected, points=tc.points, time_limit=limits.get(tc.id),
+            input_digest=payload and payload.input_digest, generator=payload and payload.generator, expected_digest=payload and payload.expected_digest
+        )
+    grouped: Dict[int, list] = {group.id: [] for group in groups}
+    for tc in package.testcases:
+        if tc.id in members:
+            group_id, position = members[tc.id]
+            grouped[group_id].append((position, testcase(tc)))
+    return schemas.PackageSnapshot(
+        id=package.id, title=package.title, prompt=package.prompt, difficulty=package.difficulty,
+        testcases=[testcase(tc) for tc in package.testcases if tc.id not in members],
+        groups=[
+            schemas.TestCaseGroup(id=group.id, name=group.name, points=group.points, scoring=group.scoring,
+                                  testcases=[tc for _, tc in sorted(grouped[group.id], key=lambda item: item[0])])
+            for group in groups
+        ]
+    )
+
+def _put(snapshot: schemas.PackageSnapshot, generation: int, share: bool = True) -> None:
+    with _lock:
+        _local[snapshot.id] = (generation, snapshot)
+        _local.move_to_end(snapshot.id)
+        while len(_local) > PACKAGE_CACHE_SIZE:
+            _local.popitem(last=False)
+            _stats["evictions"] += 1
+    if share and _uses_shared_layer():
+        shared_store.get_store().set(_shared_key(snapshot.id, generation), snapshot.model_dump_json(), ttl=PACKAGE_CACHE_TTL_SECONDS)
+
+def _load(db: Session, package_ids: Iterable[int]) -> List[schemas.PackageSnapshot]:
+    statement = select(models.Package).where(models.Package.id.in_(list(package_ids))).options(selectinload(models.Package.testcases))
+    packages = db.exec(statement).all()
+    testcase_ids = [tc.id for package in packages for tc in package.testcases]
+    limits, payloads, members = {}, {}, {}
+    groups = db.exec(select(models.TestCaseGroup).where(models.TestCaseGroup.package_id.in_([p.id for p in packages])).order_by(models.TestCaseGroup.id)).all() if packages else []
+    if groups:
+        members = {m.testcase_id: (m.group_id, m.position) for m in db.exec(select(models.TestCaseGroupMember).where(models.TestCaseGroupMember.group_id.in_([g.id for g in groups]))).all()}
+    if testcase_ids:
+        limits = dict(db.exec(select(models.TestCaseLimit.testcase_id, models.TestCaseLimit.time_limit).where(models.TestCaseLimit.testcase_id.in_(testcase_ids))).all())
+        payloads = {p.testcase_id: p for p in db.exec(select(models.TestCasePayload).where(models.TestCasePayload.testcase_id.in_(testcase_ids))).all()}
+    return [_snapshot(package, limits, payloads, [g for g in groups if g.package_id == package.id], members) for package in packages]
+
+
+def get_package(db: Session, package_id: int) -> Optional[schemas.PackageSnapshot]:
+    """Returns the snapshot for a package, loading it from the DB on a miss."""
+    generation = _generations(db, [package_id])[package_id]
+    with _lock:
+        entry = _local.get(package_id)
+        if entry is not None and entry[0] == generation:
+            _local.move_to_end(package_id)
+            _stats["hits"] += 1
+            return entry[1]
+    if _uses_shared_layer():
+        raw = shared_store.get_store().get(_shared_key(package_id, generation))
+        if raw:
+            snapshot = schemas.PackageSnapshot.model_validate_json(raw)
+            with _lock:
+                _stats["shared_hits"] += 1
+            _put(snapshot, generation, share=False)
+            return snapshot
+    with _lock:
+        _stats["misses"] += 1
+    snapshots = _load(db, [package_id])
+    if not snapshots:
+        return None
+    snapshot = snapshots[0]
+    _put(snapshot, generation)
+    return snapshot
+
+def warm(db: Session, package_ids: Iterable[int]) -> None:
+    """Pre-loads packages that are about to be served, in a single query."""
+    generations = _generations(db, set(package_ids))
+    with _lock:
+        missing = {pid for pid, generation in generations.items() if _local.get(pid, (None,))[0] != generation}
+    if not missing:
+        return
+    for snapshot in _load(db, missing):
+        _put(snapshot, generations[snapshot.id])
+
+def load_uncached(db: Session, package_ids: Iterable[int]) -> List[schemas.PackageSnapshot]:
+    """Snapshots read straight from the DB without filling the cache, for bulk reads such as an export."""
+    return _load(db, package_ids)
+
+def invalidate(package_id: int) -> None:
+    """
+    Drops this worker's copy of a package right away, after an edit to it has committed.
+    Other workers notice the edit through its "package:<id>" version bump, which any code
+    path that edits a Package or its TestCases must include in its commit.
+    """
+    with _lock:
+        _local.pop(package_id, None)
+        _stats["invalidations"] += 1
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "size": len(_local), "capacity": PACKAGE_CACHE_SIZE}
@@ -0,0 +1,64 @@
+import io
+import os
+import hashlib
+import tempfile
+from typing import BinaryIO, Optional, Tuple
+from app.constants import PAYLOAD_DIR, PAYLOAD_MAX_BYTES
+
+# Content-addressed files for testcase inputs and expected outputs too large for a text
+# column, and the cached output of input generators. Unlike artifact_store, files are kept
+# uncompressed: the runner hands an input file to the sandboxed process as its stdin and
+# mmaps an expected file for comparison, so neither is ever read into memory whole.
+
+_CHUNK = 1 << 20
+
+
+def path(digest: str) -> str:
+    return os.path.join(PAYLOAD_DIR, digest[:2], digest[2:])
+
+def exists(digest: str) -> bool:
+    return os.path.exists(path(digest))
+
+def generated_path(generator: str) -> str:
+    """Where a generator's output is cached. Generators are deterministic, so their source is the key."""
+    return os.path.join(PAYLOAD_DIR, "generated", hashlib.sha256(generator.encode("utf-8")).hexdigest())
+
+def temp_path() -> str:
+    """A fresh file inside PAYLOAD_DIR, so adopt() can move it into place atomically."""
+    os.makedirs(PAYLOAD_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=PAYLOAD_DIR, prefix=".incoming-")
+    os.close(fd)
+    return tmp_path
+
+def adopt(tmp_path: str, final_path: str) -> None:
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(tmp_path, final_path) # Atomic, so concurrent writers of the same content are harmless
+
+def put_stream(source: BinaryIO, max_bytes: int = PAYLOAD_MAX_BYTES) -> Tuple[Optional[str], int]:
+    """
+    Copies `source` into the store chunk by chunk, hashing as it goes. Returns (digest, size),
+    or (None, size) once the data exceeds `max_bytes`.
+    """
+    tmp_path, hasher, size = temp_path(), hashlib.sha256(), 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while chunk := source.read(_CHUNK):
+                size += len(chunk)
+                if size > max_bytes:
+                    return None, size
+                hasher.update(chunk)
+                out.write(chunk)
+        digest = hasher.hexdigest()
+        adopt(tmp_path, path(digest))
+        return digest, size
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def put_bytes(data: bytes) -> Tuple[Optional[str], int]:
+    return put_stream(io.BytesIO(data))
+
+def preview(file_path: str, limit: int) -> str:
+    """The first `limit` bytes of a stored file as text, for display."""
+    with open(file_path, "rb") as f:
+        return f.read(limit).decode("utf-8", errors="ignore")
@@ -0,0 +1,79 @@
+import os
+import asyncio
+import hashlib
+from typing import Optional, Set
+from sqlmodel import Session
+from app import models, schemas, runner, telemetry, payload_store
+from app.database import engine
+from app.constants import PROFILE_SUBMISSIONS
+
+# Optional hot-spot profiling of submissions (PROFILE_SUBMISSIONS). Once a submission is
+# stored, its code runs once more, off the request path, on the package's heaviest hidden
+# testcase under cProfile, a line sampler and tracemalloc (runner.profile_program). The
+# bounded report goes into SubmissionProfile; teachers can always read it, students once
+# the assignment's results are released. Profiling never changes a score.
+
+logger = telemetry.get_logger("profiling")
+
+_tasks: Set[asyncio.Task] = set() # Keeps running profiles referenced until they finish
+
+
+def _input_size(testcase) -> int:
+    if testcase.input_digest or testcase.generator:
+        file_path = payload_store.path(testcase.input_digest) if testcase.input_digest else payload_store.generated_path(testcase.generator)
+        return os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    return len(testcase.input)
+
+def heaviest_hidden(package: schemas.PackageSnapshot) -> Optional[schemas.TestCase]:
+    """
+    The hidden testcase (grouped or not) with the highest calibrated time limit, which
+    follows its reference runtime, and among equals the largest input.
+    """
+    hidden = [tc for tc in package.testcases if tc.type == "hidden"] + \
+        [tc for group in package.groups for tc in group.testcases if tc.type == "hidden"]
+    if not hidden:
+        return None
+    return max(hidden, key=lambda tc: (tc.time_limit or 0, _input_size(tc)))
+
+def _code_sha256(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+def _store(submission_id: int, code: str, testcase_id: Optional[int], report: Optional[dict], error: Optional[str]) -> None:
+    with Session(engine) as db:
+        submission = db.get(models.Submission, submission_id)
+        if submission is None or _code_sha256(submission.code) != _code_sha256(code):
+            return # Archived or resubmitted meanwhile
+        db.merge(models.SubmissionProfile(submission_id=submission_id, testcase_id=testcase_id, code_sha256=_code_sha256(code), report=report, error=error))
+        db.commit()
+
+async def _profile(submission_id: int, code: str, testcase: schemas.TestCase) -> None:
+    try:
+        report, error = await runner.profile_in_sandbox(code, testcase)
+        await asyncio.to_thread(_store, submission_id, code, testcase.id, report, error)
+        logger.info("Submission profiled", extra={"submission_id": submission_id, "testcase_id": testcase.id, "error": error})
+    except Exception:
+        logger.exception("Profiling failed", extra={"submission_id": submission_id})
+
+def schedule(submission_id: int, code: str, package: schemas.PackageSnapshot) -> None:
+    """Starts profiling a just-stored submission in the background, when enabled."""
+    if not PROFILE_SUBMISSIONS:
+        return
+    testcase = heaviest_hidden(package)
+    if testcase is None:
+        return
+    task = asyncio.create_task(_profile(submission_id, code, testcase))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+def get_profile(db: Session, submission: models.Submission) -> Optional[schemas.SubmissionProfile]:
+    """The submission's profile, if one was taken of its current code."""
+    profile = db.get(models.SubmissionProfile, submission.id)
+    if profile is None or profile.code_sha256 != _code_sha256(submission.code):
+        return None
+    report = profile.report or {}
+    return schemas.SubmissionProfile(
+        submission_id=profile.submission_id, testcase_id=profile.testcase_id, profiled_at=profile.profiled_at,
+        error=profile.error or report.get("error"), runtime=report.get("runtime"), timed_out=bool(report.get("timed_out")),
+        peak_bytes=report.get("peak_bytes"), functions=report.get("functions") or [], lines=report.get("lines") or [],
+        allocations=report.get("allocations") or []
+    )
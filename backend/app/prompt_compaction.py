@@ -0,0 +1,164 @@
+import io
+import re
+import tokenize
+from typing import List, Optional, Tuple
+from app.constants import PROMPT_CHARS_PER_TOKEN, PROMPT_LITERAL_CHARS, PROMPT_LINE_CHARS, PROMPT_TRACEBACK_LINES
+
+# Shrinks what grading calls send to Gemini so it fits a per-model token budget.
+# Code always loses blank lines, trailing whitespace, comments and docstrings (unless the
+# caller keeps them), then, only while it is over budget: long string literals, runs of
+# repeated lines and overlong lines; as a last resort the middle is cut. stdout is
+# summarized around its first line that differs from `expected`, stderr to the tail of
+# the traceback. Token counts are estimated from the length (no round trip to the API).
+
+_REPEAT_MIN = 3 # Copies of a block before it is collapsed
+_REPEAT_MAX_BLOCK = 8 # Longest block (in lines) looked for
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // PROMPT_CHARS_PER_TOKEN)
+
+def clip(text: str, budget: int) -> str:
+    """Head of `text` within `budget` tokens, marked when something was cut."""
+    limit = budget * PROMPT_CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:max(0, limit - 20)] + "...(truncated)"
+
+def _edit(code: str, edits: List[Tuple[Tuple[int, int], Tuple[int, int], str]]) -> str:
+    """Applies (start, end, replacement) edits given as tokenize (row, col) positions."""
+    lines = code.splitlines(keepends=True)
+    for (srow, scol), (erow, ecol), replacement in sorted(edits, reverse=True):
+        head, tail = lines[srow - 1][:scol], lines[erow - 1][ecol:]
+        lines[srow - 1:erow] = [head + replacement + tail]
+    return "".join(lines)
+
+def _tokens(code: str) -> Optional[List[tokenize.TokenInfo]]:
+    try:
+        return list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None # Broken code is left as it is; the line-based steps still apply
+
+def _elide_literals(code: str) -> str:
+    tokens = _tokens(code)
+    if tokens is None:
+        return code
+    edits = []
+    for tok in tokens:
+        if tok.type == tokenize.STRING and len(tok.string) > PROMPT_LITERAL_CHARS:
+            prefix, quote = re.match(r"([A-Za-z]*)('''|\"\"\"|'|\")", tok.string).groups()
+            body = tok.string[len(prefix) + len(quote):PROMPT_LITERAL_CHARS]
+            if len(quote) == 1:
+                body = body.replace("\n", "\\n") # Keep the literal on one line
+            edits.append((tok.start, tok.end, f"{prefix}{quote}{body}...<{len(tok.string)} chars>{quote}"))
+    return _edit(code, edits)
+
+def _strip_comments(code: str) -> str:
+    """Removes comments and docstrings (any statement that is only a string)."""
+    tokens = _tokens(code)
+    if tokens is None:
+        return code
+    significant = [tok for tok in tokens if tok.type not in (tokenize.COMMENT, tokenize.NL)]
+    edits = [(tok.start, tok.end, "") for tok in tokens if tok.type == tokenize.COMMENT]
+    for i, tok in enumerate(significant):
+        if tok.type != tokenize.STRING or significant[i + 1].type != tokenize.NEWLINE:
+            continue
+        before = significant[i - 1].type if i else tokenize.NEWLINE
+        if before not in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT):
+            continue
+        # A docstring that is the whole body still needs a statement there
+        alone = before == tokenize.INDENT and significant[i + 2].type in (tokenize.DEDENT, tokenize.ENDMARKER)
+        edits.append((tok.start, tok.end, "..." if alone else ""))
+    return _edit(code, edits)
+
+def strip_comments(code: str) -> str:
+    """`code` without comments and docstrings, otherwise unchanged (app.workload_trace anonymizes with it)."""
+    return _strip_comments(code)
+
+def _collapse_blank(code: str) -> str:
+    return "\n".join(line.rstrip() for line in code.splitlines() if line.strip())
+
+def _collapse_repeats(code: str) -> str:
+    lines, out, i = code.splitlines(), [], 0
+    while i < len(lines):
+        for size in range(1, _REPEAT_MAX_BLOCK + 1):
+            block, copies = lines[i:i + size], 1
+            while lines[i + copies * size:i + (copies + 1) * size] == block:
+                copies += 1
+            if len(block) == size and copies >= _REPEAT_MIN:
+                indent = block[0][:len(block[0]) - len(block[0].lstrip())]
+                out += block + [f"{indent}# ... the {size} line(s) above repeat {copies - 1} more times"]
+                i += copies * size
+                break
+        else:
+            out.append(lines[i])
+            i += 1
+    return "\n".join(out)
+
+def _shorten_lines(code: str) -> str:
+    return "\n".join(line if len(line) <= PROMPT_LINE_CHARS else f"{line[:PROMPT_LINE_CHARS]} ...<{len(line)} chars>" for line in code.splitlines())
+
+def _cut_middle(code: str, budget: int) -> str:
+    lines = code.splitlines()
+    room = budget * PROMPT_CHARS_PER_TOKEN - 40 # Leaves room for the marker line
+    head, tail = 0, 0
+    while head + tail < len(lines):
+        line = lines[head] if head <= tail else lines[-tail - 1]
+        if len(line) + 1 > room:
+            break
+        room -= len(line) + 1
+        head, tail = (head + 1, tail) if head <= tail else (head, tail + 1)
+    if head + tail == len(lines):
+        return code
+    return "\n".join(lines[:head] + [f"# ... {len(lines) - head - tail} lines elided ..."] + lines[len(lines) - tail:])
+
+def compact_code(code: str, budget: int, keep_comments: bool = False) -> str:
+    """
+    `code` within `budget` tokens, applying the steps above until it fits. With
+    `keep_comments`, comments and docstrings are only removed if it would not fit otherwise.
+    """
+    code = _collapse_blank(code)
+    if not keep_comments:
+        code = _collapse_blank(_strip_comments(code))
+    steps = [_elide_literals] + ([_strip_comments] if keep_comments else []) + [_collapse_repeats, _shorten_lines]
+    for step in steps:
+        if estimate_tokens(code) <= budget:
+            return code
+        code = _collapse_blank(step(code))
+    return code if estimate_tokens(code) <= budget else _cut_middle(code, budget)
+
+def _lines(text: str) -> List[str]:
+    return [line.rstrip() for line in text.strip().splitlines()]
+
+def summarize_stdout(stdout: str, expected: Optional[str], budget: int) -> str:
+    """
+    stdout within `budget` tokens. Compared to `expected`, only the first differing line
+    and the lines around it are kept, with how much matched before it.
+    """
+    if expected is None or estimate_tokens(stdout) <= budget:
+        return clip(stdout, budget)
+    got, want = _lines(stdout), _lines(expected)
+    first = next((i for i, (a, b) in enumerate(zip(got, want)) if a != b), min(len(got), len(want)))
+    context = got[max(0, first - 2):first + 3]
+    summary = (
+        f"{len(got)} lines (expected {len(want)}); the first {first} match.\n"
+        f"First difference at line {first + 1}: got {got[first] if first < len(got) else '<end of output>'!r}, "
+        f"expected {want[first] if first < len(want) else '<end of output>'!r}.\n"
+        f"Lines {max(0, first - 2) + 1}-{max(0, first - 2) + len(context)}:\n" + "\n".join(context)
+    )
+    return clip(summary, budget)
+
+def summarize_stderr(stderr: str, budget: int) -> str:
+    """stderr within `budget` tokens; of a traceback, its innermost frames and the exception."""
+    if estimate_tokens(stderr) <= budget:
+        return stderr
+    lines = stderr.rstrip().splitlines()
+    start = max((i for i, line in enumerate(lines) if line.startswith("Traceback")), default=None)
+    if start is not None and len(lines) - start > PROMPT_TRACEBACK_LINES + 1:
+        frames = lines[-PROMPT_TRACEBACK_LINES:]
+        while len(frames) > 1 and not frames[0].lstrip().startswith("File "):
+            frames.pop(0) # Start at a frame, not at the source line of the one before
+        tail = [lines[start], "  ..."] + frames
+    else:
+        tail = lines[-PROMPT_TRACEBACK_LINES:]
+    text = "\n".join(tail)
+    limit = budget * PROMPT_CHARS_PER_TOKEN
+    return text if len(text) <= limit else "..." + text[-(limit - 3):] # The exception line is at the end
@@ -0,0 +1,277 @@
+import os
+import re
+import gzip
+import json
+import zlib
+import base64
+import hashlib
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+from sqlmodel import Session, select
+from app import models, schemas, telemetry, payload_store, package_cache
+from app.database import engine
+from app.constants import QUESTION_BANK_PAGE_SIZE, QUESTION_BANK_BATCH_SIZE, QUESTION_BANK_CHUNK_BYTES, PAYLOAD_MAX_BYTES
+
+# Moves packages between deployments as a gzipped NDJSON stream, in constant memory.
+# The first line is a header; then, per package, the payload_store files it needs that were
+# not sent yet ("payload" lines of base64 chunks, in order, the last one marked) followed by
+# the package itself ("package": title, prompt, difficulty, solution, testcases, groups).
+# Export pages through the packages by id; import reads line by line and stores packages
+# QUESTION_BANK_BATCH_SIZE at a time with bulk inserts, one transaction per batch.
+# Packages are deduplicated by a hash of their content (time limits excluded, as they are
+# measured per deployment), so importing the same file twice stores nothing the second time.
+
+logger = telemetry.get_logger("question_bank")
+
+FORMAT = "autoassess-question-bank"
+VERSION = 1
+
+_HASHED_CASE_KEYS = ("type", "input", "expected", "points", "input_digest", "expected_digest", "generator")
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def _case(tc: schemas.TestCase, runtimes: Dict[int, float]) -> Dict[str, Any]:
+    fields = {
+        "type": tc.type, "input": tc.input, "expected": tc.expected, "points": tc.points, "time_limit": tc.time_limit,
+        "reference_runtime": runtimes.get(tc.id) if tc.time_limit is not None else None,
+        "input_digest": tc.input_digest, "expected_digest": tc.expected_digest, "generator": tc.generator,
+    }
+    return {key: value for key, value in fields.items() if value is not None}
+
+def _records(db: Session, package_ids: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+    """(package id, "package" line) for each package, loaded in a handful of queries."""
+    snapshots = package_cache.load_uncached(db, package_ids)
+    solutions = dict(db.exec(select(models.ReferenceSolution.package_id, models.ReferenceSolution.code).where(models.ReferenceSolution.package_id.in_(package_ids))).all())
+    testcase_ids = [tc.id for s in snapshots for tc in s.testcases + [tc for g in s.groups for tc in g.testcases]]
+    runtimes = dict(db.exec(select(models.TestCaseLimit.testcase_id, models.TestCaseLimit.reference_runtime).where(models.TestCaseLimit.testcase_id.in_(testcase_ids))).all()) if testcase_ids else {}
+    records = []
+    for snapshot in snapshots:
+        record = {"kind": "package", "title": snapshot.title, "prompt": snapshot.prompt, "difficulty": snapshot.difficulty,
+                  "testcases": [_case(tc, runtimes) for tc in snapshot.testcases]}
+        if solutions.get(snapshot.id):
+            record["solution"] = solutions[snapshot.id]
+        if snapshot.groups:
+            record["groups"] = [{"name": g.name, "points": g.points, "scoring": g.scoring, "testcases": [_case(tc, runtimes) for tc in g.testcases]}
+                                for g in snapshot.groups]
+        records.append((snapshot.id, record))
+    return records
+
+def _all_cases(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return list(record.get("testcases") or []) + [tc for group in record.get("groups") or [] if isinstance(group, dict) for tc in group.get("testcases") or []]
+
+def content_hash(record: Dict[str, Any]) -> str:
+    """sha256 of a "package" line's content, without its time limits."""
+    def case(tc):
+        return {key: tc.get(key) for key in _HASHED_CASE_KEYS} if isinstance(tc, dict) else tc
+    canonical = {
+        "title": record.get("title"), "prompt": record.get("prompt"), "difficulty": record.get("difficulty"), "solution": record.get("solution"),
+        "testcases": [case(tc) for tc in record.get("testcases") or []],
+        "groups": [{"name": g.get("name"), "points": g.get("points"), "scoring": g.get("scoring", "all"), "testcases": [case(tc) for tc in g.get("testcases") or []]}
+                   if isinstance(g, dict) else g for g in record.get("groups") or []],
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def _hash_missing(db: Session) -> int:
+    """Hashes the packages created or edited since the last import; returns how many."""
+    hashed, after = 0, 0
+    while True:
+        ids = db.exec(select(models.Package.id).where(models.Package.id > after, models.Package.id.not_in(select(models.PackageContentHash.package_id)))
+                      .order_by(models.Package.id).limit(QUESTION_BANK_PAGE_SIZE)).all()
+        if not ids:
+            return hashed
+        after = ids[-1]
+        db.add_all([models.PackageContentHash(package_id=package_id, content_hash=content_hash(record)) for package_id, record in _records(db, ids)])
+        db.commit()
+        hashed += len(ids)
+
+# --- Export ---
+def _line(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
+def _payload_lines(digest: str) -> Iterator[bytes]:
+    with open(payload_store.path(digest), "rb") as f:
+        chunk = f.read(QUESTION_BANK_CHUNK_BYTES)
+        while True:
+            following = f.read(QUESTION_BANK_CHUNK_BYTES)
+            yield _line({"kind": "payload", "digest": digest, "data": base64.b64encode(chunk).decode("ascii"), "last": not following})
+            if not following:
+                return
+            chunk = following
+
+def export_bank(include_payloads: bool = True) -> Iterator[bytes]:
+    """
+    The whole question bank as gzip bytes, produced page by page. Opens its own session, as
+    it runs while the response streams. Without `include_payloads`, file-backed testcases
+    refer to files the importing deployment must already have.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # 31: gzip container
+    yield compressor.compress(_line({"format": FORMAT, "version": VERSION}))
+    sent, packages, after = set(), 0, 0
+    with Session(engine) as db:
+        while True:
+            ids = db.exec(select(models.Package.id).where(models.Package.id > after).order_by(models.Package.id).limit(QUESTION_BANK_PAGE_SIZE)).all()
+            if not ids:
+                break
+            after = ids[-1]
+            pending = [] # Compressed output, yielded per page or per payload chunk
+            for _, record in _records(db, ids):
+                for tc in _all_cases(record) if include_payloads else []:
+                    for digest in (tc.get("input_digest"), tc.get("expected_digest")):
+                        if digest and digest not in sent and payload_store.exists(digest):
+                            sent.add(digest)
+                            for line in _payload_lines(digest):
+                                pending.append(compressor.compress(line))
+                                yield b"".join(pending)
+                                pending = []
+                pending.append(compressor.compress(_line(record)))
+            packages += len(ids)
+            yield b"".join(pending)
+    yield compressor.flush()
+    logger.info("Question bank exported", extra={"packages": packages, "payloads": len(sent)})
+
+# --- Import ---
+def _close_payload(state: Dict[str, Any]) -> None:
+    """Drops a payload file that is still being received (the stream ended or failed)."""
+    if state.get("out"):
+        state["out"].close()
+        if os.path.exists(state["path"]):
+            os.unlink(state["path"])
+    state.clear()
+
+def _receive_payload(state: Dict[str, Any], record: Dict[str, Any], counts: Dict[str, int]) -> None:
+    digest = record.get("digest")
+    if not isinstance(digest, str) or not _DIGEST.fullmatch(digest):
+        raise ValueError("payload line without a valid digest")
+    if state.get("digest") != digest:
+        _close_payload(state)
+        state.update(digest=digest, hasher=hashlib.sha256(), size=0, out=None)
+        if not payload_store.exists(digest):
+            state["path"] = payload_store.temp_path()
+            state["out"] = open(state["path"], "wb")
+    if state["out"]:
+        data = base64.b64decode(record.get("data") or "", validate=True)
+        state["size"] += len(data)
+        if state["size"] > PAYLOAD_MAX_BYTES:
+            raise ValueError(f"payload {digest[:12]} is larger than {PAYLOAD_MAX_BYTES} bytes")
+        state["hasher"].update(data)
+        state["out"].write(data)
+    if record.get("last"):
+        if state["out"]:
+            state["out"].close()
+            state["out"] = None
+            if state["hasher"].hexdigest() != digest:
+                os.unlink(state["path"])
+                raise ValueError(f"payload {digest[:12]} does not match its digest")
+            payload_store.adopt(state["path"], payload_store.path(digest))
+            counts["payloads"] += 1
+        state.clear()
+
+def _payloads_present(record: Dict[str, Any]) -> bool:
+    for tc in _all_cases(record):
+        for digest in (tc.get("input_digest"), tc.get("expected_digest")) if isinstance(tc, dict) else ():
+            if digest is not None and not (isinstance(digest, str) and _DIGEST.fullmatch(digest) and payload_store.exists(digest)):
+                logger.warning(f"Package rejected: Package '{record.get('title')}' needs payload {str(digest)[:12]}, which is not in the store.")
+                return False
+    return True
+
+def _testcase(case: Dict[str, Any], package_id: int, grouped: bool) -> models.TestCase:
+    if grouped:
+        return models.TestCase(type="hidden", input=str(case['input']), expected=str(case['expected']), points=0, package_id=package_id)
+    return models.TestCase(type=case['type'], input=str(case['input']), expected=str(case['expected']), points=int(case['points']), package_id=package_id)
+
+def _insert(db: Session, batch: List[Dict[str, Any]], counts: Dict[str, int]) -> None:
+    """Stores one batch of "package" lines in a single transaction, skipping known content."""
+    from app import crud, search_index
+    hashes = [content_hash(record) for record in batch]
+    known = set(db.exec(select(models.PackageContentHash.content_hash).where(models.PackageContentHash.content_hash.in_(set(hashes)))).all())
+    new = []
+    for record, digest in zip(batch, hashes):
+        if digest in known:
+            counts["skipped"] += 1
+            continue
+        known.add(digest) # Repeated later in the file
+        if not crud.is_valid_package(record) or not _payloads_present(record):
+            counts["rejected"] += 1
+            continue
+        new.append((record, digest))
+    if not new:
+        return
+    packages = [models.Package(title=str(record['title']), prompt=str(record['prompt']), difficulty=str(record['difficulty'])) for record, _ in new]
+    db.add_all(packages)
+    db.flush() # Package ids
+    rows, groups = [], []
+    for package, (record, digest) in zip(packages, new):
+        db.add(models.PackageContentHash(package_id=package.id, content_hash=digest))
+        if record.get("solution"):
+            db.add(models.ReferenceSolution(package_id=package.id, code=str(record["solution"])))
+        rows += [(_testcase(case, package.id, False), case, None) for case in record['testcases']]
+        for group_data in record.get("groups") or []:
+            group = models.TestCaseGroup(package_id=package.id, name=str(group_data['name']), points=int(group_data['points']), scoring=group_data.get('scoring', 'all'))
+            groups.append(group)
+            rows += [(_testcase(case, package.id, True), case, (group, position)) for position, case in enumerate(group_data['testcases'])]
+    db.add_all(groups + [testcase for testcase, _, _ in rows])
+    db.flush() # Testcase and group ids
+    for testcase, case, membership in rows:
+        if case.get("time_limit") is not None:
+            db.add(models.TestCaseLimit(testcase_id=testcase.id, time_limit=float(case["time_limit"]), reference_runtime=float(case.get("reference_runtime") or 0.0)))
+        if case.get("input_digest") or case.get("expected_digest") or case.get("generator"):
+            db.add(models.TestCasePayload(
+                testcase_id=testcase.id, input_digest=case.get("input_digest"), generator=case.get("generator"), expected_digest=case.get("expected_digest"),
+                input_size=os.path.getsize(payload_store.path(case["input_digest"])) if case.get("input_digest") else 0,
+                expected_size=os.path.getsize(payload_store.path(case["expected_digest"])) if case.get("expected_digest") else 0,
+            ))
+        if membership:
+            db.add(models.TestCaseGroupMember(testcase_id=testcase.id, group_id=membership[0].id, position=membership[1]))
+    for package in packages:
+        search_index.index_package(db, package)
+    db.commit()
+    counts["imported"] += len(packages)
+
+def import_bank(db: Session, source: BinaryIO) -> Dict[str, int]:
+    """
+    Reads an export_bank() stream and stores the packages not already in the bank. Raises
+    ValueError for a malformed stream; the batches stored before that point are kept, and
+    importing the file again after fixing it skips them.
+    """
+    from app import crud
+    counts = {"imported": 0, "skipped": 0, "rejected": 0, "payloads": 0}
+    _hash_missing(db)
+    batch: List[Dict[str, Any]] = []
+    state: Dict[str, Any] = {}
+    number = 1
+    try:
+        with gzip.GzipFile(fileobj=source, mode="rb") as lines:
+            header = json.loads(lines.readline() or b"null")
+            if not isinstance(header, dict) or header.get("format") != FORMAT:
+                raise ValueError("not a question bank export")
+            if header.get("version") != VERSION:
+                raise ValueError(f"unsupported question bank version {header.get('version')!r}")
+            for number, line in enumerate(lines, start=2):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.get("kind") if isinstance(record, dict) else None
+                if kind == "payload":
+                    _receive_payload(state, record, counts)
+                elif kind == "package":
+                    batch.append(record)
+                    if len(batch) >= QUESTION_BANK_BATCH_SIZE:
+                        _insert(db, batch, counts)
+                        batch = []
+                else:
+                    raise ValueError("unknown record")
+            if state:
+                raise ValueError(f"payload {state['digest'][:12]} is incomplete")
+            _insert(db, batch, counts)
+    except ValueError as exc: # Includes JSON and base64 errors
+        db.rollback()
+        raise ValueError(f"line {number}: {exc}") from exc
+    except (OSError, EOFError) as exc: # Not gzip, or truncated
+        db.rollback()
+        raise ValueError(f"line {number}: unreadable stream ({exc})") from exc
+    finally:
+        _close_payload(state)
+        if counts["imported"]:
+            crud.bump_versions(db, "packages")
+            db.commit()
+    logger.info("Question bank imported", extra=counts)
+    return counts
@@ -0,0 +1,9 @@
+from app import shared_store
+
+# Token-bucket rate limiting, shared across workers through app.shared_store.
+# Each key gets `burst` tokens refilled at `per_minute` per minute; a request takes one.
+
+
+def retry_after(key: str, per_minute: float, burst: int) -> float:
+    """Takes a token for `key`. Returns 0 if allowed, else the seconds until a token is free."""
+    return shared_store.get_store().take_token(f"ratelimit:{key}", per_minute / 60, burst)
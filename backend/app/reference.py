@@ -0,0 +1,102 @@
+import json
+import asyncio
+import statistics
+from typing import Any, Dict, List, Optional, Tuple
+from app import runner
+from app.constants import TIME_LIMIT_FACTOR, TIME_LIMIT_FLOOR_SECONDS, TIME_LIMIT_MAX_SECONDS, REFERENCE_RUNS, MAX_GROUP_TESTCASES
+
+# Validation of generated packages against their reference solution.
+# The reference runs on every testcase, REFERENCE_RUNS times each: the testcases in parallel
+# on the sandbox pool, one testcase's runs one after another. A package whose reference does
+# not reproduce every `expected` output is rejected; otherwise the median CPU time per
+# testcase, less that of an empty program (interpreter startup), sets its time limit.
+# Groups run from one forked interpreter, so their cases' CPU times exclude startup already.
+
+
+def time_limit(reference_runtime: float) -> float:
+    return round(min(TIME_LIMIT_MAX_SECONDS, max(TIME_LIMIT_FLOOR_SECONDS, TIME_LIMIT_FACTOR * reference_runtime)), 3)
+
+def _cpu_seconds(results: List[runner.RunResult]) -> float:
+    """Median CPU time of the runs (wall time where the platform cannot measure CPU time)."""
+    return statistics.median(r.runtime if r.cpu_time is None else r.cpu_time for r in results)
+
+async def calibrate(solution: str, testcases: List[Dict[str, Any]]) -> Tuple[Optional[List[Dict[str, float]]], Optional[str]]:
+    """
+    Returns ([{"time_limit", "reference_runtime"} per testcase], None) when the reference
+    passes everything, or (None, reason) when it does not.
+    """
+    baseline_runs, *runs = await asyncio.gather(
+        runner.run_cpu_timed_in_sandbox("", "", REFERENCE_RUNS, TIME_LIMIT_MAX_SECONDS),
+        *[runner.run_cpu_timed_in_sandbox(solution, str(tc.get("input", "")), REFERENCE_RUNS, TIME_LIMIT_MAX_SECONDS) for tc in testcases]
+    )
+    baseline = _cpu_seconds(baseline_runs)
+    limits = []
+    for i, (tc, group) in enumerate(zip(testcases, runs)):
+        for result in group:
+            if not runner.check_output(result.stdout, result.stderr, result.timed_out, str(tc.get("expected", ""))):
+                reason = "timed out" if result.timed_out else "errored" if result.stderr else f"printed {result.stdout[:80]!r}"
+                return None, f"reference solution {reason} on testcase {i + 1} (expected {str(tc.get('expected', ''))[:80]!r})"
+        runtime = round(max(0.0, _cpu_seconds(group) - baseline), 4)
+        limits.append({"time_limit": time_limit(runtime), "reference_runtime": runtime})
+    return limits, None
+
+async def calibrate_package(package_data: Any) -> Tuple[Optional[List[Dict[str, float]]], Optional[str]]:
+    """
+    Calibrates a generated package if it carries a `solution`. Packages without one, or
+    with malformed testcases, pass through untouched for crud to accept or reject.
+    """
+    if not isinstance(package_data, dict) or not package_data.get("solution"):
+        return None, None
+    testcases = package_data.get("testcases")
+    if not isinstance(testcases, list) or not all(isinstance(tc, dict) for tc in testcases):
+        return None, None
+    return await calibrate(str(package_data["solution"]), testcases)
+
+async def _generated_inputs(generator: str) -> Tuple[Optional[List[str]], Optional[str]]:
+    path, error = await runner.generate_in_sandbox(generator)
+    if error:
+        return None, error
+    try:
+        with open(path, encoding="utf-8") as f:
+            inputs = json.load(f)
+    except (ValueError, UnicodeDecodeError):
+        return None, "input generator did not print a JSON list"
+    if not isinstance(inputs, list) or not inputs or len(inputs) > MAX_GROUP_TESTCASES:
+        return None, f"input generator must print a JSON list of 1 to {MAX_GROUP_TESTCASES} inputs"
+    return [str(item) for item in inputs], None
+
+async def prepare_groups(package_data: Any) -> Optional[str]:
+    """
+    Completes the testcase groups of a teacher-written package before crud stores it. A
+    group's `generator` is run in the sandbox and each input it prints becomes a case.
+    With a `solution`, every group then goes through it in one batch run: cases without
+    `expected` take the solution's output, cases with one must match it, and each case's
+    time limit is calibrated from its CPU time. Returns the reason when something fails.
+    """
+    groups = package_data.get("groups") if isinstance(package_data, dict) else None
+    if not isinstance(groups, list):
+        return None
+    solution = package_data.get("solution")
+    for group in groups:
+        if not isinstance(group, dict):
+            continue # crud rejects it
+        name = group.get("name")
+        if group.get("generator"):
+            inputs, error = await _generated_inputs(str(group.pop("generator")))
+            if error:
+                return f"group {name!r}: {error}"
+            group["testcases"] = list(group.get("testcases") or []) + [{"input": given} for given in inputs]
+        cases = group.get("testcases")
+        if not solution or not isinstance(cases, list) or not all(isinstance(case, dict) for case in cases):
+            continue
+        results = await runner.run_batch_in_sandbox(str(solution), [str(case.get("input", "")) for case in cases], [TIME_LIMIT_MAX_SECONDS] * len(cases))
+        for i, (case, result) in enumerate(zip(cases, results)):
+            if result.timed_out or result.stderr:
+                return f"reference solution {'timed out' if result.timed_out else 'errored'} on case {i + 1} of group {name!r}"
+            if case.get("expected") is None:
+                case["expected"] = result.stdout
+            elif not runner.check_output(result.stdout, result.stderr, result.timed_out, str(case["expected"])):
+                return f"reference solution printed {result.stdout[:80]!r} on case {i + 1} of group {name!r} (expected {str(case['expected'])[:80]!r})"
+            spent = _cpu_seconds([result])
+            case["time_limit"], case["reference_runtime"] = time_limit(spent), spent
+    return None
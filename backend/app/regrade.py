@@ -0,0 +1,225 @@
+import os
+import uuid
+import socket
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlalchemy import update, delete, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from app import models, crud, runner, artifact_store, package_cache, scoring, telemetry, constants, groups
+from app.database import engine
+
+logger = telemetry.get_logger("regrade")
+
+# Bulk regrading of an assignment after its testcases change.
+# Each stored test result records digests of the testcase input and expected output it was
+# graded against. On regrade a (submission, testcase) pair is only re-executed when the
+# input changed or the testcase is new; if just `expected` changed the stored output is
+# re-checked. A testcase group is re-run whole when its groups.digest changes. Scores are
+# recomputed from the stored quality score and error type, so no Gemini call is made.
+# Progress is committed per submission in RegradeJob, and jobs still marked running are
+# resumed at startup. A job only runs in the worker holding its RegradeClaim: every start
+# claims it with a conditional UPDATE (free, or its lease expired), each progress commit
+# renews the lease in the same transaction, and a worker that lost it stops. The claim's
+# primary key also allows a single running job per assignment.
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_tasks: Dict[int, asyncio.Task] = {}
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+def input_digest_of(tc) -> str:
+    """Identifies what a testcase feeds on stdin: its generator, its payload file or its inline input."""
+    if tc.generator:
+        return digest("generator:" + tc.generator)
+    return tc.input_digest[:16] if tc.input_digest else digest(tc.input)
+
+def expected_digest_of(tc) -> str:
+    return tc.expected_digest[:16] if tc.expected_digest else digest(tc.expected)
+
+def _regrade_submission(db: Session, submission: models.Submission, weights, pool: ThreadPoolExecutor) -> bool:
+    """Re-scores one submission in place. Returns True if anything was re-executed or changed."""
+    package = package_cache.get_package(db, submission.student_assignment.package_id)
+    if package is None:
+        return False
+    previous = {r.get("testcase_id"): r for r in (submission.test_results or []) if r.get("testcase_id") is not None}
+    previous_groups = {r["group_id"]: r for r in (submission.test_results or []) if r.get("group_id") is not None}
+    results, to_run = {}, []
+    for tc in package.testcases:
+        old = previous.get(tc.id)
+        expected_changed = old is not None and old.get("expected_digest") != expected_digest_of(tc)
+        # Output checked against a payload file was only stored as a preview, so it cannot be re-checked
+        if old is not None and old.get("input_digest") == input_digest_of(tc) and not (expected_changed and tc.expected_digest):
+            entry = dict(old)
+            if expected_changed:
+                full = artifact_store.hydrate_test_results(db, [old])[0]
+                entry["passed"] = runner.check_output(full["stdout"], full["stderr"], full["timed_out"], tc.expected)
+                entry["expected_digest"] = expected_digest_of(tc)
+            results[tc.id] = entry
+        else:
+            to_run.append(tc)
+
+    futures = {tc.id: pool.submit(runner.execute_testcase, submission.code, tc) for tc in to_run}
+    group_entries, groups_to_run = {}, []
+    for group in package.groups:
+        old = previous_groups.get(group.id)
+        if old is not None and old.get("group_digest") == groups.digest(group):
+            group_entries[group.id] = old
+        else:
+            groups_to_run.append(group)
+    group_futures = {group.id: pool.submit(runner.execute_group, submission.code, group) for group in groups_to_run}
+    fresh = []
+    for tc in to_run:
+        run_result = futures[tc.id].result()
+        fresh.append({
+            "testcase_id": tc.id, "passed": runner.judge(run_result, tc.expected),
+            "stdout": run_result.stdout, "stderr": run_result.stderr, "runtime": run_result.runtime, "timed_out": run_result.timed_out,
+            "type": tc.type, "time_limit": tc.time_limit, "input_digest": input_digest_of(tc), "expected_digest": expected_digest_of(tc)
+        })
+    for entry in artifact_store.offload_test_results(db, fresh):
+        results[entry["testcase_id"]] = entry
+    fresh_groups = [groups.entry(group, group_futures[group.id].result()) for group in groups_to_run]
+    for entry in artifact_store.offload_test_results(db, fresh_groups):
+        group_entries[entry["group_id"]] = entry
+
+    test_results = [results[tc.id] for tc in package.testcases] + [group_entries[group.id] for group in package.groups]
+    if not to_run and not groups_to_run and test_results == submission.test_results:
+        return False
+    total_points = sum(tc.points for tc in package.testcases) + sum(group.points for group in package.groups)
+    passed_points = sum(tc.points for tc in package.testcases if results[tc.id]["passed"]) + sum(group_entries[group.id]["earned"] for group in package.groups)
+    raw_test_score = (passed_points / total_points) * 100 if total_points > 0 else 0
+    num_failed = len([r for r in test_results if not r["passed"]])
+
+    error_counts, error_penalty = {}, 0
+    if num_failed:
+        # Keep the original classification; a submission that newly fails gets the local one.
+        err_type = next(iter(submission.error_counts or {}), None)
+        if err_type is None:
+            from app.gemini_client import _get_canned_error_classification
+            first_failed = next(r for r in test_results if not r["passed"])
+            err_type = _get_canned_error_classification(runner.RunResult(
+                stdout=first_failed.get("stdout_preview", ""), stderr=first_failed.get("stderr_preview", ""),
+                runtime=first_failed.get("runtime", 0.0), timed_out=first_failed.get("timed_out", False)
+            ))["error_type"]
+        if err_type in weights.severity:
+            error_penalty = weights.severity[err_type]
+            error_counts[err_type] = num_failed
+
+    submission.test_results = test_results
+    submission.raw_test_score = raw_test_score
+    submission.error_penalty = error_penalty
+    submission.error_counts = error_counts
+    submission.final_score = scoring.final_score(raw_test_score, submission.quality_score, error_penalty, weights)
+    db.add(submission)
+    crud.bump_versions(db, f"student:{submission.student_assignment.student_id}")
+    return True
+
+def _claim(db: Session, job_id: int) -> bool:
+    """
+    Takes ownership of a running job that nobody holds, or whose holder's lease has run
+    out (its worker died), so that exactly one worker runs it.
+    """
+    now = datetime.utcnow()
+    statement = update(models.RegradeClaim).where(
+        models.RegradeClaim.job_id == job_id,
+        or_(models.RegradeClaim.owner.is_(None), models.RegradeClaim.lease_until < now)
+    ).values(owner=_OWNER, lease_until=now + timedelta(seconds=constants.REGRADE_LEASE_SECONDS))
+    claimed = db.execute(statement).rowcount == 1
+    db.commit()
+    return claimed
+
+def _renew(db: Session, job_id: int) -> bool:
+    """Extends this worker's lease as part of the current transaction; False if another worker has taken the job."""
+    statement = update(models.RegradeClaim).where(models.RegradeClaim.job_id == job_id, models.RegradeClaim.owner == _OWNER).values(
+        lease_until=datetime.utcnow() + timedelta(seconds=constants.REGRADE_LEASE_SECONDS))
+    return db.execute(statement).rowcount == 1
+
+def _finish(db: Session, job: models.RegradeJob) -> None:
+    job.updated_at = datetime.utcnow()
+    db.add(job)
+    db.execute(delete(models.RegradeClaim).where(models.RegradeClaim.job_id == job.id, models.RegradeClaim.owner == _OWNER))
+    db.commit()
+
+def _run_job(job_id: int) -> None:
+    with Session(engine) as db, ThreadPoolExecutor(max_workers=constants.REGRADE_CONCURRENCY) as pool:
+        if not _claim(db, job_id):
+            return
+        job = db.get(models.RegradeJob, job_id)
+        weights = scoring.weights_for(db, job.assignment_id)
+        try:
+            while True:
+                statement = crud.submissions_for_assignment_statement(job.assignment_id).where(
+                    models.Submission.id > (job.last_submission_id or 0)
+                ).order_by(models.Submission.id).limit(constants.REGRADE_BATCH_SIZE)
+                batch = db.exec(statement).all()
+                if not batch:
+                    break
+                for submission in batch:
+                    if _regrade_submission(db, submission, weights, pool):
+                        job.changed += 1
+                    job.done += 1
+                    job.last_submission_id = submission.id
+                    job.updated_at = datetime.utcnow()
+                    db.add(job)
+                    crud.bump_versions(db, f"assignment:{job.assignment_id}")
+                    if not _renew(db, job_id):
+                        db.rollback()
+                        logger.warning("Regrade job taken over by another worker", extra={"job_id": job_id})
+                        return
+                    db.commit() # Progress and the rescored submission land together, so a restart resumes here
+            job.status = "completed"
+        except Exception as e:
+            db.rollback()
+            job = db.get(models.RegradeJob, job_id)
+            job.status, job.error = "failed", str(e)
+            logger.error("Regrade job failed", extra={"job_id": job_id, "error": str(e)})
+        _finish(db, job)
+
+def start(job_id: int) -> None:
+    """Runs a job in a worker thread, unless it is already running in this process; _run_job claims it first."""
+    if job_id in _tasks and not _tasks[job_id].done():
+        return
+    _tasks[job_id] = asyncio.create_task(asyncio.to_thread(_run_job, job_id))
+
+def _running(db: Session, assignment_id: int):
+    return db.exec(select(models.RegradeJob).where(models.RegradeJob.assignment_id == assignment_id, models.RegradeJob.status == "running")).first()
+
+def create_job(db: Session, assignment_id: int) -> models.RegradeJob:
+    """The assignment's running job, or a new one. Concurrent calls meet at the RegradeClaim primary key."""
+    running = _running(db, assignment_id)
+    if running:
+        return running
+    total = db.exec(select(func.count(models.Submission.id)).join(models.StudentAssignment).where(models.StudentAssignment.assignment_id == assignment_id)).one()
+    job = models.RegradeJob(assignment_id=assignment_id, total=total)
+    db.add(job)
+    try:
+        db.flush()
+        db.add(models.RegradeClaim(assignment_id=assignment_id, job_id=job.id, lease_until=datetime.utcnow()))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return _running(db, assignment_id)
+    db.refresh(job)
+    return job
+
+def resume_pending() -> None:
+    """Restarts jobs left running by a previous process. Called from the app lifespan."""
+    with Session(engine) as db:
+        for job in db.exec(select(models.RegradeJob).where(models.RegradeJob.status == "running")).all():
+            if db.exec(select(models.RegradeClaim).where(models.RegradeClaim.job_id == job.id)).first() is None:
+                try: # Started before claims existed
+                    db.add(models.RegradeClaim(assignment_id=job.assignment_id, job_id=job.id, lease_until=datetime.utcnow()))
+                    db.commit()
+                except IntegrityError: # A second running job of the same assignment; one copy is enough
+                    db.rollback()
+                    job.status, job.error = "failed", "Another regrade of this assignment was running."
+                    db.add(job); db.commit()
+                    continue
+            logger.info("Resuming regrade job", extra={"job_id": job.id, "last_submission_id": job.last_submission_id})
+            start(job.id)
@@ -1,9 +1,24 @@
 import subprocess
 import resource
+import mmap
 import platform
 import tempfile
 import os
+import math
+import time
+import json
+import signal
+import select
+import asyncio
+from functools import partial
+from contextlib import contextmanager
+from typing import List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
+from app import telemetry, payload_store
+from app.constants import SANDBOX_WORKERS, PAYLOAD_MAX_BYTES, OUTPUT_PREVIEW_BYTES, GENERATOR_TIME_LIMIT_SECONDS, GROUP_CASE_TIME_LIMIT_SECONDS
+from app.constants import GROUP_TIME_BUDGET_SECONDS, GROUP_CASE_OUTPUT_BYTES, TIME_LIMIT_WALL_FACTOR
+from app.constants import PROFILE_TIME_FACTOR, PROFILE_SAMPLE_INTERVAL_SECONDS, PROFILE_TOP_N, PROFILE_MAX_BYTES
 
 CPU_LIMIT_SECONDS = 3
 MEMORY_LIMIT_MB = 300
@@ -13,39 +28,163 @@ class RunResult(BaseModel):
     stderr: str
     runtime: float
     timed_out: bool
+    # Set when the runner compared the output against an expected file itself; `stdout` is
+    # then only the first OUTPUT_PREVIEW_BYTES
+    matched: Optional[bool] = None
+    # User + system CPU seconds of the child; None where the platform cannot measure it
+    cpu_time: Optional[float] = None
 
-def set_limits():
-    resource.setrlimit(resource.RLIMIT_CPU, (CPU_LIMIT_SECONDS, CPU_LIMIT_SECONDS + 1))
+def check_output(stdout: str, stderr: str, timed_out: bool, expected: str) -> bool:
+    """A testcase passes when the program finished cleanly and printed the expected output."""
+    return not timed_out and not stderr and stdout.strip() == expected.strip()
+
+def judge(result: RunResult, expected: str) -> bool:
+    """check_output for a RunResult, using the runner's own comparison when it made one."""
+    if result.matched is not None:
+        return not result.timed_out and not result.stderr and result.matched
+    return check_output(result.stdout, result.stderr, result.timed_out, expected)
+
+def set_limits(cpu_seconds: int = CPU_LIMIT_SECONDS, file_bytes: Optional[int] = None):
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
     memory_bytes = MEMORY_LIMIT_MB * 1024 * 1024
     resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    if file_bytes is not None: # stdout redirected to a file
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_bytes, file_bytes))
+
+@contextmanager
+def _mapped(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b"" # mmap refuses empty files
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
+def _stripped_bounds(view, chunk: int = 1 << 16) -> Tuple[int, int]:
+    """[start, end) of `view` without leading and trailing whitespace, found a chunk at a time."""
+    start, end = 0, len(view)
+    while start < end:
+        head = view[start:min(end, start + chunk)]
+        stripped = head.lstrip()
+        start += len(head) - len(stripped)
+        if stripped: break
+    while end > start:
+        tail = view[max(start, end - chunk):end]
+        stripped = tail.rstrip()
+        end -= len(tail) - len(stripped)
+        if stripped: break
+    return start, end
+
+def outputs_match(output_path: str, expected_path: str, chunk: int = 1 << 20) -> bool:
+    """check_output's comparison (whitespace-stripped equality) over two files, via mmap."""
+    with _mapped(output_path) as output, _mapped(expected_path) as expected:
+        out_start, out_end = _stripped_bounds(output)
+        exp_start, exp_end = _stripped_bounds(expected)
+        if out_end - out_start != exp_end - exp_start:
+            return False
+        for offset in range(0, out_end - out_start, chunk):
+            size = min(chunk, out_end - out_start - offset)
+            if output[out_start + offset:out_start + offset + size] != expected[exp_start + offset:exp_start + offset + size]:
+                return False
+    return True
 
-def run_python_code(code: str, input_data: str) -> RunResult:
+def _read_preview(path: str) -> str:
+    with open(path, "rb") as f:
+        return f.read(OUTPUT_PREVIEW_BYTES).decode(errors='ignore').strip()
+
+def _wait(process: subprocess.Popen, wall_limit: float) -> Tuple[int, Optional[float], bool]:
+    """
+    Waits for `process`, killing it once `wall_limit` seconds have passed. Returns (exit code,
+    CPU seconds, whether it was killed). CPU time is the child's own rusage from wait4, not
+    getrusage(RUSAGE_CHILDREN): the pool's threads share one process, so the latter would
+    include the other runs' children. Without wait4 (Windows) it is None.
+    """
+    if not hasattr(os, "wait4"):
+        try:
+            return process.wait(timeout=wall_limit), None, False
+        except subprocess.TimeoutExpired:
+            process.kill()
+            return process.wait(), None, True
+    try:
+        pidfd = os.pidfd_open(process.pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        killed = not select.select([pidfd], [], [], wall_limit)[0]
+        os.close(pidfd)
+        if killed:
+            process.kill()
+        _, status, usage = os.wait4(process.pid, 0)
+    else:
+        deadline, killed = time.perf_counter() + wall_limit, False
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.perf_counter() >= deadline:
+                process.kill()
+                _, status, usage = os.wait4(process.pid, 0)
+                killed = True
+                break
+            time.sleep(0.005)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, round(usage.ru_utime + usage.ru_stime, 4), killed
+
+def run_python_code(code: str, input_data: str, time_limit: Optional[float] = None,
+                    input_path: Optional[str] = None, expected_path: Optional[str] = None) -> RunResult:
+    """
+    Runs `code` with `input_data` on stdin. `time_limit` limits the child's CPU time in
+    seconds (a calibrated per-testcase limit); without it CPU_LIMIT_SECONDS applies. A
+    program that sleeps or blocks instead is stopped after TIME_LIMIT_WALL_FACTOR x the
+    limit + 1 s of wall time. `runtime` is the measured wall time, `cpu_time` the CPU time.
+    On Windows, which has no per-child rusage, the limit is on wall time and `cpu_time` is None.
+
+    With `input_path` the file itself becomes the child's stdin. With `expected_path` stdout
+    goes to a file that is compared against it (setting `matched`), so large payloads never
+    pass through this process's memory.
+    """
     is_windows = platform.system() == "Windows"
+    cpu_limit = CPU_LIMIT_SECONDS if time_limit is None else time_limit
+    wall_limit = cpu_limit if is_windows else TIME_LIMIT_WALL_FACTOR * cpu_limit + 1
     with tempfile.TemporaryDirectory() as temp_dir:
         file_path = os.path.join(temp_dir, "main.py")
         with open(file_path, "w", encoding="utf-8") as f:
             f.write(code)
+        output_path = os.path.join(temp_dir, "stdout") if expected_path else None
         try:
-            process = subprocess.run(
-                ["python", file_path],
-                input=input_data.encode('utf-8'),
-                capture_output=True,
-                timeout=CPU_LIMIT_SECONDS + 2,
-                preexec_fn=None if is_windows else set_limits,
-                check=False
-            )
-            return RunResult(
-                stdout=process.stdout.decode(errors='ignore').strip(),
-                stderr=process.stderr.decode(errors='ignore').strip(),
-                runtime=0.0,
-                timed_out=False
-            )
-        except subprocess.TimeoutExpired as e:
+            with open(input_path, "rb") if input_path else tempfile.TemporaryFile() as stdin_file, \
+                 open(output_path, "wb") if output_path else tempfile.TemporaryFile() as stdout_file, \
+                 tempfile.TemporaryFile() as stderr_file:
+                if not input_path:
+                    stdin_file.write(input_data.encode('utf-8'))
+                    stdin_file.seek(0)
+                start = time.perf_counter()
+                process = subprocess.Popen(
+                    ["python", file_path], stdin=stdin_file, stdout=stdout_file, stderr=stderr_file,
+                    preexec_fn=None if is_windows else partial(set_limits, math.ceil(cpu_limit), PAYLOAD_MAX_BYTES)
+                )
+                exit_code, cpu_time, killed = _wait(process, wall_limit)
+                runtime = round(time.perf_counter() - start, 4)
+                if not output_path:
+                    stdout_file.seek(0)
+                    stdout = stdout_file.read().decode(errors='ignore').strip()
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode(errors='ignore').strip()
+            if output_path:
+                stdout = _read_preview(output_path)
+            if killed:
+                return RunResult(stdout=stdout, stderr=f"Execution timed out ({wall_limit:g}s wall-clock limit).", runtime=runtime, timed_out=True, cpu_time=cpu_time)
+            if (not is_windows and exit_code == -signal.SIGXCPU) or (cpu_time is not None and cpu_time > cpu_limit):
+                return RunResult(stdout=stdout, stderr=f"Execution timed out ({cpu_limit:g}s CPU limit).", runtime=runtime, timed_out=True, cpu_time=cpu_time)
+            if not is_windows and exit_code == -signal.SIGXFSZ:
+                return RunResult(stdout=stdout, stderr="Output limit exceeded.", runtime=runtime, timed_out=False, matched=False, cpu_time=cpu_time)
             return RunResult(
-                stdout=e.stdout.decode(errors='ignore').strip() if e.stdout else '',
-                stderr="Execution timed out.",
-                runtime=CPU_LIMIT_SECONDS,
-                timed_out=True
+                stdout=stdout,
+                stderr=stderr,
+                runtime=runtime,
+                timed_out=False,
+                matched=outputs_match(output_path, expected_path) if output_path else None,
+                cpu_time=cpu_time
             )
         except Exception as e:
              return RunResult(
@@ -53,4 +192,500 @@ def run_python_code(code: str, input_data: str) -> RunResult:
                 stderr=f"Runner Error: {e}",
                 runtime=0,
                 timed_out=False
-            )
\ No newline at end of file
+            )
+
+def run_cpu_timed(code: str, input_data: str, runs: int, time_limit: float) -> List[RunResult]:
+    """
+    Runs `code` on `input_data` `runs` times, one after another. Each result carries the
+    run's CPU time in `cpu_time` (None on Windows): wall time includes whatever else the
+    machine was doing, which is too noisy to calibrate time limits from.
+    """
+    return [run_python_code(code, input_data, time_limit) for _ in range(runs)]
+
+def generate_input(generator: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Runs an input generator under the sandbox limits and returns (path of its output, None),
+    or (None, reason). Output is cached in payload_store by generator source, so each
+    generator runs once per PAYLOAD_DIR no matter how many submissions use it.
+    """
+    cached = payload_store.generated_path(generator)
+    if os.path.exists(cached):
+        return cached, None
+    is_windows = platform.system() == "Windows"
+    output_path = payload_store.temp_path()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "generator.py")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(generator)
+        try:
+            with open(output_path, "wb") as out:
+                process = subprocess.run(
+                    ["python", file_path],
+                    stdin=subprocess.DEVNULL,
+                    stdout=out,
+                    stderr=subprocess.PIPE,
+                    timeout=GENERATOR_TIME_LIMIT_SECONDS,
+                    preexec_fn=None if is_windows else partial(set_limits, math.ceil(GENERATOR_TIME_LIMIT_SECONDS), PAYLOAD_MAX_BYTES),
+                    check=False
+                )
+            if process.returncode != 0:
+                return None, f"Input generator failed: {process.stderr.decode(errors='ignore').strip()[-500:] or f'exit status {process.returncode}'}"
+            payload_store.adopt(output_path, cached)
+            return cached, None
+        except subprocess.TimeoutExpired:
+            return None, f"Input generator timed out ({GENERATOR_TIME_LIMIT_SECONDS:g}s limit)."
+        finally:
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+
+def _input_path(testcase) -> Tuple[Optional[str], Optional[str]]:
+    """(file to use as stdin, None) for a file-backed or generated input, (None, None) otherwise, or (None, reason)."""
+    if testcase.generator:
+        return generate_input(testcase.generator)
+    if testcase.input_digest:
+        return payload_store.path(testcase.input_digest), None
+    return None, None
+
+def execute_testcase(code: str, testcase) -> RunResult:
+    """run_python_code for a testcase snapshot, resolving file-backed and generated payloads."""
+    input_path, error = _input_path(testcase)
+    if error:
+        return RunResult(stdout='', stderr=f"Runner Error: {error}", runtime=0, timed_out=False)
+    expected_path = payload_store.path(testcase.expected_digest) if testcase.expected_digest else None
+    return run_python_code(code, testcase.input, testcase.time_limit, input_path=input_path, expected_path=expected_path)
+
+# Runs many cases from one interpreter, which compiles the code once and forks a child per
+# case, so no state carries from one case to the next and a timeout is a SIGKILL the program
+# cannot catch. Argv: <main.py> <budget seconds> <output bytes per case> <stop at first failure>
+# <wall factor>.
+# Frames in, on fd 0: "<index> <time limit> <input size> <expected size>\n", the input, then
+# the expected output (size -1: none sent). Before any case runs the harness moves the frame
+# pipes to private fds, points fds 0/1 at /dev/null and makes itself non-dumpable, so its
+# /proc/<pid>/fd is out of reach. A child gets only its case's input (a temp file) as fd 0,
+# capture files as fds 1/2, and closes everything else. The expected output is read after the
+# child is gone. A case's time limit is on its CPU time (from wait4); one that sleeps or blocks
+# is killed after <wall factor> x the limit + 1 s. Frames out: "<index> <status> <runtime>
+# <cpu time> <limit> <stdout size> <stderr size>\n" and the output bytes, then
+# "end <done|failed|budget>": with stop-at-first-failure the harness quits once a case fails,
+# and it never starts a case past the wall-time budget.
+_BATCH_HARNESS = r"""
+import os, sys, math, time, select, signal, resource, tempfile, traceback
+
+def read_header(fd):
+    line = b""
+    while not line.endswith(b"\n"):
+        byte = os.read(fd, 1) # Unbuffered, so no later frame sits in this process's memory
+        if not byte:
+            return None
+        line += byte
+    return line.split()
+
+def read_exact(fd, size, sink=None):
+    chunks = []
+    while size > 0:
+        chunk = os.read(fd, min(size, 1 << 16))
+        if not chunk:
+            raise EOFError("frame cut short")
+        size -= len(chunk)
+        if sink is None:
+            chunks.append(chunk)
+        else:
+            sink.write(chunk)
+    return b"".join(chunks)
+
+def child(code, limit, output_bytes):
+    os.setpgid(0, 0)
+    cpu = math.ceil(limit)
+    try:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (output_bytes, output_bytes))
+    except (ValueError, OSError):
+        pass
+    try:
+        exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            sys.stderr.write(e.code + "\n")
+    except BaseException as e:
+        sys.stderr.write("".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next)))
+    for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+        try:
+            stream.flush()
+        except BaseException:
+            pass
+    os._exit(0)
+
+def wait(pid, limit):
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        timed_out = not select.select([pidfd], [], [], max(limit, 0))[0]
+        os.close(pidfd)
+    else:
+        deadline, timed_out = time.monotonic() + limit, True
+        while time.monotonic() < deadline:
+            if os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT):
+                timed_out = False
+                break
+            time.sleep(0.002)
+    try:
+        os.killpg(pid, signal.SIGKILL) # The case itself on a timeout; anything it left running otherwise
+    except OSError:
+        pass
+    _, status, usage = os.wait4(pid, 0)
+    return timed_out, status, usage.ru_utime + usage.ru_stime
+
+def run_case(code, data, out, err, limit, wall, output_bytes):
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(data.fileno(), 0)
+            os.dup2(out.fileno(), 1)
+            os.dup2(err.fileno(), 2)
+            os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+            child(code, limit, output_bytes)
+        finally:
+            os._exit(1)
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+    timed_out, status, cpu = wait(pid, wall)
+    runtime = time.perf_counter() - start
+    signalled = os.WTERMSIG(status) if os.WIFSIGNALED(status) else None
+    if timed_out:
+        return b"walltime", runtime, cpu, b""
+    if signalled == signal.SIGXCPU or cpu > limit:
+        return b"timeout", runtime, cpu, b""
+    if signalled == signal.SIGXFSZ:
+        return b"ok", runtime, cpu, b"\nOutput limit exceeded."
+    if signalled is not None:
+        return b"ok", runtime, cpu, b"\nProcess killed by signal %d." % signalled
+    return b"ok", runtime, cpu, b""
+
+def main():
+    source_path, budget, output_bytes, stop_at_failure, wall_factor = sys.argv[1], float(sys.argv[2]), int(sys.argv[3]), sys.argv[4] == "1", float(sys.argv[5])
+    deadline = time.monotonic() + budget
+    try:
+        import ctypes
+        ctypes.CDLL(None).prctl(4, 0, 0, 0, 0) # PR_SET_DUMPABLE
+    except Exception:
+        pass
+    frames_in, frames_out = os.dup(0), os.dup(1)
+    null = os.open(os.devnull, os.O_RDWR)
+    os.dup2(null, 0)
+    os.dup2(null, 1)
+    os.close(null)
+    for stream in (sys.stdin, sys.stdout, sys.stderr):
+        stream.reconfigure(encoding="utf-8")
+    with open(source_path, encoding="utf-8") as f:
+        source = f.read()
+    try:
+        code, compile_error = compile(source, "main.py", "exec"), None
+    except SyntaxError:
+        code, compile_error = None, traceback.format_exc(limit=0).encode()
+    end = b"done"
+    while True:
+        header = read_header(frames_in)
+        if not header:
+            break
+        index, limit, input_size, expected_size = header[0], float(header[1]), int(header[2]), int(header[3])
+        wall = min(wall_factor * limit + 1, deadline - time.monotonic())
+        if wall <= 0:
+            end = b"budget"
+            break
+        with tempfile.TemporaryFile() as data, tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+            read_exact(frames_in, input_size, data)
+            data.flush()
+            data.seek(0)
+            if compile_error:
+                status, runtime, cpu, note = b"ok", 0.0, 0.0, compile_error
+            else:
+                status, runtime, cpu, note = run_case(code, data, out, err, limit, wall, output_bytes)
+            out.seek(0)
+            err.seek(0)
+            stdout, stderr = out.read(), (err.read() + note).strip()
+        expected = read_exact(frames_in, expected_size) if expected_size >= 0 else None
+        os.write(frames_out, b"%s %s %.6f %.6f %.3f %d %d\n" % (index, status, runtime, cpu, limit, len(stdout), len(stderr)) + stdout + stderr)
+        failed = status != b"ok" or stderr or (expected is not None and stdout.decode(errors="ignore").strip() != expected.decode(errors="ignore").strip())
+        del stdout, stderr, expected
+        if stop_at_failure and failed:
+            end = b"failed"
+            break
+    os.write(frames_out, b"end %s\n" % end)
+
+main()
+"""
+
+def _parse_frames(raw: bytes) -> Tuple[dict, Optional[bytes]]:
+    """Complete output frames of the batch harness by case index, and how it ended (None if it was cut off)."""
+    frames, pos = {}, 0
+    while True:
+        end = raw.find(b"\n", pos)
+        if end == -1:
+            return frames, None
+        fields = raw[pos:end].split()
+        if len(fields) == 2 and fields[0] == b"end":
+            return frames, fields[1]
+        try:
+            index, status, runtime, cpu_time, limit, out_size, err_size = fields
+            index, out_size, err_size = int(index), int(out_size), int(err_size)
+        except ValueError:
+            return frames, None
+        body = raw[end + 1:end + 1 + out_size + err_size]
+        if len(body) < out_size + err_size:
+            return frames, None
+        timeouts = {b"timeout": f"Execution timed out ({float(limit):g}s CPU limit).", b"walltime": f"Execution timed out (wall-clock limit for {float(limit):g}s of CPU)."}
+        frames[index] = RunResult(
+            stdout=body[:out_size].decode(errors='ignore').strip(),
+            stderr=body[out_size:].decode(errors='ignore').strip() or timeouts.get(status, ""),
+            runtime=round(float(runtime), 4),
+            timed_out=status in timeouts,
+            cpu_time=round(float(cpu_time), 4)
+        )
+        pos = end + 1 + out_size + err_size
+
+def run_batch(code: str, inputs: Sequence[str], time_limits: Sequence[float], expected: Optional[Sequence[str]] = None) -> List[RunResult]:
+    """
+    Runs `code` once per input from a single sandboxed process (see _BATCH_HARNESS), each
+    case in its own forked child with its own CPU time limit. The batch as a whole never
+    runs past GROUP_TIME_BUDGET_SECONDS. With `expected`, it stops at the first case that
+    fails. Cases it never ran come back as failed results saying why.
+    """
+    if not inputs:
+        return []
+    is_windows = platform.system() == "Windows"
+    budget = min(sum(time_limits), GROUP_TIME_BUDGET_SECONDS)
+    expected_data = [text.encode('utf-8') for text in expected] if expected is not None else [None] * len(inputs)
+    frames = b"".join(
+        b"%d %.3f %d %d\n" % (i, limit, len(data), -1 if want is None else len(want)) + data + (want or b"")
+        for i, (data, limit, want) in enumerate(zip((text.encode('utf-8') for text in inputs), time_limits, expected_data))
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        harness_path, file_path = os.path.join(temp_dir, "harness.py"), os.path.join(temp_dir, "main.py")
+        with open(harness_path, "w", encoding="utf-8") as f:
+            f.write(_BATCH_HARNESS)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(code)
+        try:
+            process = subprocess.run(
+                ["python", harness_path, file_path, "%.3f" % budget, str(GROUP_CASE_OUTPUT_BYTES), "0" if expected is None else "1", f"{TIME_LIMIT_WALL_FACTOR:g}"],
+                input=frames,
+                capture_output=True,
+                timeout=budget + 2,
+                preexec_fn=None if is_windows else partial(set_limits, math.ceil(budget) + 1),
+                check=False
+            )
+            raw, missing = process.stdout, f"Batch process exited before this case (exit status {process.returncode})."
+            if not is_windows and process.returncode == -signal.SIGXCPU:
+                missing = "Execution timed out (CPU limit)."
+        except subprocess.TimeoutExpired as e:
+            raw, missing = e.stdout or b"", f"Execution timed out ({budget + 2:g}s batch limit)."
+        except Exception as e:
+            raw, missing = b"", f"Runner Error: {e}"
+    results, ending = _parse_frames(raw)
+    if ending == b"failed":
+        missing = "Not run: an earlier case of this all-or-nothing group failed."
+    elif ending == b"budget":
+        missing = f"Not run: the group's {budget:g}s time budget ran out."
+    timed_out = missing.startswith("Execution timed out") or ending == b"budget"
+    return [results.get(i) or RunResult(stdout='', stderr=missing, runtime=0, timed_out=timed_out) for i in range(len(inputs))]
+
+def execute_group(code: str, group) -> List[RunResult]:
+    """run_batch over a testcase group snapshot; an all-or-nothing group stops at its first failure."""
+    return run_batch(code, [tc.input for tc in group.testcases], [tc.time_limit or GROUP_CASE_TIME_LIMIT_SECONDS for tc in group.testcases],
+                     expected=[tc.expected for tc in group.testcases] if group.scoring == "all" else None)
+
+# Runs the program once under cProfile (functions), a SIGPROF sampler (lines, every
+# <interval> of CPU time) and tracemalloc (peak and allocating lines), with stdout discarded,
+# and writes the top-<n> tables as JSON to <report>. Args: <main.py> <report> <limit> <n> <interval>.
+_PROFILE_HARNESS = r'''
+import os, sys, json, time, signal, cProfile, pstats, linecache, tracemalloc, traceback
+from collections import defaultdict
+
+class Timeout(BaseException):
+    pass
+
+def main():
+    source_path, report_path, limit, top, interval = sys.argv[1], sys.argv[2], float(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5])
+    with open(source_path, encoding="utf-8") as f:
+        source = f.read()
+    report = {"timed_out": False, "error": None, "runtime": 0.0, "sample_interval": interval}
+    try:
+        code = compile(source, source_path, "exec")
+    except SyntaxError as e:
+        report["error"] = f"SyntaxError: {e.msg} (line {e.lineno})"
+        with open(report_path, "w") as f:
+            json.dump(report, f)
+        return
+    samples = defaultdict(int) # No call the profiler would record from inside the handler
+
+    def on_sample(signum, frame):
+        while frame is not None and frame.f_code.co_filename != source_path:
+            frame = frame.f_back
+        if frame is not None:
+            samples[frame.f_lineno] += 1
+
+    def on_alarm(signum, frame):
+        raise Timeout()
+
+    def source_line(line):
+        return linecache.getline(source_path, line).strip()[:120]
+
+    sys.stdout = open(os.devnull, "w")
+    signal.signal(signal.SIGPROF, on_sample)
+    signal.signal(signal.SIGALRM, on_alarm)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        try:
+            signal.setitimer(signal.ITIMER_REAL, limit)
+            signal.setitimer(signal.ITIMER_PROF, interval, interval)
+            profiler.enable()
+            exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+        finally:
+            profiler.disable()
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except Timeout:
+        report["timed_out"] = True
+    except SystemExit:
+        pass
+    except BaseException as e:
+        report["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()[-300:]
+    report["runtime"] = time.perf_counter() - start
+    report["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    # Grouping first is much faster than Snapshot.filter_traces
+    allocations = [stat for stat in tracemalloc.take_snapshot().statistics("lineno") if stat.traceback[0].filename == source_path and stat.traceback[0].lineno > 0]
+    tracemalloc.stop()
+
+    functions = []
+    for (file, line, name), (_, calls, own, total, _) in pstats.Stats(profiler).stats.items():
+        if file == sys.argv[0] or "_lsprof" in name or name == "<built-in method builtins.exec>":
+            continue # The harness itself
+        where = "main.py" if file == source_path else "built-in" if file == "~" else os.path.basename(file)
+        functions.append({"function": name, "file": where, "line": line, "calls": calls, "self_seconds": round(own, 6), "total_seconds": round(total, 6)})
+    report["functions"] = sorted(functions, key=lambda f: f["self_seconds"], reverse=True)[:top]
+    report["samples"] = total = sum(samples.values())
+    report["lines"] = [
+        {"line": line, "samples": count, "share": round(count / total, 3), "source": source_line(line)}
+        for line, count in sorted(samples.items(), key=lambda item: item[1], reverse=True)[:top]
+    ]
+    report["allocations"] = [
+        {"line": stat.traceback[0].lineno, "bytes": stat.size, "count": stat.count, "source": source_line(stat.traceback[0].lineno)}
+        for stat in allocations[:top]
+    ]
+    with open(report_path, "w") as f:
+        json.dump(report, f)
+
+main()
+'''
+
+def _bounded(report: dict) -> dict:
+    """Drops the least significant table rows until the report fits PROFILE_MAX_BYTES."""
+    tables = [key for key in ("allocations", "lines", "functions") if isinstance(report.get(key), list)]
+    while len(json.dumps(report)) > PROFILE_MAX_BYTES and any(report[key] for key in tables):
+        longest = max(tables, key=lambda key: len(report[key]))
+        report[longest] = report[longest][:-1]
+    return report
+
+def profile_program(code: str, testcase) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Runs `code` on a testcase snapshot under _PROFILE_HARNESS, with the testcase's time limit
+    stretched by PROFILE_TIME_FACTOR. Returns (report, None), or (None, reason) when the
+    program left no report (it killed its own interpreter, or the sandbox did).
+    """
+    if platform.system() == "Windows":
+        return None, "Profiling needs a POSIX sandbox."
+    input_path, error = _input_path(testcase)
+    if error:
+        return None, error
+    limit = (testcase.time_limit or CPU_LIMIT_SECONDS) * PROFILE_TIME_FACTOR
+    with tempfile.TemporaryDirectory() as temp_dir:
+        harness_path, file_path, report_path = (os.path.join(temp_dir, name) for name in ("harness.py", "main.py", "report.json"))
+        with open(harness_path, "w", encoding="utf-8") as f:
+            f.write(_PROFILE_HARNESS)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(code)
+        stdin_file = open(input_path, "rb") if input_path else None
+        try:
+            subprocess.run(
+                ["python", harness_path, file_path, report_path, f"{limit:g}", str(PROFILE_TOP_N), f"{PROFILE_SAMPLE_INTERVAL_SECONDS:g}"],
+                input=None if stdin_file else testcase.input.encode('utf-8'),
+                stdin=stdin_file,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=limit + 2,
+                preexec_fn=partial(set_limits, math.ceil(limit) + 1, PAYLOAD_MAX_BYTES),
+                check=False
+            )
+        except subprocess.TimeoutExpired:
+            return None, f"Profiling timed out ({limit + 2:g}s limit)."
+        finally:
+            if stdin_file:
+                stdin_file.close()
+        # Written by the student's own process, so its size and shape are not trusted
+        if not os.path.exists(report_path) or os.path.getsize(report_path) > 4 * PROFILE_MAX_BYTES:
+            return None, "The program exited without a profiling report."
+        try:
+            with open(report_path, encoding="utf-8") as f:
+                report = json.load(f)
+        except (ValueError, UnicodeDecodeError):
+            return None, "The profiling report was unreadable."
+    if not isinstance(report, dict) or len(json.dumps(_bounded(report))) > PROFILE_MAX_BYTES:
+        return None, "The profiling report was unreadable."
+    return report, None
+
+_sandbox_pool = ThreadPoolExecutor(max_workers=SANDBOX_WORKERS, thread_name_prefix="sandbox")
+
+def _run_slot(run, *args):
+    telemetry.SANDBOX_QUEUE.dec("waiting")
+    telemetry.SANDBOX_QUEUE.inc("running")
+    try:
+        result = run(*args)
+    finally:
+        telemetry.SANDBOX_QUEUE.dec("running")
+    for case in (result if isinstance(result, list) else [result]):
+        telemetry.SANDBOX_RUNS.inc("timeout" if case.timed_out else "error" if case.stderr else "ok")
+    return result
+
+async def run_in_sandbox(code: str, input_data: str, time_limit: Optional[float] = None) -> RunResult:
+    """
+    Runs code on the bounded sandbox pool without blocking the event loop. Runs beyond
+    SANDBOX_WORKERS wait their turn, which shows up as the "waiting" queue depth.
+    """
+    return await _submit(run_python_code, code, input_data, time_limit)
+
+async def run_testcase(code: str, testcase) -> RunResult:
+    """run_in_sandbox for a testcase snapshot (see execute_testcase)."""
+    return await _submit(execute_testcase, code, testcase)
+
+async def run_group(code: str, group) -> List[RunResult]:
+    """execute_group on the sandbox pool; the whole group takes one slot."""
+    return await _submit(execute_group, code, group)
+
+async def generate_in_sandbox(generator: str) -> Tuple[Optional[str], Optional[str]]:
+    """generate_input on the sandbox pool."""
+    return await asyncio.wrap_future(_sandbox_pool.submit(generate_input, generator))
+
+async def run_cpu_timed_in_sandbox(code: str, input_data: str, runs: int, time_limit: float) -> List[RunResult]:
+    """run_cpu_timed on the sandbox pool; the repetitions share one slot."""
+    return await _submit(run_cpu_timed, code, input_data, runs, time_limit)
+
+async def run_batch_in_sandbox(code: str, inputs: Sequence[str], time_limits: Sequence[float]) -> List[RunResult]:
+    return await _submit(run_batch, code, inputs, time_limits)
+
+async def profile_in_sandbox(code: str, testcase) -> Tuple[Optional[dict], Optional[str]]:
+    """profile_program on the sandbox pool."""
+    return await asyncio.wrap_future(_sandbox_pool.submit(profile_program, code, testcase))
+
+async def _submit(run, *args):
+    telemetry.SANDBOX_QUEUE.inc("waiting")
+    future = _sandbox_pool.submit(_run_slot, run, *args)
+    # A run cancelled before it got a slot never reaches _run_slot
+    future.add_done_callback(lambda f: f.cancelled() and telemetry.SANDBOX_QUEUE.dec("waiting"))
+    return await asyncio.wrap_future(future)
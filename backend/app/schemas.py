@@ -11,6 +11,149 @@ class TestCase(SQLModel):
     input: str
     expected: str
     points: int
+    time_limit: Optional[float] = None # Seconds; None means the default limit
+    # File-backed or generated payloads (models.TestCasePayload); input/expected are then previews
+    input_digest: Optional[str] = None
+    generator: Optional[str] = None
+    expected_digest: Optional[str] = None
+
+class TestCaseGroup(BaseModel):
+    id: int
+    name: str
+    points: int
+    scoring: str
+    testcases: List[TestCase]
+
+# Immutable copy of a Package and its testcases, as held by app.package_cache.
+# `testcases` holds only the testcases outside any group.
+class PackageSnapshot(BaseModel):
+    id: int
+    title: str
+    prompt: str
+    difficulty: str
+    testcases: List[TestCase]
+    groups: List[TestCaseGroup] = []
+
+class PackageSummary(BaseModel):
+    id: int
+    title: str
+    prompt: str
+    difficulty: str
+    class Config:
+        from_attributes = True
+
+class PackagePage(BaseModel):
+    items: List[PackageSummary]
+    # Pass back as `after` to get the next page; None on the last page
+    next_cursor: Optional[int] = None
+
+class NearDuplicate(BaseModel):
+    package_id: int
+    duplicate_of: int
+    cluster_id: int
+    similarity: float
+    class Config:
+        from_attributes = True
+
+class SimilarPair(BaseModel):
+    submission_a: int
+    submission_b: int
+    roll_a: Optional[int] = None
+    roll_b: Optional[int] = None
+    shared: int
+    score: float
+
+class TestCaseCreate(BaseModel):
+    type: str = Field(default="hidden", pattern="^(sample|hidden)$")
+    input: str = ""
+    expected: str = ""
+    points: int = Field(ge=0)
+
+class GroupCaseCreate(BaseModel):
+    input: str = ""
+    expected: Optional[str] = None # Filled in from the package's reference solution when omitted
+
+class TestCaseGroupCreate(BaseModel):
+    name: str
+    points: int = Field(ge=0)
+    scoring: str = Field(default="all", pattern="^(all|partial)$")
+    testcases: List[GroupCaseCreate] = []
+    # Python script printing a JSON list of input strings; its cases get their expected output from the solution
+    generator: Optional[str] = None
+
+class PackageCreate(BaseModel):
+    title: str
+    prompt: str
+    difficulty: str = "medium"
+    testcases: List[TestCaseCreate] = []
+    groups: List[TestCaseGroupCreate] = []
+    solution: Optional[str] = None
+
+class TestCaseUpdate(BaseModel):
+    input: Optional[str] = None
+    expected: Optional[str] = None
+    points: Optional[int] = Field(default=None, ge=0)
+
+class RegradeJobStatus(BaseModel):
+    id: int
+    assignment_id: int
+    status: str
+    total: int
+    done: int
+    changed: int
+    error: Optional[str] = None
+    updated_at: datetime
+    class Config:
+        from_attributes = True
+
+class ScoringWeights(BaseModel):
+    alpha: float = Field(ge=0)
+    beta: float = Field(ge=0)
+    gamma: float = Field(ge=0)
+    severity: Dict[str, float]
+
+class ScoringGrid(BaseModel):
+    alphas: List[float] = Field(min_length=1)
+    betas: List[float] = Field(min_length=1)
+    gammas: List[float] = Field(min_length=1)
+    # Alternative ERROR_SEVERITY tables; defaults to the current one
+    severities: Optional[List[Dict[str, float]]] = None
+
+class ArchiveStatus(BaseModel):
+    assignment_id: int
+    students: int
+    submissions: int
+    archived_at: datetime
+    class Config:
+        from_attributes = True
+
+class SubmissionProfile(BaseModel):
+    submission_id: int
+    testcase_id: Optional[int] = None
+    profiled_at: datetime
+    error: Optional[str] = None
+    runtime: Optional[float] = None
+    timed_out: bool = False
+    peak_bytes: Optional[int] = None
+    # Top entries by self time, by line samples and by bytes still allocated at exit
+    functions: List[Dict[str, Any]] = []
+    lines: List[Dict[str, Any]] = []
+    allocations: List[Dict[str, Any]] = []
+
+class LlmUsageSummary(BaseModel):
+    calls: int
+    prompt_tokens: int
+    response_tokens: int
+    seconds: float
+    groups: List[Dict[str, Any]] # By (model, purpose, outcome)
+    assignments: List[Dict[str, Any]] # assignment_id, calls, tokens, budget_used (None when uncapped)
+    teachers: List[Dict[str, Any]] # teacher_id, calls, tokens, budget_used (today's)
+
+class QuestionBankImport(BaseModel):
+    imported: int
+    skipped: int # Already in the bank, or repeated in the file
+    rejected: int # Malformed, or a payload file it needs was missing
+    payloads: int # Payload files written
 
 class Token(BaseModel):
     access_token: str
@@ -33,6 +176,25 @@ class GenerateFromTextRequest(BaseModel):
 class AssignmentCreate(BaseModel):
     assignment_name: str
     package_ids: List[int] = Field(min_length=1)
+    # Minimum distance between students sharing a question; defaults to D_ADJACENCY
+    adjacency_distance: Optional[int] = Field(default=None, ge=0)
+    # Optional classroom grid; students are seated row-major by roll number
+    seat_rows: Optional[int] = Field(default=None, gt=0)
+    seat_cols: Optional[int] = Field(default=None, gt=0)
+    neighbourhood: int = Field(default=4, description="4 or 8 neighbouring seats")
+    seed: Optional[int] = None
+
+class AssignmentUpdate(BaseModel):
+    add_package_ids: List[int] = Field(default_factory=list)
+    remove_package_ids: List[int] = Field(default_factory=list)
+    # Distance to keep for the students placed now; defaults to the one the assignment was created with
+    adjacency_distance: Optional[int] = Field(default=None, ge=0)
+
+class AssignmentUpdateResult(BaseModel):
+    placed_rolls: List[int]
+    moved_rolls: List[int]
+    # Already submitted on a removed package, so left where they are
+    pinned_rolls: List[int]
 
 class SubmissionCreate(BaseModel):
     roll: int
@@ -45,12 +207,14 @@ class RunCodeRequest(BaseModel):
     code: str
 
 class RunCodeResult(BaseModel):
+    index: Optional[int] = None # Position among the sample testcases; streamed results arrive out of order
     stdout: str
     stderr: str
     runtime: float
     timed_out: bool
     passed: bool
     testcase_type: str
+    time_limit: Optional[float] = None
 
 class RunCodeResponse(BaseModel):
     overall_output: str
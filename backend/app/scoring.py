@@ -0,0 +1,132 @@
+import itertools
+import threading
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import case, update
+from sqlmodel import Session, select
+from app import models, schemas, crud, constants
+
+# Score weights per assignment and a vectorized what-if simulator over them.
+# final_score = clip(alpha * raw_test_score + beta * quality_score - gamma * severity[error_type], 0, 100)
+# The simulator loads an assignment's stored components into numpy columns once (cached
+# until the assignment's version stamp moves) and evaluates a whole grid of weight
+# settings as one (settings x students) array operation. numpy is imported inside the
+# functions that use it so it stays out of worker boot.
+
+MAX_GRID_SIZE = 2000
+_HISTOGRAM_BINS = [float(x) for x in range(0, 101, 10)]
+
+_columns_lock = threading.Lock()
+_columns_cache: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+
+
+def default_weights() -> schemas.ScoringWeights:
+    return schemas.ScoringWeights(alpha=constants.ALPHA, beta=constants.BETA, gamma=constants.GAMMA, severity=dict(constants.ERROR_SEVERITY))
+
+def weights_for(db: Session, assignment_id: int) -> schemas.ScoringWeights:
+    policy = db.get(models.ScoringPolicy, assignment_id)
+    if policy is None:
+        return default_weights()
+    return schemas.ScoringWeights(alpha=policy.alpha, beta=policy.beta, gamma=policy.gamma, severity=policy.severity)
+
+def final_score(raw_test_score: float, quality_score: float, error_penalty: float, weights: schemas.ScoringWeights) -> float:
+    return max(0, min(100, (weights.alpha * raw_test_score + weights.beta * quality_score - weights.gamma * error_penalty)))
+
+def _error_type(submission: models.Submission) -> Optional[str]:
+    return next(iter(submission.error_counts or {}), None)
+
+def _result_key(result: Dict[str, Any]):
+    """Column of a stored test result: its testcase id, or "group:<id>" for a testcase group."""
+    return f"group:{result['group_id']}" if result.get("group_id") is not None else result.get("testcase_id")
+
+def load_columns(db: Session, assignment_id: int) -> Dict[str, Any]:
+    """Columnar view of an assignment's stored score components, reused until the assignment changes."""
+    import numpy as np
+    version = crud.get_versions(db, [f"assignment:{assignment_id}"])[f"assignment:{assignment_id}"]
+    with _columns_lock:
+        cached = _columns_cache.get(assignment_id)
+        if cached and cached[0] == version:
+            return cached[1]
+    submissions = crud.get_submissions_for_assignment(db, assignment_id)
+    error_types = sorted({t for t in (_error_type(s) for s in submissions) if t})
+    type_index = {t: i + 1 for i, t in enumerate(error_types)} # 0 means "no error"
+    testcase_ids = sorted({_result_key(r) for s in submissions for r in (s.test_results or [])}, key=lambda x: (x is None, isinstance(x, str), x if x is not None else 0))
+    tc_index = {tc_id: i for i, tc_id in enumerate(testcase_ids)}
+    passed = np.zeros((len(submissions), len(testcase_ids)), dtype=bool)
+    for row, s in enumerate(submissions):
+        for r in s.test_results or []:
+            passed[row, tc_index[_result_key(r)]] = bool(r.get("passed"))
+    columns = {
+        "submission_id": np.array([s.id for s in submissions], dtype=np.int64),
+        "roll": np.array([s.student_assignment.student.roll for s in submissions], dtype=np.int64),
+        "raw_test_score": np.array([s.raw_test_score for s in submissions], dtype=np.float64),
+        "quality_score": np.array([s.quality_score for s in submissions], dtype=np.float64),
+        "final_score": np.array([s.final_score for s in submissions], dtype=np.float64),
+        "error_type": np.array([type_index.get(_error_type(s), 0) for s in submissions], dtype=np.int64),
+        "error_types": ["none"] + error_types,
+        "testcase_ids": testcase_ids,
+        "passed": passed,
+    }
+    with _columns_lock:
+        _columns_cache[assignment_id] = (version, columns)
+    return columns
+
+def simulate(columns: Dict[str, Any], grid: schemas.ScoringGrid) -> Dict[str, Any]:
+    """Evaluates final_score for every combination in `grid` in one vectorized pass."""
+    import numpy as np
+    severities = grid.severities or [default_weights().severity]
+    settings = list(itertools.product(grid.alphas, grid.betas, grid.gammas, range(len(severities))))
+    if len(settings) > MAX_GRID_SIZE:
+        raise ValueError(f"Grid has {len(settings)} settings; the limit is {MAX_GRID_SIZE}.")
+    alpha, beta, gamma, sev_idx = (np.array(c, dtype=np.float64) for c in zip(*settings))
+    # severity_table[k, e] = penalty of error type e under severity setting k
+    severity_table = np.array([[0.0] + [float(s.get(t, 0)) for t in columns["error_types"][1:]] for s in severities])
+    penalty = severity_table[sev_idx.astype(np.int64)][:, columns["error_type"]] # (settings, students)
+    scores = np.clip(alpha[:, None] * columns["raw_test_score"] + beta[:, None] * columns["quality_score"] - gamma[:, None] * penalty, 0, 100)
+    deltas = scores - columns["final_score"]
+
+    results = []
+    if scores.shape[1]:
+        means, stds = scores.mean(axis=1), scores.std(axis=1)
+        p10, p50, p90 = np.percentile(scores, [10, 50, 90], axis=1)
+        mean_deltas = deltas.mean(axis=1)
+    for k, (a, b, g, s) in enumerate(settings):
+        entry = {"alpha": a, "beta": b, "gamma": g, "severity": severities[s]}
+        if scores.shape[1]:
+            entry.update({
+                "mean": round(float(means[k]), 2), "std": round(float(stds[k]), 2),
+                "p10": round(float(p10[k]), 2), "median": round(float(p50[k]), 2), "p90": round(float(p90[k]), 2),
+                "histogram": np.histogram(scores[k], bins=_HISTOGRAM_BINS)[0].tolist(),
+                "mean_delta": round(float(mean_deltas[k]), 2),
+                "deltas": np.round(deltas[k], 2).tolist(),
+            })
+        results.append(entry)
+    return {
+        "rolls": columns["roll"].tolist(),
+        "current": {"mean": round(float(columns["final_score"].mean()), 2) if len(columns["roll"]) else None,
+                    "histogram": np.histogram(columns["final_score"], bins=_HISTOGRAM_BINS)[0].tolist()},
+        "testcase_pass_rates": dict(zip([str(t) for t in columns["testcase_ids"]], np.round(columns["passed"].mean(axis=0), 3).tolist())) if len(columns["roll"]) else {},
+        "histogram_bins": list(_HISTOGRAM_BINS),
+        "settings": results,
+    }
+
+def commit(db: Session, assignment_id: int, weights: schemas.ScoringWeights) -> int:
+    """Stores the weights for the assignment and rescores all its submissions in one UPDATE."""
+    import numpy as np
+    columns = load_columns(db, assignment_id)
+    severity = np.array([0.0] + [float(weights.severity.get(t, 0)) for t in columns["error_types"][1:]])
+    penalty = severity[columns["error_type"]]
+    scores = np.clip(weights.alpha * columns["raw_test_score"] + weights.beta * columns["quality_score"] - weights.gamma * penalty, 0, 100)
+
+    policy = db.get(models.ScoringPolicy, assignment_id) or models.ScoringPolicy(assignment_id=assignment_id)
+    policy.alpha, policy.beta, policy.gamma, policy.severity = weights.alpha, weights.beta, weights.gamma, dict(weights.severity)
+    db.add(policy)
+    ids = columns["submission_id"].tolist()
+    if ids:
+        db.execute(update(models.Submission).where(models.Submission.id.in_(ids)).values(
+            final_score=case(dict(zip(ids, scores.tolist())), value=models.Submission.id),
+            error_penalty=case(dict(zip(ids, penalty.tolist())), value=models.Submission.id),
+        ).execution_options(synchronize_session=False))
+    student_ids = db.exec(select(models.StudentAssignment.student_id).where(models.StudentAssignment.assignment_id == assignment_id)).all()
+    crud.bump_versions(db, f"assignment:{assignment_id}", *[f"student:{sid}" for sid in student_ids])
+    db.commit()
+    return len(ids)
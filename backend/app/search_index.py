@@ -0,0 +1,95 @@
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import text, column, Integer
+from sqlmodel import Session, select
+from app import models
+
+# Full-text index over package title, prompt and difficulty.
+#   Postgres: `package_search` side table holding a weighted tsvector, with a GIN index.
+#   SQLite:   contentless FTS5 table `package_fts` whose rowid is the package id.
+# Other dialects fall back to a LIKE scan. The index is written by
+# crud.create_package_with_testcases in the same transaction as the package itself.
+
+def _pg_document(title: str, prompt: str, difficulty: str) -> str:
+    """SQL for the weighted tsvector, given SQL expressions for the three source columns."""
+    return (
+        f"setweight(to_tsvector('english', coalesce({title}, '')), 'A') || "
+        f"setweight(to_tsvector('english', coalesce({prompt}, '')), 'B') || "
+        f"setweight(to_tsvector('simple', coalesce({difficulty}, '')), 'C')"
+    )
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+def ensure_index(engine) -> None:
+    """Creates the index structures if missing and backfills packages that predate them."""
+    dialect = _dialect(engine)
+    with engine.begin() as conn:
+        if dialect == "postgresql":
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS package_search ("
+                " package_id INTEGER PRIMARY KEY REFERENCES package(id) ON DELETE CASCADE,"
+                " document TSVECTOR NOT NULL)"
+            ))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_package_search_document ON package_search USING GIN (document)"))
+            conn.execute(text(
+                "INSERT INTO package_search (package_id, document) "
+                f"SELECT id, {_pg_document('title', 'prompt', 'difficulty')} FROM package WHERE id NOT IN (SELECT package_id FROM package_search)"
+            ))
+        elif dialect == "sqlite":
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS package_fts USING fts5(title, prompt, difficulty, content='')"))
+            conn.execute(text(
+                "INSERT INTO package_fts (rowid, title, prompt, difficulty) "
+                "SELECT id, title, prompt, difficulty FROM package WHERE id NOT IN (SELECT rowid FROM package_fts)"
+            ))
+
+def index_package(db: Session, package: models.Package) -> None:
+    """Adds a package to the index. Does not commit."""
+    params = {"id": package.id, "title": package.title, "prompt": package.prompt, "difficulty": package.difficulty}
+    dialect = _dialect(db.get_bind())
+    if dialect == "postgresql":
+        db.execute(text(
+            f"INSERT INTO package_search (package_id, document) VALUES (:id, {_pg_document(':title', ':prompt', ':difficulty')}) "
+            "ON CONFLICT (package_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+    elif dialect == "sqlite":
+        db.execute(text("INSERT INTO package_fts (rowid, title, prompt, difficulty) VALUES (:id, :title, :prompt, :difficulty)"), params)
+
+def _fts5_query(q: str) -> str:
+    # Quote every term so user input can't trip FTS5 syntax; prefix-match the last one.
+    terms = re.findall(r"\w+", q)
+    if not terms: return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def search(db: Session, q: Optional[str], difficulty: Optional[str], limit: int, after_id: Optional[int]) -> Tuple[List[models.Package], Optional[int]]:
+    """
+    Returns one page of packages matching `q`, newest first, plus the cursor for the next
+    page (None on the last page). Paging is keyset on package id, so deep pages stay cheap.
+    """
+    statement = select(models.Package)
+    q = (q or "").strip()
+    if q:
+        dialect = _dialect(db.get_bind())
+        if dialect == "postgresql":
+            statement = statement.where(models.Package.id.in_(
+                text("SELECT package_id FROM package_search WHERE document @@ websearch_to_tsquery('english', :q)").bindparams(q=q).columns(column("package_id", Integer))
+            ))
+        elif dialect == "sqlite":
+            match = _fts5_query(q)
+            if not match: return [], None
+            statement = statement.where(models.Package.id.in_(
+                text("SELECT rowid FROM package_fts WHERE package_fts MATCH :q").bindparams(q=match).columns(column("rowid", Integer))
+            ))
+        else:
+            pattern = f"%{q}%"
+            statement = statement.where(models.Package.title.ilike(pattern) | models.Package.prompt.ilike(pattern))
+    if difficulty:
+        statement = statement.where(models.Package.difficulty == difficulty)
+    if after_id is not None:
+        statement = statement.where(models.Package.id < after_id)
+    rows = db.exec(statement.order_by(models.Package.id.desc()).limit(limit + 1)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
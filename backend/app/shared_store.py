@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+import functools
+from typing import Optional, Dict, Tuple
+from app import telemetry
+
+# Cross-process key/value store used by caches that must agree across uvicorn workers.
+# With SHARED_STORE_URL=redis://... every worker talks to the same Redis; without it we
+# fall back to an in-process stand-in, which is correct for a single worker and for dev.
+SHARED_STORE_URL = os.getenv("SHARED_STORE_URL")
+
+logger = telemetry.get_logger("shared_store")
+
+
+class LocalStore:
+    """In-process stand-in with the same interface as RedisStore."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {} # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None: return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._live(key) or 0) + 1
+            self._data[key] = (str(value), None)
+            return value
+
+    def set_if_absent(self, key: str, value: str, ttl: float) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._data[key] = (value, time.monotonic() + ttl)
+            return True
+
+    def take_token(self, key: str, rate: float, burst: int) -> float:
+        """Token bucket: takes one token and returns 0, or returns the seconds until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - last) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            return wait
+
+
+# Same refill rule as LocalStore.take_token, run atomically in Redis on Redis' own clock
+_TAKE_TOKEN = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local last = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - last) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+def _degrades(method):
+    """Runs the Redis operation, or the same LocalStore one while Redis is unreachable."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            result = method(self, *args, **kwargs)
+        except self._unreachable as e:
+            if not self._degraded:
+                logger.warning(f"Shared store unreachable ({e}); using in-process store until it is back.")
+                self._degraded = True
+            return getattr(self._local, method.__name__)(*args, **kwargs)
+        if self._degraded:
+            logger.info("Shared store reachable again.")
+            self._degraded = False
+        return result
+    return wrapper
+
+
+class RedisStore:
+    # redis-py connects lazily, so a Redis that goes away after startup only shows up as
+    # ConnectionError/TimeoutError on some later call. Those calls degrade to a LocalStore
+    # rather than failing the request: caches miss, rate limits and single-flight go per worker.
+    def __init__(self, url: str):
+        import redis # Optional dependency, only needed when SHARED_STORE_URL is set
+        self.client = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=1)
+        self.client.ping() # Fail here, so get_store falls back, rather than on the first request
+        self._take_token = self.client.register_script(_TAKE_TOKEN)
+        self._unreachable = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+        self._local = LocalStore()
+        self._degraded = False
+
+    @_degrades
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    @_degrades
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    @_degrades
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    @_degrades
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+    @_degrades
+    def set_if_absent(self, key: str, value: str, ttl: float) -> bool:
+        return bool(self.client.set(key, value, nx=True, px=int(ttl * 1000)))
+
+    @_degrades
+    def take_token(self, key: str, rate: float, burst: int) -> float:
+        return float(self._take_token(keys=[key], args=[rate, burst]))
+
+
+_store = None
+
+def get_store():
+    """Returns the process-wide store, connecting to Redis on first use if configured."""
+    global _store
+    if _store is None:
+        if SHARED_STORE_URL:
+            try:
+                _store = RedisStore(SHARED_STORE_URL)
+            except Exception as e:
+                logger.warning(f"Shared store unavailable ({e}); using in-process store.")
+                _store = LocalStore()
+        else:
+            _store = LocalStore()
+    return _store
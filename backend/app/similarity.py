@@ -0,0 +1,121 @@
+import io
+import keyword
+import builtins
+import hashlib
+import tokenize
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+from sqlalchemy import delete
+from sqlmodel import Session, select
+from app import models
+from app.constants import SIMILARITY_KGRAM, SIMILARITY_WINDOW, SIMILARITY_MAX_DOC_FREQ, SIMILARITY_MIN_SCORE
+
+# Code-similarity detection across an assignment's submissions (winnowing, as in MOSS).
+# Code is tokenized with Python's tokenizer and normalized so renaming variables or editing
+# comments changes nothing; k-grams of tokens are hashed and winnowed to a sparse set of
+# fingerprints. Fingerprints are stored per submission in an inverted index
+# (CodeFingerprint), written incrementally by crud.create_submission, and the report only
+# pairs up submissions that share a fingerprint.
+
+_KEEP_NAMES = set(keyword.kwlist) | set(dir(builtins))
+_SKIP = {tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER}
+
+
+def normalize(code: str) -> List[str]:
+    """Token stream with identifiers, numbers and strings replaced by placeholders."""
+    tokens = []
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type in _SKIP:
+                continue
+            if tok.type == tokenize.NAME:
+                tokens.append(tok.string if tok.string in _KEEP_NAMES else "V")
+            elif tok.type == tokenize.NUMBER:
+                tokens.append("N")
+            elif tok.type == tokenize.STRING:
+                tokens.append("S")
+            elif tok.type == tokenize.NEWLINE:
+                tokens.append(";")
+            elif tok.type in (tokenize.INDENT, tokenize.DEDENT):
+                tokens.append(tokenize.tok_name[tok.type])
+            else:
+                tokens.append(tok.string)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass # Keep what was tokenized before the error; broken code can still be copied
+    return tokens
+
+def _hash(gram: Tuple[str, ...]) -> int:
+    # 63 bits so it fits a signed BIGINT column
+    return int.from_bytes(hashlib.blake2b("\x00".join(gram).encode(), digest_size=8).digest(), "big") >> 1
+
+def fingerprints(code: str) -> Set[int]:
+    tokens = normalize(code)
+    k, w = SIMILARITY_KGRAM, SIMILARITY_WINDOW
+    hashes = [_hash(tuple(tokens[i:i + k])) for i in range(len(tokens) - k + 1)]
+    if len(hashes) <= w:
+        return set(hashes)
+    selected = set()
+    for i in range(len(hashes) - w + 1):
+        window = hashes[i:i + w]
+        selected.add(min(window))
+    return selected
+
+def index_submission(db: Session, submission: models.Submission, assignment_id: int) -> None:
+    """Replaces a submission's fingerprints. The submission must have an id. Does not commit."""
+    db.execute(delete(models.CodeFingerprint).where(models.CodeFingerprint.submission_id == submission.id))
+    for h in fingerprints(submission.code):
+        db.add(models.CodeFingerprint(submission_id=submission.id, assignment_id=assignment_id, hash=h))
+
+def _index_missing(db: Session, assignment_id: int) -> None:
+    indexed = select(models.CodeFingerprint.submission_id).where(models.CodeFingerprint.assignment_id == assignment_id)
+    statement = select(models.Submission).join(models.StudentAssignment).where(
+        models.StudentAssignment.assignment_id == assignment_id,
+        models.Submission.id.not_in(indexed)
+    )
+    missing = db.exec(statement).all()
+    for submission in missing:
+        index_submission(db, submission, assignment_id)
+    if missing:
+        db.commit()
+
+def report(db: Session, assignment_id: int, limit: int) -> List[Dict]:
+    """
+    Ranked suspicious pairs for an assignment. Fingerprints shared by more than
+    SIMILARITY_MAX_DOC_FREQ of submissions are boilerplate (input parsing, print) and
+    are skipped, which also keeps the pair counting close to linear.
+    """
+    _index_missing(db, assignment_id)
+    rows = db.exec(select(models.CodeFingerprint.submission_id, models.CodeFingerprint.hash).where(models.CodeFingerprint.assignment_id == assignment_id)).all()
+    postings: Dict[int, List[int]] = defaultdict(list)
+    sizes: Dict[int, int] = defaultdict(int)
+    for submission_id, h in rows:
+        postings[h].append(submission_id)
+        sizes[submission_id] += 1
+    if len(sizes) < 2:
+        return []
+    max_df = max(2, int(SIMILARITY_MAX_DOC_FREQ * len(sizes)))
+    shared: Dict[Tuple[int, int], int] = defaultdict(int)
+    for members in postings.values():
+        if len(members) > max_df:
+            continue
+        members.sort()
+        for i in range(len(members)):
+            for j in range(i + 1, len(members)):
+                shared[(members[i], members[j])] += 1
+    pairs = []
+    for (a, b), count in shared.items():
+        score = count / min(sizes[a], sizes[b]) # Containment, so a copied-then-padded file still scores high
+        if score >= SIMILARITY_MIN_SCORE:
+            pairs.append({"submission_a": a, "submission_b": b, "shared": count, "score": round(score, 3)})
+    pairs.sort(key=lambda p: (p["score"], p["shared"]), reverse=True)
+    pairs = pairs[:limit]
+    ids = {p["submission_a"] for p in pairs} | {p["submission_b"] for p in pairs}
+    rolls = dict(db.exec(
+        select(models.Submission.id, models.Student.roll)
+        .join(models.StudentAssignment, models.Submission.student_assignment_id == models.StudentAssignment.id)
+        .join(models.Student, models.StudentAssignment.student_id == models.Student.id)
+        .where(models.Submission.id.in_(ids))
+    ).all()) if ids else {}
+    for p in pairs:
+        p["roll_a"], p["roll_b"] = rolls.get(p["submission_a"]), rolls.get(p["submission_b"])
+    return pairs
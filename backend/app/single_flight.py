@@ -0,0 +1,152 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel
+from app import shared_store, telemetry
+
+# Single-flight execution: concurrent calls with the same key share one execution.
+# Within a worker, callers await the same task. Across workers (when SHARED_STORE_URL is
+# set) the first caller takes a lock in the shared store and publishes its result there;
+# the others poll for it. If the owner dies without a result, its lock expires and a
+# waiting caller runs the work itself.
+#
+# stream() does the same for a stream of (event, payload) pairs whose last payload is the
+# result: callers in the owner's worker get every event as it happens, callers in other
+# workers get the shared result replayed as events. run() and stream() calls with the same
+# key share one execution.
+
+T = TypeVar("T", bound=BaseModel)
+
+POLL_SECONDS = 0.05
+RESULT_TTL_SECONDS = 5
+
+_inflight: Dict[str, asyncio.Task] = {}
+_streams: Dict[str, "_Broadcast"] = {}
+
+
+def _uses_shared_layer() -> bool:
+    return not isinstance(shared_store.get_store(), shared_store.LocalStore)
+
+async def _run_shared(key: str, factory: Callable[[], Awaitable[T]], model: Type[T], ttl: float, label: str) -> T:
+    if not _uses_shared_layer():
+        return await factory()
+    store = shared_store.get_store()
+    lock_key, result_key = f"flight:{key}:lock", f"flight:{key}:result"
+    # Store calls are network round trips, so they run on a thread rather than the event loop
+    while True:
+        if await asyncio.to_thread(store.set_if_absent, lock_key, "1", ttl):
+            await asyncio.to_thread(store.delete, result_key)
+            try:
+                result = await factory()
+                await asyncio.to_thread(store.set, result_key, result.model_dump_json(), ttl=RESULT_TTL_SECONDS)
+                return result
+            finally:
+                await asyncio.to_thread(store.delete, lock_key)
+        # Another worker owns it; wait for its result while its lock is held
+        while await asyncio.to_thread(store.get, lock_key) is not None:
+            await asyncio.sleep(POLL_SECONDS)
+        raw = await asyncio.to_thread(store.get, result_key)
+        if raw:
+            telemetry.REQUESTS_COALESCED.inc(label, "shared")
+            return model.model_validate_json(raw)
+
+class _Broadcast:
+    """Events of one streamed execution, kept so that callers joining late start from the first."""
+    def __init__(self):
+        self.events: List[Tuple[str, Any]] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None # Held here so the producer is not garbage collected
+
+    def publish(self, item: Tuple[str, Any]) -> None:
+        self.events.append(item)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done, self.error = True, error
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Tuple[str, Any]]:
+        seen = 0
+        while True:
+            changed = self._changed
+            while seen < len(self.events):
+                seen += 1
+                yield self.events[seen - 1]
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+async def _broadcast(key: str, broadcast: _Broadcast, events: Callable[[], AsyncIterator[Tuple[str, T]]], model: Type[T], ttl: float,
+                     label: str, replay: Callable[[T], Iterable[Tuple[str, Any]]]) -> None:
+    led = False
+
+    async def lead() -> T:
+        nonlocal led
+        led, result = True, None
+        async for event, payload in events():
+            broadcast.publish((event, payload))
+            result = payload
+        return result
+    try:
+        result = await _run_shared(key, lead, model, ttl, label)
+        if not led: # Another worker ran it
+            for item in replay(result):
+                broadcast.publish(item)
+        broadcast.finish()
+    except BaseException as e:
+        broadcast.finish(e)
+        if not isinstance(e, Exception):
+            raise
+    finally:
+        _streams.pop(key, None)
+
+async def stream(key: str, events: Callable[[], AsyncIterator[Tuple[str, Any]]], model: Type[T], ttl: float, label: str,
+                 replay: Callable[[T], Iterable[Tuple[str, Any]]]) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Yields the (event, payload) pairs of events(), or of an identical execution already in
+    flight; the last payload is the result, of type `model`. `replay(result)` turns a result
+    that another worker (or a run() call) produced into the events to send instead.
+    """
+    broadcast = _streams.get(key)
+    if broadcast is not None:
+        telemetry.REQUESTS_COALESCED.inc(label, "local")
+    elif key in _inflight:
+        telemetry.REQUESTS_COALESCED.inc(label, "local")
+        for item in replay(await asyncio.shield(_inflight[key])):
+            yield item
+        return
+    else:
+        broadcast = _streams[key] = _Broadcast()
+        # Not tied to this caller, so one caller disconnecting doesn't cancel the run for the others
+        broadcast.task = asyncio.ensure_future(_broadcast(key, broadcast, events, model, ttl, label, replay))
+    async for item in broadcast.follow():
+        yield item
+
+async def run(key: str, factory: Callable[[], Awaitable[T]], model: Type[T], ttl: float, label: str) -> T:
+    """
+    Returns factory()'s result, or that of an identical call already in flight. `ttl`
+    bounds how long a crashed owner can hold the key; `label` names the counter series.
+    """
+    broadcast = _streams.get(key)
+    if broadcast is not None:
+        telemetry.REQUESTS_COALESCED.inc(label, "local")
+        result = None
+        async for _, result in broadcast.follow():
+            pass
+        return result
+    task = _inflight.get(key)
+    if task is not None:
+        telemetry.REQUESTS_COALESCED.inc(label, "local")
+    else:
+        task = asyncio.ensure_future(_run_shared(key, factory, model, ttl, label))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded so one caller disconnecting doesn't cancel the run for the others
+    return await asyncio.shield(task)
@@ -0,0 +1,171 @@
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+from app.constants import LOG_LEVEL, LOG_FORMAT, LATENCY_BUCKETS
+
+# Logging and metrics for the API process.
+# Log records are put on an in-memory queue and written by a background listener thread,
+# so a slow stdout never holds up a request. Metrics are kept in-process and exposed in
+# the Prometheus text format by GET /metrics; with several workers each one reports its
+# own series, which Prometheus aggregates.
+
+
+# ---- Logging ----
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; anything passed via `extra=` becomes a field."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3), "level": record.levelname,
+            "logger": record.name, "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+_listener = None
+
+def configure_logging() -> None:
+    """Routes all logging through a queue drained by one writer thread. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(levelname)-8s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL.upper())
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop) # Flush what is still queued on exit
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"autoassess.{name}")
+
+
+# ---- Metrics ----
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {} # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts = self._values.setdefault(labels, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), key + (str(bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {counts[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+_registry: List[_Metric] = []
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+REQUEST_SECONDS = Histogram("autoassess_request_seconds", "HTTP request latency.", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("autoassess_stage_seconds", "Latency of one stage of an endpoint.", ("endpoint", "stage"))
+SANDBOX_QUEUE = Gauge("autoassess_sandbox_runs", "Sandboxed runs waiting for or holding a sandbox slot.", ("state",))
+SANDBOX_RUNS = Counter("autoassess_sandbox_runs_total", "Sandboxed runs by outcome.", ("outcome",))
+REQUESTS_COALESCED = Counter("autoassess_requests_coalesced_total", "Requests answered by an identical in-flight execution.", ("endpoint", "scope"))
+REQUESTS_RATE_LIMITED = Counter("autoassess_requests_rate_limited_total", "Requests rejected with 429.", ("endpoint",))
+LLM_CALLS = Counter("autoassess_llm_calls_total", "Gemini calls by model and outcome.", ("model", "outcome"))
+LLM_SECONDS = Histogram("autoassess_llm_call_seconds", "Gemini call latency.", ("model",))
+LLM_DOWNGRADES = Counter("autoassess_llm_budget_downgrades_total", "Gemini calls rerouted by a usage budget.", ("model", "routed"))
+LLM_TOKENS_SAVED = Counter("autoassess_llm_prompt_tokens_saved_total", "Estimated prompt tokens removed by compaction.", ("model",))
+
+
+@contextmanager
+def span(endpoint: str, stage: str) -> Iterator[None]:
+    """Times one stage of an endpoint into autoassess_stage_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, endpoint, stage)
+
+class MetricsMiddleware:
+    """ASGI middleware recording autoassess_request_seconds per route template."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start, status = time.perf_counter(), [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # The template (/api/teacher/results/{assignment_id}) keeps the label set small
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], getattr(route, "path", "unmatched"), str(status[0]))
@@ -0,0 +1,153 @@
+import os
+import gzip
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from app import runner, telemetry, prompt_compaction
+from app.constants import (
+    WORKLOAD_TRACE_DIR, WORKLOAD_TRACE_SAMPLE, WORKLOAD_TRACE_FILE_REQUESTS, WORKLOAD_TRACE_FLUSH_SECONDS, WORKLOAD_TRACE_MAX_BUFFER,
+    SANDBOX_WORKERS, GROUP_CASE_TIME_LIMIT_SECONDS, GROUP_TIME_BUDGET_SECONDS
+)
+
+# Opt-in recorder of the real grading workload (WORKLOAD_TRACE_DIR), for benchmarks.replay.
+# Each finished /run and /submit becomes one "request" line: the code with comments and
+# docstrings removed, and per testcase (or group) its verdict, runtime and a hash of its
+# stdout, plus the request's sandbox time. Testcases and groups are written once per file
+# as "testcase"/"group" lines that requests refer to by content key; the header carries the
+# runner's limits. Nothing identifies a student, assignment or package, and timestamps are
+# offsets from the start of the file. Like app.llm_usage, recording only appends to a
+# buffer; a background task appends it to the worker's current gzip file in batches.
+
+logger = telemetry.get_logger("workload_trace")
+
+FORMAT = "autoassess-workload-trace"
+VERSION = 1
+
+_lock = threading.Lock()
+_buffer: List[Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]] = [] # (request line, definitions it refers to)
+_file: Dict[str, Any] = {"path": None, "requests": 0, "started": 0.0, "defined": set()}
+_wake = asyncio.Event()
+_flusher: Optional[asyncio.Task] = None
+
+
+def verdict(result: runner.RunResult, passed: bool) -> str:
+    return "timeout" if result.timed_out else "error" if result.stderr else "pass" if passed else "fail"
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()[:16]
+
+def _testcase(tc, definitions: Dict[str, Dict[str, Any]]) -> str:
+    fields = {"type": tc.type, "input": tc.input, "expected": tc.expected, "time_limit": tc.time_limit,
+              "input_digest": tc.input_digest, "expected_digest": tc.expected_digest, "generator": tc.generator}
+    fields = {key: value for key, value in fields.items() if value is not None}
+    key = _digest(fields)
+    definitions[key] = {"kind": "testcase", "key": key, **fields}
+    return key
+
+def output_digest(stdout: str) -> str:
+    return hashlib.sha256(stdout.encode("utf-8", errors="replace")).hexdigest()[:16]
+
+def _outcome(key: str, result: runner.RunResult, passed: bool) -> Dict[str, Any]:
+    return {"testcase": key, "verdict": verdict(result, passed), "runtime": round(result.runtime, 4), "stdout": output_digest(result.stdout)}
+
+def record(endpoint: str, code: str, outcomes: Sequence[Tuple[Any, runner.RunResult, bool]],
+           group_outcomes: Sequence[Tuple[Any, List[runner.RunResult]]] = (), seconds: float = 0.0) -> None:
+    """
+    Queues one finished request: (testcase, result, passed) per single testcase and
+    (group, results) per group. A no-op unless WORKLOAD_TRACE_DIR is set; never raises.
+    """
+    if not WORKLOAD_TRACE_DIR or random.random() >= WORKLOAD_TRACE_SAMPLE:
+        return
+    try:
+        definitions: Dict[str, Dict[str, Any]] = {}
+        groups = []
+        for group, results in group_outcomes:
+            keys = [_testcase(tc, definitions) for tc in group.testcases]
+            group_key = _digest({"scoring": group.scoring, "points": group.points, "testcases": keys})
+            definitions[group_key] = {"kind": "group", "key": group_key, "scoring": group.scoring, "points": group.points, "testcases": keys}
+            groups.append({"group": group_key, "cases": [_outcome(key, result, runner.judge(result, tc.expected))
+                                                         for key, tc, result in zip(keys, group.testcases, results)]})
+        line = {
+            "kind": "request", "endpoint": endpoint, "at": time.time(), "seconds": round(seconds, 4),
+            "code": prompt_compaction.strip_comments(code),
+            "cases": [_outcome(_testcase(tc, definitions), result, passed) for tc, result, passed in outcomes], "groups": groups,
+        }
+    except Exception:
+        logger.exception("Recording a workload trace entry failed", extra={"endpoint": endpoint})
+        return
+    with _lock:
+        if len(_buffer) >= WORKLOAD_TRACE_MAX_BUFFER:
+            _buffer.pop(0)
+        _buffer.append((line, definitions))
+        full = len(_buffer) >= WORKLOAD_TRACE_MAX_BUFFER // 2
+    if full:
+        _wake.set()
+
+def _header() -> Dict[str, Any]:
+    return {"kind": "header", "format": FORMAT, "version": VERSION, "started_at": datetime.utcnow().isoformat(), "limits": {
+        "cpu_seconds": runner.CPU_LIMIT_SECONDS, "memory_mb": runner.MEMORY_LIMIT_MB,
+        "group_case_time_limit": GROUP_CASE_TIME_LIMIT_SECONDS, "group_time_budget": GROUP_TIME_BUDGET_SECONDS, "sandbox_workers": SANDBOX_WORKERS,
+    }}
+
+def _new_file(started: float) -> List[Dict[str, Any]]:
+    os.makedirs(WORKLOAD_TRACE_DIR, exist_ok=True)
+    _file.update(path=os.path.join(WORKLOAD_TRACE_DIR, f"trace-{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}.jsonl.gz"),
+                 requests=0, started=started, defined=set())
+    return [_header()]
+
+def flush() -> int:
+    """
+    Appends the buffered requests to the current trace file as one gzip member, so a file
+    cut short by a crash still reads back to its last flush. Returns how many.
+    """
+    with _lock:
+        entries = _buffer[:]
+        del _buffer[:]
+    if not entries or not WORKLOAD_TRACE_DIR:
+        return 0
+    try:
+        lines = _new_file(entries[0][0]["at"]) if _file["path"] is None or _file["requests"] >= WORKLOAD_TRACE_FILE_REQUESTS else []
+        defined: Set[str] = _file["defined"]
+        for line, definitions in entries:
+            for key, definition in definitions.items():
+                if key not in defined:
+                    defined.add(key)
+                    lines.append(definition)
+            lines.append({**line, "at": round(max(0.0, line["at"] - _file["started"]), 3)})
+        with gzip.open(_file["path"], "ab", compresslevel=6) as out:
+            out.write(b"".join(json.dumps(line, separators=(",", ":")).encode("utf-8") + b"\n" for line in lines))
+        _file["requests"] += len(entries)
+    except Exception:
+        logger.exception("Writing the workload trace failed", extra={"requests": len(entries)})
+        _file["path"] = None # Start over in a fresh file, whose definitions are complete
+        return 0
+    return len(entries)
+
+async def _flush_loop() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=WORKLOAD_TRACE_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        await asyncio.to_thread(flush)
+
+def start() -> None:
+    """Starts the background writer when recording is enabled; called from the app's lifespan."""
+    global _flusher
+    if WORKLOAD_TRACE_DIR and (_flusher is None or _flusher.done()):
+        _flusher = asyncio.create_task(_flush_loop())
+        logger.info("Recording workload traces", extra={"directory": WORKLOAD_TRACE_DIR, "sample": WORKLOAD_TRACE_SAMPLE})
+
+async def stop() -> None:
+    """Stops the writer and writes whatever is still buffered."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        _flusher = None
+    await asyncio.to_thread(flush)
@@ -0,0 +1,39 @@
+"""
+Runtime of assignment_logic.assign_packages_to_students for growing cohorts, in roll
+order and on a seat grid. Package counts follow constants.compute_m_star.
+
+    cd backend && python -m benchmarks.bench_assignment --max-students 100000
+"""
+import argparse
+import math
+import time
+from types import SimpleNamespace
+from app import assignment_logic, constants
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-students", type=int, default=100_000)
+    parser.add_argument("--distance", type=int, default=constants.D_ADJACENCY)
+    args = parser.parse_args()
+
+    print(f"{'students':>10}{'packages':>10}{'roll ms':>12}{'grid4 ms':>12}{'grid8 ms':>12}")
+    n = 100
+    while n <= args.max_students:
+        m = constants.compute_m_star(n, d=args.distance)
+        students = [SimpleNamespace(id=i) for i in range(n)]
+        packages = [SimpleNamespace(id=i) for i in range(m)]
+        cols = math.ceil(math.sqrt(n))
+        timings = []
+        for layout, neighbourhood in ((None, 4), ((cols, cols), 4), ((cols, cols), 8)):
+            start = time.perf_counter()
+            try:
+                assignment_logic.assign_packages_to_students(students, packages, d=args.distance, seat_layout=layout, neighbourhood=neighbourhood, seed=0)
+                timings.append(f"{(time.perf_counter() - start) * 1000:>12.1f}")
+            except ValueError:
+                timings.append(f"{'infeasible':>12}")
+        print(f"{n:>10}{m:>10}{''.join(timings)}")
+        n *= 10
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Payload size and serialization time for /teacher/packages, before and after the
+orjson default response class, compression and `fields=` selection.
+
+    cd backend && python -m benchmarks.bench_serialization --packages 500
+"""
+import argparse
+import gzip
+import json
+import time
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+import orjson
+from app import models
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_packages(n: int) -> List[models.Package]:
+    prompt = "## Problem\n\n" + "Given a list of integers, return the sum of every element. " * 20 + "\n\n### Constraints\n- 1 <= n <= 10^5\n"
+    packages = []
+    for i in range(n):
+        pkg = models.Package(id=i + 1, title=f"Sum of List {i}", prompt=prompt, difficulty="easy")
+        pkg.testcases = [models.TestCase(id=i * 5 + j, type="sample" if j < 2 else "hidden", input="1 2 3 4 5", expected="15", points=20, package_id=i + 1) for j in range(5)]
+        packages.append(pkg)
+    return packages
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    packages = make_packages(args.packages)
+    adapter = TypeAdapter(List[models.Package])
+
+    # Before: response_model validation + jsonable_encoder + stdlib json (FastAPI's JSONResponse)
+    def before():
+        return json.dumps(jsonable_encoder(adapter.validate_python(packages)), ensure_ascii=False).encode("utf-8")
+    # After: same validation, rendered by ORJSONResponse
+    def after():
+        return orjson.dumps(jsonable_encoder(adapter.validate_python(packages)))
+    # After + fields=id,title,difficulty: no response_model pass, only the picked columns
+    def picker():
+        return orjson.dumps([{"id": p.id, "title": p.title, "difficulty": p.difficulty} for p in packages])
+
+    print(f"{'variant':<28}{'ms':>10}{'bytes':>12}{'gzip':>12}{'brotli':>12}")
+    for name, fn in (("default json", before), ("orjson", after), ("orjson fields=picker", picker)):
+        body, seconds = timed(fn, args.repeat)
+        gz = len(gzip.compress(body, 6))
+        br = len(brotli.compress(body, quality=4)) if brotli else "-"
+        print(f"{name:<28}{seconds * 1000:>10.2f}{len(body):>12}{gz:>12}{br:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Worker boot time: how long a fresh interpreter takes to import app.main and to run the
+lifespan startup, on a new SQLite database (schema creation + seeding) and again on the
+same database (schema current, already seeded). Each figure is the median of --repeat
+runs in separate processes. --importtime lists the slowest imports (python -X importtime).
+
+    cd backend && python -m benchmarks.bench_startup --repeat 5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+PROBE = """
+import time, json, asyncio
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+async def boot():
+    async with app.router.lifespan_context(app):
+        pass
+asyncio.run(boot())
+print(json.dumps({"import_s": imported - start, "startup_s": time.perf_counter() - imported}))
+"""
+
+
+def probe(database_url: str) -> dict:
+    env = {**os.environ, "DATABASE_URL": database_url, "LOG_LEVEL": "WARNING"}
+    env.pop("GEMINI_API_KEY", None)
+    out = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(n: int) -> list:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tempfile.mkdtemp()}/imports.db"}
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], env=env, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stderr
+    rows = []
+    for line in err.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+            rows.append((int(cumulative), name))
+    return sorted(rows, reverse=True)[:n]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, help="Show the N slowest imports")
+    args = parser.parse_args()
+
+    cold, warm = [], []
+    for _ in range(args.repeat):
+        url = f"sqlite:///{tempfile.mkdtemp(prefix='autoassess-boot-')}/boot.db"
+        cold.append(probe(url)) # New database: create_all + seeding
+        warm.append(probe(url)) # Same database: schema current, already seeded
+
+    print(f"{'':<28}{'import ms':>12}{'startup ms':>12}")
+    for label, runs in (("fresh database", cold), ("existing database", warm)):
+        print(f"{label:<28}{statistics.median(r['import_s'] for r in runs) * 1000:>12.0f}{statistics.median(r['startup_s'] for r in runs) * 1000:>12.0f}")
+    if args.importtime:
+        print(f"\n{'cumulative ms':>14}  module")
+        for micros, name in slowest_imports(args.importtime):
+            print(f"{micros / 1000:>14.1f}  {name}")
+
+if __name__ == "__main__":
+    main()
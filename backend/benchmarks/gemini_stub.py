@@ -0,0 +1,103 @@
+"""
+Stand-in for the Gemini upstream used by the load test. `install()` swaps
+gemini_client._call_gemini_api for a coroutine that sleeps for a configurable latency and
+answers with well-formed JSON, so question generation, error classification and quality
+scoring go through their normal code paths without network calls or API spend.
+
+Packages carry their reference solution, as real generations do; PROBLEMS doubles as the
+answer key the load test looks solutions up in by package title.
+"""
+import re
+import copy
+import json
+import time
+import random
+import asyncio
+from typing import Any, Dict, List
+
+
+def _package(title: str, prompt: str, solution: str, cases: List[tuple]) -> Dict[str, Any]:
+    testcases = [
+        {"type": "sample" if i < 2 else "hidden", "input": given, "expected": expected, "points": 20}
+        for i, (given, expected) in enumerate(cases)
+    ]
+    return {"title": title, "prompt": prompt, "difficulty": "easy", "testcases": testcases, "solution": solution}
+
+# Textually distinct on purpose, so near-duplicate detection keeps them in separate clusters
+PROBLEMS = [
+    _package("Sum of a List", "Read space separated integers on one line and print their sum.",
+             "print(sum(map(int, input().split())))",
+             [("1 2 3", "6"), ("10", "10"), ("-5 5", "0"), ("100 200 300 400", "1000"), ("7 7 7", "21")]),
+    _package("Largest Element", "Given integers separated by spaces, output the maximum value.",
+             "print(max(map(int, input().split())))",
+             [("4 9 2", "9"), ("-1 -7", "-1"), ("5", "5"), ("3 3 8 1", "8"), ("0 -2 11", "11")]),
+    _package("Reverse the Word", "A single word is given. Write it backwards.",
+             "print(input().strip()[::-1])",
+             [("hello", "olleh"), ("abc", "cba"), ("x", "x"), ("racecar", "racecar"), ("python", "nohtyp")]),
+    _package("Count Vowels", "Count how many characters of the input line are vowels (a, e, i, o, u, any case).",
+             "print(sum(c in 'aeiouAEIOU' for c in input()))",
+             [("banana", "3"), ("sky", "0"), ("AEIOU", "5"), ("Programming", "3"), ("queue", "4")]),
+    _package("Factorial", "Compute n! for the non-negative integer n on the input.",
+             "import math\nprint(math.factorial(int(input())))",
+             [("0", "1"), ("5", "120"), ("1", "1"), ("10", "3628800"), ("7", "5040")]),
+    _package("Nth Fibonacci Number", "Print F(n) where F(0)=0 and F(1)=1.",
+             "a, b = 0, 1\nfor _ in range(int(input())):\n    a, b = b, a + b\nprint(a)",
+             [("0", "0"), ("1", "1"), ("10", "55"), ("20", "6765"), ("30", "832040")]),
+    _package("Palindrome Check", "Decide whether the given string reads the same in both directions; print YES or NO.",
+             "s = input().strip()\nprint('YES' if s == s[::-1] else 'NO')",
+             [("level", "YES"), ("hello", "NO"), ("a", "YES"), ("abba", "YES"), ("abca", "NO")]),
+    _package("Even Numbers Only", "From a list of integers, print the even ones in their original order, space separated.",
+             "print(' '.join(x for x in input().split() if int(x) % 2 == 0))",
+             [("1 2 3 4", "2 4"), ("2", "2"), ("6 8 10", "6 8 10"), ("5 12 7 14", "12 14"), ("0 1", "0")]),
+    _package("Digit Sum", "Add up the decimal digits of a non-negative integer.",
+             "print(sum(int(d) for d in input().strip()))",
+             [("123", "6"), ("0", "0"), ("9999", "36"), ("1001", "2"), ("58", "13")]),
+    _package("Word Count", "Report the number of whitespace separated words in a sentence.",
+             "print(len(input().split()))",
+             [("the quick brown fox", "4"), ("one", "1"), ("a b c d e", "5"), ("hello world", "2"), ("x y", "2")]),
+    _package("Celsius to Fahrenheit", "Convert an integer temperature in Celsius to Fahrenheit using F = C * 9 / 5 + 32, printed with one decimal.",
+             "print(f'{int(input()) * 9 / 5 + 32:.1f}')",
+             [("0", "32.0"), ("100", "212.0"), ("-40", "-40.0"), ("37", "98.6"), ("25", "77.0")]),
+    _package("Second Smallest Distinct", "Among the distinct integers given, print the second smallest.",
+             "print(sorted(set(map(int, input().split())))[1])",
+             [("4 1 3", "3"), ("5 5 2 9", "5"), ("-1 0", "0"), ("10 20 30", "20"), ("7 3 3 8", "7")]),
+]
+SOLUTIONS = {p["title"]: p["solution"] for p in PROBLEMS}
+
+ERROR_TYPES = ["runtime_error", "wrong_output", "logic_bug", "timeout", "compile_error"]
+
+
+async def _respond(prompt_parts: List[Any], model_name: str, latency_ms: float, jitter_ms: float, error_rate: float, rng: random.Random) -> Dict[str, Any]:
+    await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+    if rng.random() < error_rate:
+        raise RuntimeError("Stub Gemini error")
+    prompt = " ".join(p for p in prompt_parts if isinstance(p, str))
+    if '"packages"' in prompt:
+        n = int(re.search(r"EXACTLY (\d+)", prompt).group(1))
+        return {"packages": [copy.deepcopy(PROBLEMS[i % len(PROBLEMS)]) for i in range(n)]}
+    if "error_type" in prompt:
+        if "Timed Out: True" in prompt:
+            return {"error_type": "timeout", "explain": "Stub: execution timed out."}
+        return {"error_type": rng.choice(ERROR_TYPES[:3]), "explain": "Stub classification."}
+    return {"score": rng.randint(50, 95), "comments": ["Stub comment."]}
+
+def install(latency_ms: float = 800, jitter_ms: float = 200, error_rate: float = 0.0, seed: int = 0) -> None:
+    """Routes all Gemini calls in this process to the stub. Call before the app handles requests."""
+    from app import gemini_client, telemetry, llm_usage
+    rng = random.Random(seed)
+
+    async def stub_call(prompt_parts: List[Any], model_name: str, purpose: str = "other", assignment_id=None, teacher_id=None) -> Dict[str, Any]:
+        # Recorded like real calls, so usage accounting and budgets see the load too
+        start, outcome, result = time.perf_counter(), "error", None
+        try:
+            result = await _respond(prompt_parts, model_name, latency_ms, jitter_ms, error_rate, rng)
+            outcome = "ok"
+            return result
+        finally:
+            telemetry.LLM_CALLS.inc(model_name, outcome)
+            prompt_tokens, response_tokens, _ = gemini_client._token_counts(prompt_parts, None)
+            llm_usage.record(model_name, purpose, outcome, prompt_tokens, len(json.dumps(result)) // 4 if result else 0, True,
+                             time.perf_counter() - start, assignment_id, teacher_id)
+
+    gemini_client.GEMINI_API_KEY = "stub" # The public functions skip the upstream when no key is set
+    gemini_client._call_gemini_api = stub_call
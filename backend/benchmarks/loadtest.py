@@ -0,0 +1,252 @@
+"""
+End-to-end load test: a cohort logging in, opening its assignment, running code a few
+times and submitting, all at once.
+
+The app is started in a subprocess (uvicorn, against a throwaway SQLite file unless
+--database-url points at Postgres) with Gemini replaced by benchmarks.gemini_stub. The
+teacher side generates stub packages and creates an assignment, then --students virtual
+students go through login -> dashboard -> assignment -> --runs x /run -> /submit with code
+that is correct, wrong, loops forever or does not parse, mixed by --mix. Rolls are reused
+when there are more virtual students than the 72 seeded ones.
+
+Reports throughput, p50/p95/p99 per endpoint and sandbox utilization (sampled from
+/metrics). With --baseline the run exits 1 if p95 latency or throughput regressed by more
+than --tolerance; --write-baseline stores the current run as the new baseline.
+
+    cd backend && python -m benchmarks.loadtest --students 200 --llm-latency-ms 800
+    cd backend && python -m benchmarks.loadtest --baseline benchmarks/loadtest_baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Dict, List
+import httpx
+
+SEEDED_STUDENTS = 72
+SEEDED_DOB = "2005-01-01"
+DRAFTS = {
+    "wrong": "print(0)",
+    "timeout": "while True:\n    pass",
+    "syntax": "print(int(input()) +",
+}
+
+
+# ---- Server ----
+def serve(args) -> None:
+    """Runs the app with the Gemini stub installed. Invoked as a subprocess by main()."""
+    import uvicorn
+    from benchmarks import gemini_stub
+    gemini_stub.install(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms, error_rate=args.llm_error_rate, seed=args.seed)
+    from app.main import app
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def start_server(args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.pop("GEMINI_API_KEY", None)
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='autoassess-load-')}/load.db"
+    env["SANDBOX_WORKERS"] = str(args.sandbox_workers)
+    env.setdefault("LOG_LEVEL", "WARNING")
+    command = [sys.executable, "-m", "benchmarks.loadtest", "--serve", "--port", str(args.port),
+               "--llm-latency-ms", str(args.llm_latency_ms), "--llm-jitter-ms", str(args.llm_jitter_ms),
+               "--llm-error-rate", str(args.llm_error_rate), "--seed", str(args.seed)]
+    return subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+async def wait_until_up(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} during startup.")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("Server did not come up in time.")
+
+
+# ---- Load ----
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            raise
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+async def prepare_assignment(client: httpx.AsyncClient, n_packages: int) -> int:
+    token = (await client.post("/api/teacher/login", json={
+        "username": os.getenv("TEACHER_USERNAME", "teacher"), "password": os.getenv("TEACHER_PASSWORD", "teachpass")
+    })).raise_for_status().json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    packages = (await client.post("/api/teacher/generate_questions", headers=headers, timeout=120, json={
+        "topic": "load test", "difficulty": "easy", "n_questions": n_packages
+    })).raise_for_status().json()
+    assignment = (await client.post("/api/teacher/create_assignment", headers=headers, json={
+        "assignment_name": f"Load test {int(time.time())}", "package_ids": [p["id"] for p in packages]
+    })).raise_for_status().json()
+    return assignment["id"]
+
+def pick_behaviour(rng: random.Random, mix: Dict[str, float]) -> str:
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+async def student(client: httpx.AsyncClient, recorder: Recorder, assignment_id: int, roll: int, behaviour: str, runs: int, think: float, rng: random.Random) -> None:
+    from benchmarks.gemini_stub import SOLUTIONS
+    await asyncio.sleep(rng.uniform(0, think)) # Students do not all click at the same millisecond
+    login = await recorder.call(client, "student_login", "POST", "/api/student/login", json={"roll": roll, "dob": SEEDED_DOB})
+    if login.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    await recorder.call(client, "student_assignments", "GET", "/api/student/assignments", headers=headers)
+    view = await recorder.call(client, "student_assignment", "GET", f"/api/student/assignment/{assignment_id}/{roll}", headers=headers)
+    if view.status_code != 200:
+        return
+    code = SOLUTIONS.get(view.json()["package_title"], DRAFTS["wrong"]) if behaviour == "correct" else DRAFTS[behaviour]
+    body = {"roll": roll, "assignment_id": assignment_id, "code": code}
+    for i in range(runs):
+        await asyncio.sleep(rng.uniform(0, think))
+        # Earlier attempts are usually drafts; the last run uses the code that gets submitted
+        draft = body if i == runs - 1 else {**body, "code": DRAFTS["wrong"]}
+        await recorder.call(client, "run", "POST", "/api/run", json=draft)
+    await recorder.call(client, "submit", "POST", "/api/submit", json=body)
+
+async def sample_sandbox(client: httpx.AsyncClient, samples: List[Dict[str, float]], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            text = (await client.get("/metrics")).text
+            gauges = {}
+            for line in text.splitlines():
+                if line.startswith("autoassess_sandbox_runs{"):
+                    state = line.split('state="', 1)[1].split('"', 1)[0]
+                    gauges[state] = float(line.rsplit(" ", 1)[1])
+            samples.append(gauges)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+# ---- Report ----
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def summarize(recorder: Recorder, elapsed: float, samples: List[Dict[str, float]], sandbox_workers: int) -> Dict:
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        endpoints[name] = {
+            "count": len(values), "errors": recorder.errors.get(name, 0),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        }
+    running = [s.get("running", 0) for s in samples]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(sum(len(v) for v in recorder.latencies.values()) / elapsed, 2),
+        "submits_per_s": round(len(recorder.latencies.get("submit", [])) / elapsed, 2),
+        "sandbox_utilization": round(sum(running) / len(running) / sandbox_workers, 3) if running else None,
+        "sandbox_max_waiting": max((s.get("waiting", 0) for s in samples), default=None),
+        "endpoints": endpoints,
+    }
+
+def print_report(summary: Dict) -> None:
+    print(f"{'endpoint':<22}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, e in summary["endpoints"].items():
+        print(f"{name:<22}{e['count']:>8}{e['errors']:>8}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}")
+    print(f"\nelapsed {summary['elapsed_s']} s, {summary['throughput_rps']} req/s, {summary['submits_per_s']} submits/s")
+    print(f"sandbox utilization {summary['sandbox_utilization']}, max waiting {summary['sandbox_max_waiting']}")
+
+def regressions(summary: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    problems = []
+    for name, base in baseline["endpoints"].items():
+        current = summary["endpoints"].get(name)
+        if current and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name} p95 {current['p95_ms']} ms > baseline {base['p95_ms']} ms")
+    if summary["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        problems.append(f"throughput {summary['throughput_rps']} req/s < baseline {baseline['throughput_rps']} req/s")
+    return problems
+
+
+async def run(args) -> Dict:
+    server = start_server(args)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120, limits=limits) as client:
+            await wait_until_up(client, server)
+            assignment_id = await prepare_assignment(client, args.packages)
+            rng = random.Random(args.seed)
+            mix = {k: float(v) for k, v in (part.split("=") for part in args.mix.split(","))}
+            recorder, samples, stop = Recorder(), [], asyncio.Event()
+            sampler = asyncio.create_task(sample_sandbox(client, samples, stop))
+            start = time.perf_counter()
+            await asyncio.gather(*[
+                student(client, recorder, assignment_id, i % SEEDED_STUDENTS + 1, pick_behaviour(rng, mix), args.runs, args.think_s, random.Random(rng.random()))
+                for i in range(args.students)
+            ], return_exceptions=True)
+            elapsed = time.perf_counter() - start
+            stop.set(); await sampler
+            return summarize(recorder, elapsed, samples, args.sandbox_workers)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--packages", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=3, help="/run calls per student before submitting")
+    parser.add_argument("--mix", default="correct=0.6,wrong=0.2,timeout=0.1,syntax=0.1")
+    parser.add_argument("--think-s", type=float, default=2.0, help="Upper bound of the random pause between a student's actions")
+    parser.add_argument("--concurrency", type=int, default=200, help="Open connections")
+    parser.add_argument("--sandbox-workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="JSON from a previous --write-baseline run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--write-baseline", help="Store this run's summary at the given path")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args)
+    summary = asyncio.run(run(args))
+    print_report(summary)
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = regressions(summary, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Replays workload traces recorded with WORKLOAD_TRACE_DIR (app.workload_trace) through the
+current runner, in process: no server, database or Gemini. Each recorded /run or /submit
+runs its testcases and groups on the sandbox pool again, with up to --concurrency requests
+in flight (as fast as possible, or at the recorded arrival times scaled by --speed).
+
+Reports throughput, p50/p95/p99 latency per endpoint next to the recorded sandbox time,
+the median runtime ratio per testcase, and every verdict that changed (pass, fail, error,
+timeout) plus outputs that changed under an unchanged verdict. Testcases whose payload
+files are not in this PAYLOAD_DIR are skipped and counted. With --fail-on-diff the run
+exits 1 if any verdict changed. Verdicts near a time limit are as noisy as the machine.
+
+    cd backend && python -m benchmarks.replay traces/trace-*.jsonl.gz --concurrency 16
+    cd backend && python -m benchmarks.replay trace.jsonl.gz --speed 1 --json replay.json --fail-on-diff
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def read_traces(paths: List[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(path, line) for every line of the trace files, in order, with arrival offsets made continuous across files."""
+    base = 0.0
+    for path in paths:
+        last = 0.0
+        with gzip.open(path, "rb") as f:
+            for number, raw in enumerate(f, start=1):
+                try:
+                    line = json.loads(raw)
+                except ValueError:
+                    print(f"{path}:{number}: unreadable line, stopping this file", file=sys.stderr)
+                    break
+                if line.get("kind") == "request":
+                    last = line.get("at", 0.0)
+                    line = {**line, "at": base + last}
+                yield path, line
+        base += last
+
+class Replay:
+    def __init__(self, show_diffs: int):
+        from app import runner, workload_trace
+        self.runner, self.workload_trace = runner, workload_trace
+        self.testcases: Dict[str, Any] = {}
+        self.groups: Dict[str, Any] = {}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.recorded: Dict[str, List[float]] = defaultdict(list)
+        self.ratios: List[float] = []
+        self.transitions: Counter = Counter()
+        self.counts: Counter = Counter()
+        self.diffs: List[Dict[str, Any]] = []
+        self.show_diffs = show_diffs
+        self.limits: Dict[str, Any] = {}
+
+    def define(self, line: Dict[str, Any]) -> None:
+        from app import schemas
+        if line["kind"] == "header":
+            self.limits = line.get("limits") or {}
+        elif line["kind"] == "testcase":
+            fields = {key: line.get(key) for key in ("type", "input", "expected", "time_limit", "input_digest", "expected_digest", "generator")}
+            self.testcases[line["key"]] = schemas.TestCase(**{**fields, "type": fields["type"] or "hidden", "input": fields["input"] or "", "expected": fields["expected"] or ""}, points=0)
+        elif line["kind"] == "group":
+            cases = [self.testcases[key] for key in line["testcases"]]
+            self.groups[line["key"]] = schemas.TestCaseGroup(id=0, name=line["key"], points=line["points"], scoring=line["scoring"], testcases=cases)
+
+    def _available(self, testcase) -> bool:
+        from app import payload_store
+        return all(digest is None or payload_store.exists(digest) for digest in (testcase.input_digest, testcase.expected_digest))
+
+    def _compare(self, request: Dict[str, Any], recorded: Dict[str, Any], testcase, result) -> None:
+        replayed = self.workload_trace.verdict(result, self.runner.judge(result, testcase.expected))
+        self.counts["testcases"] += 1
+        if recorded["runtime"] >= 0.001:
+            self.ratios.append(result.runtime / recorded["runtime"])
+        if replayed != recorded["verdict"]:
+            self.transitions[f"{recorded['verdict']}->{replayed}"] += 1
+            if len(self.diffs) < self.show_diffs:
+                self.diffs.append({"endpoint": request["endpoint"], "at": request["at"], "testcase": recorded["testcase"], "recorded": recorded["verdict"],
+                                   "replayed": replayed, "stderr": result.stderr[-300:], "code": request["code"][:400]})
+        elif self.workload_trace.output_digest(result.stdout) != recorded["stdout"]:
+            self.counts["output_changed"] += 1
+
+    async def request(self, request: Dict[str, Any]) -> None:
+        code = request["code"]
+        cases = [(c, self.testcases.get(c["testcase"])) for c in request["cases"]]
+        groups = [(g, self.groups.get(g["group"])) for g in request["groups"]]
+        runnable = [(c, tc) for c, tc in cases if tc is not None and self._available(tc)]
+        runnable_groups = [(g, group) for g, group in groups if group is not None and all(self._available(tc) for tc in group.testcases)]
+        self.counts["skipped_testcases"] += len(cases) - len(runnable) + \
+            sum(len(g["cases"]) for g in request["groups"]) - sum(len(g["cases"]) for g, _ in runnable_groups)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[self.runner.run_testcase(code, tc) for _, tc in runnable],
+                                       *[self.runner.run_group(code, group) for _, group in runnable_groups])
+        self.latencies[request["endpoint"]].append(time.perf_counter() - start)
+        self.recorded[request["endpoint"]].append(request["seconds"])
+        self.counts["requests"] += 1
+        for (recorded, testcase), result in zip(runnable, results):
+            self._compare(request, recorded, testcase, result)
+        for (g, group), group_results in zip(runnable_groups, results[len(runnable):]):
+            for recorded, testcase, result in zip(g["cases"], group.testcases, group_results):
+                self._compare(request, recorded, testcase, result)
+
+    def summary(self, elapsed: float, concurrency: int) -> Dict[str, Any]:
+        from app.constants import SANDBOX_WORKERS, GROUP_CASE_TIME_LIMIT_SECONDS, GROUP_TIME_BUDGET_SECONDS
+        current = {"cpu_seconds": self.runner.CPU_LIMIT_SECONDS, "memory_mb": self.runner.MEMORY_LIMIT_MB,
+                   "group_case_time_limit": GROUP_CASE_TIME_LIMIT_SECONDS,
+                   "group_time_budget": GROUP_TIME_BUDGET_SECONDS, "sandbox_workers": SANDBOX_WORKERS}
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            endpoints[name] = {
+                "count": len(values),
+                **{f"p{q}_ms": round(percentile(values, q / 100) * 1000, 1) for q in (50, 95, 99)},
+                **{f"recorded_p{q}_ms": round(percentile(self.recorded[name], q / 100) * 1000, 1) for q in (50, 95)},
+            }
+        changed = sum(self.transitions.values())
+        return {
+            "elapsed_s": round(elapsed, 2), "concurrency": concurrency,
+            "requests": self.counts["requests"], "testcases": self.counts["testcases"], "skipped_testcases": self.counts["skipped_testcases"],
+            "throughput_rps": round(self.counts["requests"] / elapsed, 2) if elapsed else 0.0,
+            "testcases_per_s": round(self.counts["testcases"] / elapsed, 2) if elapsed else 0.0,
+            "runtime_ratio_p50": round(statistics.median(self.ratios), 3) if self.ratios else None,
+            "verdicts_changed": changed, "verdicts_same": self.counts["testcases"] - changed, "transitions": dict(self.transitions.most_common()),
+            "output_changed": self.counts["output_changed"],
+            "limits": {"recorded": self.limits, "current": current},
+            "endpoints": endpoints, "diffs": self.diffs,
+        }
+
+async def run(args) -> Dict[str, Any]:
+    replay = Replay(args.show_diffs)
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+
+    async def one(request):
+        try:
+            await replay.request(request)
+        finally:
+            slots.release()
+
+    start = time.perf_counter()
+    first = None
+    for _, line in read_traces(args.traces):
+        if line.get("kind") != "request":
+            replay.define(line)
+            continue
+        if args.limit and replay.counts["started"] >= args.limit:
+            break
+        if args.speed > 0:
+            first = line["at"] if first is None else first
+            delay = (line["at"] - first) / args.speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await slots.acquire() # Bounds memory as well as load: the trace is read as requests finish
+        replay.counts["started"] += 1
+        task = asyncio.create_task(one(line))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return replay.summary(time.perf_counter() - start, args.concurrency)
+
+def print_report(summary: Dict[str, Any]) -> None:
+    print(f"{'endpoint':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rec p50':>10}{'rec p95':>10}")
+    for name, e in summary["endpoints"].items():
+        print(f"{name:<16}{e['count']:>8}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}{e['recorded_p50_ms']:>10}{e['recorded_p95_ms']:>10}")
+    print(f"\nelapsed {summary['elapsed_s']} s, {summary['throughput_rps']} req/s, {summary['testcases_per_s']} testcases/s "
+          f"(concurrency {summary['concurrency']}, {summary['skipped_testcases']} testcases skipped for missing payloads)")
+    print(f"median runtime vs recorded: {summary['runtime_ratio_p50']}x")
+    print(f"verdicts: {summary['verdicts_same']} same, {summary['verdicts_changed']} changed {summary['transitions'] or ''}; "
+          f"{summary['output_changed']} outputs changed under the same verdict")
+    if summary["limits"]["recorded"] != summary["limits"]["current"]:
+        print(f"runner limits differ: recorded {summary['limits']['recorded']}, now {summary['limits']['current']}")
+    for diff in summary["diffs"]:
+        print(f"\n{diff['endpoint']} at {diff['at']} s, testcase {diff['testcase']}: {diff['recorded']} -> {diff['replayed']}")
+        if diff["stderr"]:
+            print(f"  stderr: {diff['stderr'].strip().splitlines()[-1]}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("traces", nargs="+", help="trace-*.jsonl.gz files, replayed in the given order")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 4, help="Requests in flight")
+    parser.add_argument("--sandbox-workers", type=int, help="Sandbox pool size (defaults to SANDBOX_WORKERS)")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay at the recorded arrival times divided by this; 0 = as fast as possible")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many requests")
+    parser.add_argument("--show-diffs", type=int, default=10, help="Changed verdicts listed in full")
+    parser.add_argument("--json", help="Also write the report to this path")
+    parser.add_argument("--fail-on-diff", action="store_true", help="Exit 1 if any verdict changed")
+    args = parser.parse_args()
+
+    if args.sandbox_workers:
+        os.environ["SANDBOX_WORKERS"] = str(args.sandbox_workers) # Read when app.runner is imported
+    summary = asyncio.run(run(args))
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.fail_on_diff and summary["verdicts_changed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
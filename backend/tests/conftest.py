@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Run from backend/ with `python -m pytest tests`; makes `app` importable from anywhere.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.database needs a URL at import; tests that touch the database bring their own engine
+os.environ.setdefault("DATABASE_URL", "sqlite://")
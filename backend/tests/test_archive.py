@@ -0,0 +1,70 @@
+import os
+from datetime import date
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+from app import archive, crud, models
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as db:
+        assignment = models.Assignment(name="a", results_released=True)
+        package = models.Package(title="p", prompt="p", difficulty="easy")
+        db.add_all([assignment, package])
+        db.flush()
+        for roll in (1, 2):
+            student = models.Student(roll=roll, username=f"s{roll}", dob=date(2005, 1, 1), hashed_dob="x")
+            db.add(student)
+            db.flush()
+            sa = models.StudentAssignment(student_id=student.id, package_id=package.id, assignment_id=assignment.id)
+            db.add(sa)
+            db.flush()
+            db.add(models.Submission(student_assignment_id=sa.id, code="print(1)", raw_test_score=1, quality_score=1, error_penalty=0,
+                                     final_score=float(roll), test_results=[], quality_comments=[], error_counts={}))
+        db.commit()
+    archive._cache.clear()
+    return engine
+
+def test_archive_moves_rows_to_the_file(engine):
+    with Session(engine) as db:
+        record = archive.archive_assignment(db, 1)
+        assert record.students == 2 and record.submissions == 2
+        assert os.path.exists(record.path)
+        assert not db.exec(select(models.StudentAssignment)).all()
+        assert sorted(s.final_score for s in archive.submissions(db, 1)) == [1.0, 2.0]
+
+def test_losing_concurrent_attempt_keeps_the_winners_file(engine, monkeypatch):
+    row = archive._row
+    raced = []
+
+    def row_then_race(sa):
+        # The second request of a double-click finishes while the first is between its checks and its writes
+        if not raced:
+            raced.append(True)
+            with Session(engine) as other:
+                raced.append(archive.archive_assignment(other, 1).path)
+        return row(sa)
+    monkeypatch.setattr(archive, "_row", row_then_race)
+    with Session(engine) as db:
+        with pytest.raises(ValueError, match="already archived"):
+            archive.archive_assignment(db, 1)
+    winner = raced[1]
+    assert os.listdir(os.path.dirname(winner)) == [os.path.basename(winner)]
+    with Session(engine) as db:
+        assert db.get(models.ArchivedAssignment, 1).path == winner
+        assert len(archive.submissions(db, 1)) == 2
+
+def test_failed_attempt_removes_only_its_own_file(engine, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("database went away")
+    with Session(engine) as db:
+        monkeypatch.setattr(crud, "bump_versions", fail)
+        with pytest.raises(RuntimeError):
+            archive.archive_assignment(db, 1)
+    assert os.listdir(archive.ARCHIVE_DIR) == []
+    with Session(engine) as db:
+        assert db.get(models.ArchivedAssignment, 1) is None
+        assert len(db.exec(select(models.StudentAssignment)).all()) == 2
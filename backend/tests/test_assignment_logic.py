@@ -0,0 +1,93 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+import pytest
+from app.assignment_logic import assign_packages_to_students, _neighbour_offsets
+
+TRIALS = 200
+
+
+def people(count, start=1):
+    return [SimpleNamespace(id=start + i) for i in range(count)]
+
+def random_clusters(rng, package_ids):
+    """Merges some packages into near-duplicate clusters; returns (clusters, number of distinct clusters)."""
+    clusters = {pid: rng.choice(package_ids) if rng.random() < 0.3 else pid for pid in package_ids}
+    return clusters, len(set(clusters.values()))
+
+def cluster_of(clusters, package_id):
+    return clusters.get(package_id, package_id)
+
+def assert_apart(assignments, clusters, distance, d):
+    placed = [cluster_of(clusters, a["package_id"]) for a in assignments]
+    for i in range(len(placed)):
+        for j in range(i + 1, len(placed)):
+            if distance(i, j) <= d:
+                assert placed[i] != placed[j], f"positions {i} and {j} share cluster {placed[i]}"
+
+def test_roll_order_keeps_clusters_apart():
+    rng = random.Random(1)
+    for _ in range(TRIALS):
+        n, d = rng.randint(1, 60), rng.randint(0, 6)
+        package_ids = list(range(100, 100 + rng.randint(1, 15)))
+        clusters, m = random_clusters(rng, package_ids)
+        students = people(n)
+        if m < min(d, n - 1) + 1:
+            with pytest.raises(ValueError):
+                assign_packages_to_students(students, [SimpleNamespace(id=p) for p in package_ids], clusters=clusters, d=d, seed=rng.random())
+            continue
+        result = assign_packages_to_students(students, [SimpleNamespace(id=p) for p in package_ids], clusters=clusters, d=d, seed=rng.random())
+        assert [a["student_id"] for a in result] == [s.id for s in students]
+        assert {a["package_id"] for a in result} <= set(package_ids)
+        assert_apart(result, clusters, lambda i, j: j - i, d)
+        usage = Counter(cluster_of(clusters, a["package_id"]) for a in result)
+        assert max(usage.values()) - min(usage.values()) <= 1 # Round-robin over clusters
+
+@pytest.mark.parametrize("neighbourhood", [4, 8])
+def test_seat_grid_keeps_clusters_apart(neighbourhood):
+    rng = random.Random(neighbourhood)
+    for _ in range(TRIALS):
+        rows, cols, d = rng.randint(1, 8), rng.randint(1, 8), rng.randint(0, 3)
+        n = rng.randint(1, rows * cols)
+        # Every seat has at most len(offsets) placed neighbours, so one more cluster always suffices
+        needed = len(_neighbour_offsets(d, (rows, cols), neighbourhood, cols)) + 1
+        package_ids = list(range(1000, 1000 + needed + rng.randint(0, 10)))
+        clusters = {pid: pid for pid in package_ids}
+        for pid in rng.sample(package_ids, rng.randint(0, len(package_ids) - needed)):
+            clusters[pid] = package_ids[0] # Still at least `needed` distinct clusters
+        result = assign_packages_to_students(people(n), [SimpleNamespace(id=p) for p in package_ids], clusters=clusters, d=d,
+                                             seat_layout=(rows, cols), neighbourhood=neighbourhood, seed=rng.random())
+        assert len(result) == n
+
+        def distance(i, j):
+            (ri, ci), (rj, cj) = divmod(i, cols), divmod(j, cols)
+            return abs(ri - rj) + abs(ci - cj) if neighbourhood == 4 else max(abs(ri - rj), abs(ci - cj))
+        assert_apart(result, clusters, distance, d)
+
+def test_same_seed_gives_same_assignment():
+    rng = random.Random(7)
+    for _ in range(50):
+        n, d = rng.randint(1, 40), rng.randint(0, 3)
+        layout = rng.choice([None, (8, 8)])
+        neighbourhood = rng.choice([4, 8])
+        needed = len(_neighbour_offsets(d, layout, neighbourhood, layout[1] if layout else n)) + 1
+        packages = [SimpleNamespace(id=p) for p in range(1, needed + 1 + rng.randint(0, 8))]
+        seed = rng.randint(0, 10 ** 6)
+        runs = [assign_packages_to_students(people(n), packages, d=d, seat_layout=layout, neighbourhood=neighbourhood, seed=seed) for _ in range(2)]
+        assert runs[0] == runs[1]
+
+def test_too_few_clusters_for_the_distance():
+    packages = [SimpleNamespace(id=p) for p in (1, 2, 3)]
+    with pytest.raises(ValueError, match="At least 4 unique packages"):
+        assign_packages_to_students(people(10), packages, d=3)
+    # Near-duplicates count once: four packages in two clusters cannot cover d = 2
+    packages = [SimpleNamespace(id=p) for p in (1, 2, 3, 4)]
+    with pytest.raises(ValueError, match="got 2"):
+        assign_packages_to_students(people(10), packages, clusters={1: 1, 2: 1, 3: 3, 4: 3}, d=2)
+    # Fewer students than d + 1 only need one cluster per student
+    assert len(assign_packages_to_students(people(2), packages[:2], d=5)) == 2
+
+def test_empty_inputs():
+    with pytest.raises(ValueError):
+        assign_packages_to_students(people(3), [], d=1)
+    assert assign_packages_to_students([], [SimpleNamespace(id=1)], d=1) == []
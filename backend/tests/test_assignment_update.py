@@ -0,0 +1,57 @@
+from datetime import date
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, SQLModel, create_engine, select
+from app import api, crud, models, near_duplicates, package_cache, schemas
+
+# A 3x3 classroom, 4-neighbourhood at distance 1, with the last seat still empty:
+#   A B C
+#   C A D
+#   A B .
+LAYOUT = "ABCCADAB"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(near_duplicates, "clusters_for", lambda db, package_ids: {})
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as db:
+        packages = {name: models.Package(title=name, prompt=name, difficulty="easy") for name in "ABCD"}
+        db.add_all(packages.values())
+        for roll in range(1, len(LAYOUT) + 1):
+            db.add(models.Student(roll=roll, username=f"s{roll}", dob=date(2005, 1, 1), hashed_dob="x"))
+        db.commit()
+        students = db.exec(select(models.Student).order_by(models.Student.roll)).all()
+        rows = [{"student_id": s.id, "package_id": packages[name].id} for s, name in zip(students, LAYOUT)]
+        crud.create_assignment_with_mappings(db, "a", rows, adjacency_distance=1, seat_layout=(3, 3), neighbourhood=4)
+        db.info["packages"] = {p.id: name for name, p in packages.items()}
+        yield db
+    package_cache._local.clear()
+
+def join(db, roll):
+    db.add(models.Student(roll=roll, username=f"s{roll}", dob=date(2005, 1, 1), hashed_dob="x"))
+    db.commit()
+
+def package_of(db, roll):
+    student = crud.get_student_by_roll(db, roll)
+    sa = db.exec(select(models.StudentAssignment).where(models.StudentAssignment.student_id == student.id)).one()
+    return db.info["packages"][sa.package_id]
+
+def test_late_joiner_is_kept_apart_on_the_stored_seat_grid(db):
+    join(db, 9)
+    result = api.update_assignment(1, schemas.AssignmentUpdate(), db=db, current_teacher=None)
+    assert result.placed_rolls == [9]
+    # Seat 8 touches B on its left and D above it; D is the least used, but only C is allowed
+    assert package_of(db, 9) == "C"
+    usage = {db.info["packages"][p]: n for p, n in crud.get_assignment_package_usage(db, 1).items()}
+    assert usage == {"A": 3, "B": 2, "C": 3, "D": 1}
+    assert crud.get_assignment_rules(db, 1).placed_through == crud.get_student_by_roll(db, 9).id
+
+def test_no_seat_left(db):
+    join(db, 9)
+    api.update_assignment(1, schemas.AssignmentUpdate(), db=db, current_teacher=None)
+    join(db, 10)
+    with pytest.raises(HTTPException) as error:
+        api.update_assignment(1, schemas.AssignmentUpdate(), db=db, current_teacher=None)
+    assert error.value.status_code == 400
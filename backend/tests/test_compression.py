@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from fastapi.middleware.gzip import GZipMiddleware
+from app import main
+
+FIRST_EVENT = b"event: testcase\ndata: " + b"x" * 2048 + b"\n\n"
+
+
+def stream_app(media_type: bytes):
+    """Sends one event, then waits for a second that only comes once the test has seen the first."""
+    released = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", media_type)]})
+        await send({"type": "http.response.body", "body": FIRST_EVENT, "more_body": True})
+        await released.wait()
+        await send({"type": "http.response.body", "body": b"event: result\ndata: {}\n\n", "more_body": False})
+    return app, released
+
+async def first_body(app, path: str, headers) -> bytes:
+    """The first non-empty body chunk the client receives, failing if it only arrives after the stream ends."""
+    inner, released = app
+    received = asyncio.Queue()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        await received.put(message)
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers, "query_string": b""}
+    compressors = [middleware for middleware in main.app.user_middleware if middleware.cls is main.CompressionExceptStreams]
+    assert compressors, "the app compresses through CompressionExceptStreams"
+    options = compressors[0].kwargs
+    task = asyncio.ensure_future(main.CompressionExceptStreams(inner, **options)(scope, receive, send))
+    try:
+        while True:
+            message = await asyncio.wait_for(received.get(), timeout=2)
+            if message["type"] == "http.response.body" and message["body"]:
+                return message["body"]
+    finally:
+        released.set()
+        await task
+
+@pytest.mark.parametrize("path, accept", [("/api/run/stream", b"*/*"), ("/api/anything", b"text/event-stream")])
+def test_first_event_is_not_held_back_under_gzip(path, accept):
+    headers = [(b"accept-encoding", b"gzip, deflate, br"), (b"accept", accept)]
+    body = asyncio.run(first_body(stream_app(b"text/event-stream"), path, headers))
+    assert body == FIRST_EVENT
+
+def test_other_responses_are_still_compressed():
+    app, released = stream_app(b"application/json")
+    released.set()
+    headers = [(b"accept-encoding", b"gzip"), (b"accept", b"application/json")]
+    body = asyncio.run(first_body((app, released), "/api/packages", headers))
+    assert body != FIRST_EVENT
+
+def test_gzip_fallback_skips_streams():
+    received = []
+
+    async def send(message):
+        received.append(message)
+    app, released = stream_app(b"text/event-stream")
+    released.set()
+    middleware = main.CompressionExceptStreams(app, compressor=GZipMiddleware, minimum_size=main.COMPRESSION_MIN_SIZE)
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    scope = {"type": "http", "method": "POST", "path": "/api/submit/stream", "headers": [(b"accept-encoding", b"gzip")], "query_string": b""}
+    asyncio.run(middleware(scope, receive, send))
+    start = received[0]
+    assert b"content-encoding" not in dict(start["headers"])
+    assert received[1]["body"] == FIRST_EVENT
@@ -0,0 +1,31 @@
+import pytest
+from app import llm_usage
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    monkeypatch.setattr(llm_usage, "LLM_ASSIGNMENT_TOKEN_BUDGET", 1000)
+    monkeypatch.setattr(llm_usage, "LLM_USAGE_MAX_BUFFER", 2)
+    monkeypatch.setattr(llm_usage, "_buffer", [])
+    monkeypatch.setattr(llm_usage, "_unflushed", llm_usage.defaultdict(int))
+
+def call(tokens=10):
+    llm_usage.record("flash", "generate", "ok", prompt_tokens=tokens, assignment_id=1)
+
+def test_dropped_calls_leave_the_unflushed_total(buffer):
+    for _ in range(3):
+        call()
+    assert len(llm_usage._buffer) == 2
+    assert llm_usage._unflushed["assignment:1"] == 20
+
+def test_calls_dropped_after_a_failed_flush_leave_the_unflushed_total(buffer, monkeypatch):
+    call()
+    call()
+
+    def unreachable(*args, **kwargs):
+        call() # Recorded while the write is in flight
+        raise ConnectionError("database down")
+    monkeypatch.setattr(llm_usage, "Session", unreachable)
+    assert llm_usage.flush() == 0
+    assert len(llm_usage._buffer) == 2
+    assert llm_usage._unflushed["assignment:1"] == 20
@@ -0,0 +1,44 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy.pool import StaticPool
+from app import crud, models, package_cache
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    package_cache._local.clear()
+
+def add_package(db, title):
+    package = models.Package(title=title, prompt="p", difficulty="easy")
+    db.add(package)
+    db.commit()
+    db.refresh(package)
+    db.add(models.TestCase(package_id=package.id, type="hidden", input="1", expected="1", points=100))
+    db.commit()
+    return package.id
+
+def test_edit_in_another_worker_is_seen(db):
+    package_id = add_package(db, "a")
+    assert package_cache.get_package(db, package_id).testcases[0].expected == "1"
+    # Another worker's edit: same commit as the version bump, but no invalidate() in this process
+    testcase = db.get(models.Package, package_id).testcases[0]
+    testcase.expected = "2"
+    db.add(testcase)
+    crud.bump_versions(db, "packages", f"package:{package_id}")
+    db.commit()
+    assert package_cache.get_package(db, package_id).testcases[0].expected == "2"
+
+def test_edit_only_evicts_its_package(db):
+    first, second = add_package(db, "a"), add_package(db, "b")
+    package_cache.warm(db, [first, second])
+    crud.add_testcase(db, first, {"type": "sample", "input": "3", "expected": "3", "points": 0})
+    before = package_cache.stats()
+    assert len(package_cache.get_package(db, first).testcases) == 2
+    package_cache.get_package(db, second)
+    after = package_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from app import reference, runner
+from app.constants import TIME_LIMIT_FLOOR_SECONDS
+
+pytestmark = pytest.mark.skipif(runner.platform.system() == "Windows", reason="CPU time needs per-child rusage")
+
+
+def test_cpu_time_excludes_waiting_and_startup():
+    solution = "import time\ntime.sleep(0.3)\nprint(input())"
+    limits, error = asyncio.run(reference.calibrate(solution, [{"input": "7", "expected": "7"}]))
+    assert error is None
+    assert limits[0]["reference_runtime"] < 0.1 # Slept, not computed; startup is the baseline
+    assert limits[0]["time_limit"] == TIME_LIMIT_FLOOR_SECONDS
+
+def test_cpu_bound_reference_sets_a_higher_limit():
+    solution = "n = int(input())\nprint(sum(i * i for i in range(n)))"
+    n = 3_000_000
+    limits, error = asyncio.run(reference.calibrate(solution, [{"input": str(n), "expected": str(sum(i * i for i in range(n)))}]))
+    assert error is None
+    assert limits[0]["reference_runtime"] > 0.05
+
+def test_wrong_reference_is_rejected():
+    limits, error = asyncio.run(reference.calibrate("print(1)", [{"input": "", "expected": "2"}]))
+    assert limits is None and "printed '1'" in error
+
+def test_runs_report_cpu_time():
+    results = runner.run_cpu_timed("print(input())", "x", 3, 5.0)
+    assert len(results) == 3 and all(r.stdout == "x" and r.cpu_time is not None for r in results)
+    timed_out = runner.run_cpu_timed("while True: pass", "", 1, 0.3)[0]
+    assert timed_out.timed_out and "timed out" in timed_out.stderr
+
+def test_limit_is_on_cpu_time():
+    # Calibrated on CPU time, so a program that waits longer than its limit has not used it up
+    waited = runner.run_python_code("import time\ntime.sleep(0.8)\nprint(1)", "", 0.5)
+    assert not waited.timed_out and waited.stdout == "1" and waited.cpu_time < 0.5 < waited.runtime
+    blocked = runner.run_python_code("import time\ntime.sleep(60)", "", 0.2)
+    assert blocked.timed_out and "wall-clock" in blocked.stderr and blocked.runtime < 5
+
+def test_groups_are_calibrated_on_cpu_time():
+    package = {"solution": "import time\ntime.sleep(0.3)\nprint(input())", "groups": [{"name": "g", "testcases": [{"input": "1"}]}]}
+    assert asyncio.run(reference.prepare_groups(package)) is None
+    case = package["groups"][0]["testcases"][0]
+    assert case["expected"] == "1" and case["reference_runtime"] < 0.1
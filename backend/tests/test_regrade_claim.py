@@ -0,0 +1,94 @@
+from datetime import date, datetime, timedelta
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+from app import models, regrade
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(regrade, "engine", engine)
+    with Session(engine) as db:
+        assignment = models.Assignment(name="a", results_released=False)
+        package = models.Package(title="p", prompt="p", difficulty="easy")
+        student = models.Student(roll=1, username="s1", dob=date(2005, 1, 1), hashed_dob="x")
+        db.add_all([assignment, package, student])
+        db.flush()
+        sa = models.StudentAssignment(student_id=student.id, package_id=package.id, assignment_id=assignment.id)
+        db.add(sa)
+        db.flush()
+        db.add(models.Submission(student_assignment_id=sa.id, code="print(1)", raw_test_score=0, quality_score=0, error_penalty=0,
+                                 final_score=0, test_results=[], quality_comments=[], error_counts={}))
+        db.commit()
+    return engine
+
+def as_worker(monkeypatch, name):
+    monkeypatch.setattr(regrade, "_OWNER", name)
+
+def test_one_running_job_per_assignment(engine, monkeypatch):
+    with Session(engine) as db:
+        first = regrade.create_job(db, 1).id
+    # A concurrent POST that checked before the first job was committed
+    real_running, calls = regrade._running, []
+
+    def stale_then_real(db, assignment_id):
+        calls.append(assignment_id)
+        return None if len(calls) == 1 else real_running(db, assignment_id)
+    monkeypatch.setattr(regrade, "_running", stale_then_real)
+    with Session(engine) as db:
+        second = regrade.create_job(db, 1)
+        assert second.id == first
+        assert len(db.exec(select(models.RegradeJob)).all()) == 1
+
+def test_only_one_worker_holds_a_job(engine, monkeypatch):
+    with Session(engine) as db:
+        job_id = regrade.create_job(db, 1).id
+        as_worker(monkeypatch, "worker-a")
+        assert regrade._claim(db, job_id)
+        as_worker(monkeypatch, "worker-b")
+        assert not regrade._claim(db, job_id)
+        claim = db.exec(select(models.RegradeClaim)).one()
+        claim.lease_until = datetime.utcnow() - timedelta(seconds=1) # worker-a died
+        db.add(claim); db.commit()
+        assert regrade._claim(db, job_id)
+
+def test_job_held_elsewhere_is_not_run_twice(engine, monkeypatch):
+    with Session(engine) as db:
+        job_id = regrade.create_job(db, 1).id
+        as_worker(monkeypatch, "worker-a")
+        assert regrade._claim(db, job_id)
+    as_worker(monkeypatch, "worker-b")
+    regrade._run_job(job_id)
+    with Session(engine) as db:
+        job = db.get(models.RegradeJob, job_id)
+        assert (job.status, job.done) == ("running", 0)
+
+def test_finished_job_releases_the_assignment(engine, monkeypatch):
+    monkeypatch.setattr(regrade, "_regrade_submission", lambda *args: True)
+    with Session(engine) as db:
+        job_id = regrade.create_job(db, 1).id
+    regrade._run_job(job_id)
+    with Session(engine) as db:
+        job = db.get(models.RegradeJob, job_id)
+        assert (job.status, job.done, job.changed) == ("completed", 1, 1)
+        assert db.exec(select(models.RegradeClaim)).first() is None
+        assert regrade.create_job(db, 1).id != job_id
+
+def test_worker_that_lost_its_lease_stops(engine, monkeypatch):
+    def taken_over(db, *args):
+        # Another worker claimed the job while this one was stalled on the submission
+        with Session(engine) as other:
+            claim = other.exec(select(models.RegradeClaim)).one()
+            claim.owner = "worker-b"
+            other.add(claim); other.commit()
+        return True
+    monkeypatch.setattr(regrade, "_regrade_submission", taken_over)
+    with Session(engine) as db:
+        job_id = regrade.create_job(db, 1).id
+    as_worker(monkeypatch, "worker-a")
+    regrade._run_job(job_id)
+    with Session(engine) as db:
+        job = db.get(models.RegradeJob, job_id)
+        assert (job.status, job.done) == ("running", 0)
+        assert db.exec(select(models.RegradeClaim)).one().owner == "worker-b"
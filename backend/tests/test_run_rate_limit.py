@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app import api, constants, schemas
+
+
+@pytest.fixture
+def slow_run(monkeypatch):
+    """/run with a one-token bucket whose work takes long enough for a second click to coalesce."""
+    monkeypatch.setattr(constants, "RUN_BURST", 1)
+    monkeypatch.setattr(constants, "RUN_RATE_PER_MINUTE", 0.001)
+    monkeypatch.setattr(api, "_load_package", lambda *args: (None, None))
+
+    async def events(code, package, endpoint):
+        await asyncio.sleep(0.1)
+        yield "result", schemas.RunCodeResponse(overall_output=code, results=[])
+    monkeypatch.setattr(api, "_run_events", events)
+
+def request(roll, code):
+    return schemas.RunCodeRequest(roll=roll, assignment_id=1, code=code)
+
+def test_coalesced_double_click_costs_one_token(slow_run):
+    async def clicks():
+        return await asyncio.gather(api.run_code(request(9001, "print(1)"), db=None), api.run_code(request(9001, "print(1)"), db=None))
+    first, second = asyncio.run(clicks())
+    assert first.overall_output == second.overall_output == "print(1)"
+
+def test_distinct_runs_are_each_charged(slow_run):
+    async def clicks():
+        return await asyncio.gather(api.run_code(request(9002, "print(1)"), db=None), api.run_code(request(9002, "print(2)"), db=None),
+                                    return_exceptions=True)
+    results = asyncio.run(clicks())
+    assert sum(isinstance(r, HTTPException) and r.status_code == 429 for r in results) == 1
+
+async def streamed(roll, code):
+    response = await api.run_code_stream(request(roll, code), db=None)
+    return "".join([chunk async for chunk in response.body_iterator])
+
+def test_coalesced_stream_double_click_costs_one_token(slow_run):
+    async def clicks():
+        return await asyncio.gather(streamed(9003, "print(1)"), streamed(9003, "print(1)"))
+    first, second = asyncio.run(clicks())
+    assert first == second
+    assert "event: result" in first and "event: error" not in first
+
+def test_stream_and_plain_run_share_one_execution(slow_run):
+    async def clicks():
+        return await asyncio.gather(streamed(9004, "print(1)"), api.run_code(request(9004, "print(1)"), db=None))
+    body, response = asyncio.run(clicks())
+    assert "event: error" not in body and response.overall_output == "print(1)"
+
+def test_distinct_streams_are_each_charged(slow_run):
+    async def clicks():
+        return await asyncio.gather(streamed(9005, "print(1)"), streamed(9005, "print(2)"))
+    bodies = asyncio.run(clicks())
+    assert sum('"status": 429' in body for body in bodies) == 1
+
+def test_late_joiner_gets_every_event(monkeypatch):
+    monkeypatch.setattr(api, "_load_package", lambda *args: (None, None))
+
+    async def events(code, package, endpoint):
+        yield "testcase", schemas.RunCodeResult(index=0, stdout="a", stderr="", runtime=0, timed_out=False, passed=True, testcase_type="sample")
+        await asyncio.sleep(0.1)
+        yield "result", schemas.RunCodeResponse(overall_output="a", results=[])
+    monkeypatch.setattr(api, "_run_events", events)
+
+    async def clicks():
+        first = asyncio.ensure_future(streamed(9006, "print('a')"))
+        await asyncio.sleep(0.05) # The first event is out already
+        return await asyncio.gather(first, streamed(9006, "print('a')"))
+    first, second = asyncio.run(clicks())
+    assert first == second and first.index("event: testcase") < first.index("event: result")
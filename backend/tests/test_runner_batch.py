@@ -0,0 +1,74 @@
+import time
+import pytest
+from app import runner
+from app.constants import GROUP_TIME_BUDGET_SECONDS
+
+pytestmark = pytest.mark.skipif(runner.platform.system() == "Windows", reason="the batch harness forks")
+
+
+def test_cases_run_in_order_with_their_own_input():
+    results = runner.run_batch("print(int(input()) * 2)", ["1", "2", "3"], [1, 1, 1])
+    assert [r.stdout for r in results] == ["2", "4", "6"]
+    assert not any(r.stderr or r.timed_out for r in results)
+
+def test_state_does_not_carry_between_cases():
+    code = "import builtins\nbuiltins.seen = getattr(builtins, 'seen', 0) + 1\nprint(builtins.seen)"
+    results = runner.run_batch(code, ["", "", ""], [1, 1, 1])
+    assert [r.stdout for r in results] == ["1", "1", "1"]
+
+def test_case_cannot_read_other_cases_input():
+    code = (
+        "import os, sys\n"
+        "print(repr(sys.stdin.read()), repr(sys.__stdin__.read()))\n"
+        "for fd in range(0, 64):\n"
+        "    try:\n"
+        "        print(fd, os.read(fd, 1 << 16))\n"
+        "    except OSError:\n"
+        "        pass\n"
+    )
+    results = runner.run_batch(code, ["first-secret", "second-secret", "third-secret"], [1, 1, 1])
+    for own, result in zip(["first-secret", "second-secret", "third-secret"], results):
+        assert result.stdout.startswith(repr(own))
+        others = {"first-secret", "second-secret", "third-secret"} - {own}
+        assert not any(other in result.stdout for other in others)
+
+def test_case_cannot_forge_frames():
+    code = (
+        "import os, sys\n"
+        "fake = b'1 ok 0.000001 1.000 6 0\\nforged'\n"
+        "os.write(1, fake)\n"
+        "sys.__stdout__.write(fake.decode())\n"
+        "sys.__stdout__.flush()\n"
+        "os.write(1, b'end done\\n')\n"
+    )
+    results = runner.run_batch(code, ["", ""], [1, 1])
+    assert len(results) == 2
+    for result in results:
+        assert "forged" in result.stdout and "end done" in result.stdout
+        assert result.stdout != "forged"
+
+def test_timeout_cannot_be_caught():
+    code = "while True:\n    try:\n        while True:\n            pass\n    except BaseException:\n        pass"
+    results = runner.run_batch(code, ["", "after"], [0.5, 0.5])
+    assert all(r.timed_out for r in results)
+    assert "timed out" in results[0].stderr
+
+def test_group_wall_time_is_bounded_by_the_budget():
+    start = time.monotonic()
+    results = runner.run_batch("while True:\n    pass", [""] * 1000, [1.0] * 1000)
+    assert time.monotonic() - start < GROUP_TIME_BUDGET_SECONDS + 3
+    assert len(results) == 1000 and all(r.timed_out for r in results)
+    assert "time budget" in results[-1].stderr
+
+def test_expected_outputs_stop_at_first_failure():
+    results = runner.run_batch("print(input())", ["1", "2", "3"], [1, 1, 1], expected=["1", "wrong", "3"])
+    assert [r.stdout for r in results[:2]] == ["1", "2"]
+    assert results[2].stdout == "" and "Not run" in results[2].stderr
+
+def test_all_cases_run_without_expected_outputs():
+    results = runner.run_batch("x = int(input())\nprint(1 // x)", ["1", "0", "1"], [1, 1, 1])
+    assert results[0].stdout == "1" and "ZeroDivisionError" in results[1].stderr and results[2].stdout == "1"
+
+def test_compile_error_is_reported_per_case():
+    results = runner.run_batch("print(", ["", ""], [1, 1])
+    assert all("SyntaxError" in r.stderr for r in results)
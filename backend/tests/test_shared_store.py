@@ -0,0 +1,24 @@
+import pytest
+from app import shared_store
+
+redis = pytest.importorskip("redis")
+
+DOWN = "redis://127.0.0.1:1/0" # Nothing listens on port 1
+
+
+def test_unreachable_redis_falls_back_at_startup(monkeypatch):
+    monkeypatch.setattr(shared_store, "SHARED_STORE_URL", DOWN)
+    monkeypatch.setattr(shared_store, "_store", None)
+    assert isinstance(shared_store.get_store(), shared_store.LocalStore)
+
+def test_redis_going_away_degrades_to_local(monkeypatch):
+    monkeypatch.setattr(redis.Redis, "ping", lambda self: True) # Up at startup, gone afterwards
+    store = shared_store.RedisStore(DOWN)
+    assert store.get("k") is None
+    store.set("k", "v", ttl=60)
+    assert store.get("k") == "v"
+    assert store.set_if_absent("flight", "1", ttl=60) is True
+    assert store.set_if_absent("flight", "1", ttl=60) is False
+    assert store.incr("n") == 1
+    assert store.take_token("bucket", rate=1.0, burst=1) == 0.0
+    assert store.take_token("bucket", rate=1.0, burst=1) > 0
@@ -0,0 +1,41 @@
+import asyncio
+import time
+from app import schemas, shared_store, single_flight
+
+
+class SlowStore:
+    """A shared store whose every call takes a network round trip's worth of time."""
+    def __init__(self):
+        self.local = shared_store.LocalStore()
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            time.sleep(0.05)
+            return getattr(self.local, name)(*args, **kwargs)
+        return call
+
+def test_waiting_on_another_worker_keeps_the_event_loop_free(monkeypatch):
+    store = SlowStore()
+    monkeypatch.setattr(shared_store, "_store", store)
+    store.local.set("flight:k:lock", "1", ttl=60) # Another worker is running it
+
+    async def other_worker_finishes():
+        await asyncio.sleep(0.4)
+        store.local.set("flight:k:result", schemas.RunCodeResponse(overall_output="done", results=[]).model_dump_json(), ttl=60)
+        store.local.delete("flight:k:lock")
+
+    async def ticks():
+        count, deadline = 0, time.monotonic() + 0.3
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+            count += 1
+        return count
+
+    async def factory():
+        raise AssertionError("The other worker's result should be used")
+
+    async def main():
+        return await asyncio.gather(single_flight.run("k", factory, schemas.RunCodeResponse, ttl=60, label="run"), ticks(), other_worker_finishes())
+    result, count, _ = asyncio.run(main())
+    assert result.overall_output == "done"
+    assert count > 20 # Blocking store calls would leave the ticker a handful of turns
@@ -0,0 +1,19 @@
+import asyncio
+from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy.pool import StaticPool
+from app import api, search_index
+
+
+def package(title):
+    return {"title": title, "prompt": f"Solve {title}.", "difficulty": "easy",
+            "testcases": [{"type": "sample" if i < 2 else "hidden", "input": str(i), "expected": str(i), "points": 20} for i in range(5)]}
+
+def test_every_stored_package_comes_back_loaded():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    search_index.ensure_index(engine)
+    with Session(engine) as db:
+        created = asyncio.run(api._store_generated([package("Alpha sums"), package("Beta strings"), package("Gamma graphs")], db, "test"))
+        response = [p.model_dump() for p in created] # What the endpoint serializes
+    assert [p["title"] for p in response] == ["Alpha sums", "Beta strings", "Gamma graphs"]
+    assert all(p["id"] for p in response)
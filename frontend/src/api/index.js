@@ -45,20 +45,76 @@ export const generateQuestionsFromFile = (file, n_questions, difficulty) => {
     },
   });
 };
-export const getPackages = () => apiClient.get('/teacher/packages');
+// `fields` is an optional comma-separated column list, e.g. 'id,title,difficulty'
+export const getPackages = (fields) => apiClient.get('/teacher/packages', { params: fields ? { fields } : {} });
+export const searchPackages = (q, { difficulty, after, limit } = {}) => apiClient.get('/teacher/packages/search', { params: { q, difficulty, after, limit } });
+export const createPackage = (pkg) => apiClient.post('/teacher/packages', pkg); // { title, prompt, difficulty, testcases, groups, solution }
+// The whole question bank as a gzipped NDJSON Blob; `payloads: false` leaves out file-backed testcase data
+export const exportQuestionBank = (payloads = true) => apiClient.get('/teacher/packages/export', { params: { payloads }, responseType: 'blob' });
+export const importQuestionBank = (file) => {
+  const formData = new FormData();
+  formData.append('file', file);
+  return apiClient.post('/teacher/packages/import', formData, { headers: { 'Content-Type': 'multipart/form-data' } });
+};
 export const getAssignments = () => apiClient.get('/teacher/assignments');
 export const createAssignment = (assignment_name, package_ids) => apiClient.post('/teacher/create_assignment', { assignment_name, package_ids });
 export const getResults = (assignmentId) => apiClient.get(`/teacher/results/${assignmentId}`);
+export const getSubmission = (submissionId) => apiClient.get(`/teacher/submission/${submissionId}`);
+export const getSubmissionProfile = (submissionId) => apiClient.get(`/teacher/submission/${submissionId}/profile`);
+export const getSimilarityReport = (assignmentId, limit = 50) => apiClient.get(`/teacher/similarity/${assignmentId}`, { params: { limit } });
+export const startRegrade = (assignmentId) => apiClient.post(`/teacher/assignments/${assignmentId}/regrade`);
+export const getRegradeStatus = (jobId) => apiClient.get(`/teacher/regrade/${jobId}`);
+export const getScoringWeights = (assignmentId) => apiClient.get(`/teacher/assignments/${assignmentId}/scoring`);
+export const simulateScoring = (assignmentId, grid) => apiClient.post(`/teacher/assignments/${assignmentId}/scoring/simulate`, grid);
+export const commitScoringWeights = (assignmentId, weights) => apiClient.put(`/teacher/assignments/${assignmentId}/scoring`, weights);
 export const getTeacherCodes = () => apiClient.get('/teacher/codes');
 export const releaseResults = (assignmentId) => apiClient.post(`/teacher/assignments/${assignmentId}/release`);
+export const archiveAssignment = (assignmentId) => apiClient.post(`/teacher/assignments/${assignmentId}/archive`);
 
 
 // --- Student APIs ---
 export const loginStudent = (roll, dob) => apiClient.post('/student/login', { roll, dob });
 export const getStudentAssignments = () => apiClient.get('/student/assignments');
 export const getStudentAssignment = (assignmentId, roll) => apiClient.get(`/student/assignment/${assignmentId}/${roll}`);
+export const getStudentProfile = (assignmentId, roll) => apiClient.get(`/student/assignment/${assignmentId}/${roll}/profile`);
 export const runCode = (roll, assignment_id, code) => apiClient.post('/run', { roll, assignment_id, code });
 export const submitSolution = (roll, assignment_id, code) => apiClient.post('/submit', { roll, assignment_id, code });
+
+// Server-sent events over POST (EventSource only does GET). Calls onEvent(name, data) for
+// each event and resolves with the data of the final `result` event. Failures reject with an
+// axios-shaped error, so callers can keep reading `error.response?.data?.detail`.
+const streamEvents = async (path, body, onEvent) => {
+  const token = localStorage.getItem('authToken') || localStorage.getItem('studentAuthToken');
+  const response = await fetch(`/api${path}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream', ...(token ? { Authorization: `Bearer ${token}` } : {}) },
+    body: JSON.stringify(body),
+  });
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    throw { response: { status: response.status, data } };
+  }
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '', result = null;
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    let end;
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      const name = block.match(/^event: (.*)$/m)?.[1] || 'message';
+      const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] || 'null');
+      if (name === 'error') throw { response: { status: data.status, data } };
+      if (name === 'result') result = data;
+      onEvent(name, data);
+    }
+  }
+  return result;
+};
+export const runCodeStream = (roll, assignment_id, code, onEvent) => streamEvents('/run/stream', { roll, assignment_id, code }, onEvent);
+export const submitSolutionStream = (roll, assignment_id, code, onEvent) => streamEvents('/submit/stream', { roll, assignment_id, code }, onEvent);
 export const changeStudentDob = (roll, new_dob, code) => apiClient.post('/student/change_dob', { roll, new_dob, code });
 export const getStudentResult = (assignmentId, roll) => apiClient.get(`/teacher/results/${assignmentId}`).then(response => {
     const results = response.data;
@@ -0,0 +1,52 @@
+// Hot-spot profile of a submission on its heaviest hidden testcase.
+const formatBytes = (bytes) => {
+    if (bytes == null) return '-';
+    if (bytes < 1024) return `${bytes} B`;
+    if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+    return `${(bytes / 1024 / 1024).toFixed(1)} MB`;
+};
+
+const Table = ({ title, headers, rows }) => rows.length > 0 && (
+    <div>
+        <p className="text-xs font-medium text-gray-500 dark:text-gray-400 mt-2">{title}</p>
+        <table className="mt-1 w-full text-xs font-mono">
+            <thead>
+                <tr>{headers.map(h => <th key={h} className="text-left pr-2 text-gray-500 dark:text-gray-400">{h}</th>)}</tr>
+            </thead>
+            <tbody>
+                {rows.map((cells, i) => (
+                    <tr key={i}>{cells.map((c, j) => <td key={j} className="pr-2 text-gray-700 dark:text-gray-300 truncate max-w-[16rem]">{c}</td>)}</tr>
+                ))}
+            </tbody>
+        </table>
+    </div>
+);
+
+export default function ProfileReport({ profile }) {
+    if (!profile) return null;
+    return (
+        <div>
+            <h4 className="font-medium text-gray-800 dark:text-gray-200">Performance Profile:</h4>
+            <p className="text-sm text-gray-600 dark:text-gray-400 mt-2">
+                {profile.runtime != null && <>Ran for {profile.runtime.toFixed(3)} s under the profiler{profile.timed_out && ' (stopped at the time limit)'}. </>}
+                Peak memory: {formatBytes(profile.peak_bytes)}.
+            </p>
+            {profile.error && <p className="text-sm text-red-500 mt-1">{profile.error}</p>}
+            <Table
+                title="Functions by own time"
+                headers={['Function', 'Line', 'Calls', 'Own s', 'Total s']}
+                rows={profile.functions.map(f => [f.file === 'main.py' ? f.function : `${f.function} (${f.file})`, f.line || '', f.calls, f.self_seconds.toFixed(4), f.total_seconds.toFixed(4)])}
+            />
+            <Table
+                title="Hot lines"
+                headers={['Line', 'Share', 'Code']}
+                rows={profile.lines.map(l => [l.line, `${Math.round(l.share * 100)}%`, l.source])}
+            />
+            <Table
+                title="Memory held at exit, by line"
+                headers={['Line', 'Size', 'Blocks', 'Code']}
+                rows={profile.allocations.map(a => [a.line, formatBytes(a.bytes), a.count, a.source])}
+            />
+        </div>
+    );
+}
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { getStudentAssignment, submitSolution, runCode } from '../api';
+import { getStudentAssignment, submitSolutionStream, runCodeStream } from '../api';
 import toast from 'react-hot-toast';
 import Editor from '@monaco-editor/react';
 import ReactMarkdown from 'react-markdown';
@@ -25,6 +25,13 @@ const TestCaseResult = ({ result, testCase, index, isSubmit = false }) => {
 };
 // --- End of TestCaseResult Component ---
 
+const GroupResult = ({ result }) => (
+    <div className={`p-3 rounded-md font-mono text-sm ${result.passed ? 'bg-green-500/10 text-green-400' : 'bg-red-500/10 text-red-400'}`}>
+        <p className="font-semibold">Group "{result.name}": {result.passed_cases}/{result.cases} cases passed ({Number(result.earned).toFixed(1)}/{result.points} pts)</p>
+        {!result.passed && result.stderr && <pre className="p-2 mt-2 bg-gray-900/50 rounded text-xs"><code>{result.stderr}</code></pre>}
+    </div>
+);
+
 
 export default function StudentAssignmentPage() {
     const { assignment_id } = useParams();
@@ -73,8 +80,15 @@ export default function StudentAssignmentPage() {
         setSubmitResult(null);
         try {
             toast.loading("Running against sample cases...");
-            const response = await runCode(studentRoll, assignment_id, code);
-            setRunResult(response.data);
+            // Results arrive as each case finishes, in any order; slice() keeps the gaps
+            await runCodeStream(studentRoll, assignment_id, code, (event, data) => {
+                if (event === 'testcase') setRunResult(prev => {
+                    const results = (prev?.results || []).slice();
+                    results[data.index] = data;
+                    return { overall_output: '', results };
+                });
+                if (event === 'result') setRunResult(data);
+            });
             toast.dismiss();
             toast.success("Run complete!");
         } catch (error) {
@@ -90,8 +104,26 @@ export default function StudentAssignmentPage() {
         setRunResult(null);
         setSubmitResult(null);
         try {
-            const response = await submitSolution(studentRoll, assignment_id, code);
-            setSubmitResult(response.data);
+            const pending = { test_results: [], group_results: [], raw_test_score: null, quality_score: null, final_score: null };
+            await submitSolutionStream(studentRoll, assignment_id, code, (event, data) => {
+                setSubmitResult(prev => {
+                    const current = prev || pending;
+                    if (event === 'testcase') {
+                        const test_results = current.test_results.slice();
+                        test_results[data.index] = data;
+                        return { ...current, test_results };
+                    }
+                    if (event === 'group') {
+                        const group_results = current.group_results.slice();
+                        group_results[data.index] = data;
+                        return { ...current, group_results };
+                    }
+                    if (event === 'score') return { ...current, raw_test_score: data.raw_test_score };
+                    if (event === 'quality') return { ...current, quality_score: data.score };
+                    if (event === 'result') return data;
+                    return current;
+                });
+            });
             setHasSubmitted(true); // Mark as submitted
             toast.success('Submission successful! You can resubmit until results are released.');
         } catch (error) {
@@ -174,21 +206,22 @@ export default function StudentAssignmentPage() {
                              <div className="mt-4 grid grid-cols-3 gap-4 text-center">
                                 <div>
                                     <p className="text-sm text-gray-500 dark:text-gray-400">Final Score</p>
-                                    <p className={`text-3xl font-bold ${submitResult.final_score > 60 ? 'text-green-600' : 'text-red-600'}`}>{submitResult.final_score.toFixed(2)}</p>
+                                    <p className={`text-3xl font-bold ${submitResult.final_score > 60 ? 'text-green-600' : 'text-red-600'}`}>{submitResult.final_score?.toFixed(2) ?? '…'}</p>
                                 </div>
                                 <div>
                                     <p className="text-sm text-gray-500 dark:text-gray-400">Test Score</p>
-                                    <p className="text-3xl font-bold text-gray-800 dark:text-gray-200">{submitResult.raw_test_score.toFixed(2)}</p>
+                                    <p className="text-3xl font-bold text-gray-800 dark:text-gray-200">{submitResult.raw_test_score?.toFixed(2) ?? '…'}</p>
                                 </div>
                                 <div>
                                     <p className="text-sm text-gray-500 dark:text-gray-400">Quality Score</p>
-                                    <p className="text-3xl font-bold text-gray-800 dark:text-gray-200">{submitResult.quality_score}</p>
+                                    <p className="text-3xl font-bold text-gray-800 dark:text-gray-200">{submitResult.quality_score ?? '…'}</p>
                                 </div>
                              </div>
                             <div className="mt-6">
                                 <h3 className="text-sm font-semibold text-gray-900 dark:text-gray-100">Test Cases:</h3>
                                 <div className="mt-2 space-y-2">
-                                   {submitResult.test_results.map((res, i) => {
+                                   {submitResult.test_results.concat(submitResult.group_results || []).map((res, i) => {
+                                        if (res.group_id != null) return <GroupResult key={`group-${res.group_id}`} result={res} />;
                                         const originalTestCase = (assignmentData.sample_testcases.find(tc => tc.id === res.testcase_id)) || { type: res.type, input: 'Hidden', expected: 'Hidden', id: res.testcase_id };
                                         return <TestCaseResult key={i} result={res} testCase={originalTestCase} index={i} isSubmit={true} />
                                    })}
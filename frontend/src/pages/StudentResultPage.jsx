@@ -1,6 +1,7 @@
 import { useEffect, useState } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { getStudentResult } from '../api';
+import { getStudentResult, getStudentProfile } from '../api';
+import ProfileReport from '../components/ProfileReport';
 import toast from 'react-hot-toast';
 import { Bar } from 'react-chartjs-2';
 import { Chart as ChartJS, CategoryScale, LinearScale, BarElement, Title, Tooltip, Legend } from 'chart.js';
@@ -22,6 +23,7 @@ export default function StudentResultPage() {
     const { assignment_id } = useParams();
     const studentRoll = getRollFromToken();
     const [submission, setSubmission] = useState(null);
+    const [profile, setProfile] = useState(null);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
@@ -42,6 +44,7 @@ export default function StudentResultPage() {
             }
         };
         fetchResult();
+        getStudentProfile(assignment_id, studentRoll).then(r => setProfile(r.data)).catch(() => setProfile(null));
     }, [assignment_id, studentRoll]);
 
     if (loading) {
@@ -126,6 +129,7 @@ export default function StudentResultPage() {
                             <h4 className="font-medium text-gray-800 dark:text-gray-200">Score Graph:</h4>
                             <Bar options={chartOptions} data={chartData} />
                         </div>
+                        <ProfileReport profile={profile} />
                     </div>
                 </div>
             </div>
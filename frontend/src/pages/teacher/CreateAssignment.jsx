@@ -11,7 +11,7 @@ export default function CreateAssignment() {
     useEffect(() => {
         const fetchPackages = async () => {
             try {
-                const response = await getPackages();
+                const response = await getPackages('id,title,difficulty');
                 console.log("Data from getPackages API:", response.data);
                 setPackages(response.data);
             } catch (error) {
@@ -1,8 +1,9 @@
 import { useEffect, useState } from 'react';
-import { getAssignments, getResults, releaseResults } from '../../api';
+import { getAssignments, getResults, getSubmission, getSubmissionProfile, releaseResults } from '../../api';
 import toast from 'react-hot-toast';
 import { Bar } from 'react-chartjs-2';
 import { Chart as ChartJS, CategoryScale, LinearScale, BarElement, Title, Tooltip, Legend } from 'chart.js';
+import ProfileReport from '../../components/ProfileReport';
 
 ChartJS.register(CategoryScale, LinearScale, BarElement, Title, Tooltip, Legend);
 
@@ -82,9 +83,14 @@ const SubmissionModal = ({ submission, onClose }) => {
                                 <h4 className="font-medium text-gray-800 dark:text-gray-200">Test Case Breakdown ({passedTests}/{totalTests} Passed):</h4>
                                 <div className="mt-2 space-y-2 text-sm">
                                     {submission.test_results.map((res, i) => (
-                                        <p key={i} className={res.passed ? 'text-green-500' : 'text-red-500'}>
-                                            Test Case {i + 1} ({res.type}): {res.passed ? 'Passed' : 'Failed'}
-                                        </p>
+                                        <div key={i}>
+                                            <p className={res.passed ? 'text-green-500' : 'text-red-500'}>
+                                                Test Case {i + 1} ({res.type}): {res.passed ? 'Passed' : 'Failed'}
+                                            </p>
+                                            {!res.passed && (res.stderr || res.stdout) && (
+                                                <pre className="mt-1 p-2 bg-gray-900 text-gray-300 rounded text-xs overflow-x-auto"><code>{res.stderr || res.stdout}</code></pre>
+                                            )}
+                                        </div>
                                     ))}
                                 </div>
                             </div>
@@ -102,6 +108,7 @@ const SubmissionModal = ({ submission, onClose }) => {
                                 <h4 className="font-medium text-gray-800 dark:text-gray-200">Score Graph:</h4>
                                 <Bar options={chartOptions} data={chartData} />
                             </div>
+                            <ProfileReport profile={submission.profile} />
                         </div>
                     </div>
                 </div>
@@ -163,6 +170,20 @@ export default function ViewResults() {
         }
     }, [selectedAssignment]);
 
+    // The results list only carries output previews; fetch the full submission on open.
+    const handleOpenSubmission = async (res) => {
+        try {
+            // Profiling is optional and runs after grading, so a missing profile is not an error
+            const [response, profile] = await Promise.all([
+                getSubmission(res.id),
+                getSubmissionProfile(res.id).then(r => r.data).catch(() => null),
+            ]);
+            setSelectedSubmission({ ...response.data, profile });
+        } catch (error) {
+            toast.error(error.response?.data?.detail || 'Failed to load submission.');
+        }
+    };
+
     // --- NEW FUNCTION ---
     const handleReleaseResults = async () => {
         if (!currentAssignment) return;
@@ -245,7 +266,7 @@ export default function ViewResults() {
                                             <td className="whitespace-nowrap px-3 py-4 text-sm text-gray-500 dark:text-gray-400">{res.raw_test_score.toFixed(2)}</td>
                                             <td className="whitespace-nowrap px-3 py-4 text-sm text-gray-500 dark:text-gray-400">{res.quality_score}</td>
                                             <td className="relative whitespace-nowrap py-4 pl-3 pr-4 text-right text-sm font-medium sm:pr-0">
-                                                <button onClick={() => setSelectedSubmission(res)} className="text-accent hover:text-accent-hover">Details</button>
+                                                <button onClick={() => handleOpenSubmission(res)} className="text-accent hover:text-accent-hover">Details</button>
                                             </td>
                                         </tr>
                                     ))}